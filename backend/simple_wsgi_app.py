@@ -1,6 +1,6 @@
 """
 Ultra-simple WSGI application for Flight Compensation API (repository copy)
-- Uses only Python standard libraries; no Flask dependency
+- Uses only Python standard libraries (orjson speeds up responses if installed); no Flask dependency
 - Provides canonical route /eligible_flights (legacy alias removed)
 - Normalizes records to the shape expected by the Flutter app (AviationStackService)
 
@@ -20,6 +20,11 @@ import logging
 from datetime import datetime, timedelta
 import urllib.parse
 
+try:
+    import orjson
+except ImportError:  # standard library only
+    orjson = None
+
 # -----------------------------------------------------------------------------
 # Logging
 # -----------------------------------------------------------------------------
@@ -66,8 +71,20 @@ def parse_query_string(qs: str) -> dict:
     return params
 
 
+# Same output as deployment/json_codec.py: compact, UTF-8, datetimes as ISO strings
+def _json_default(obj):
+    if isinstance(obj, datetime):
+        return obj.isoformat()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+_JSON_ENCODER = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"), default=_json_default)
+
+
 def json_bytes(data) -> bytes:
-    return json.dumps(data).encode("utf-8")
+    if orjson is not None:
+        return orjson.dumps(data, default=_json_default, option=orjson.OPT_NON_STR_KEYS)
+    return _JSON_ENCODER.encode(data).encode("utf-8")
 
 
 def as_iso(dt_str: str) -> str:
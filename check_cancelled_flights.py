@@ -1,50 +1,55 @@
 """
 Check for cancelled flights in the database.
 Run this on PythonAnywhere to analyze your flight data.
+
+Flights are streamed one at a time, so this also works on multi-GB files:
+  python check_cancelled_flights.py [data file, storage directory or .json.gz archive] [--archive]
 """
-import json
+import os
 import sys
 
+# flight_stream lives next to this script on PythonAnywhere, in deployment/ in the repository
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'deployment'))
+from flight_stream import iter_dataset
+
+DATA_FILE = 'data/flight_compensation_data.json'
+
 def main():
+    args = [arg for arg in sys.argv[1:] if arg != '--archive']
+    path = args[0] if args else DATA_FILE
     try:
-        # Load flight data
-        with open('data/flight_compensation_data.json', 'r') as f:
-            data = json.load(f)
-        
-        flights = data.get('flights', [])
-        total = len(flights)
+        total = delayed = cancelled = eligible = 0
+        samples = []
+        for flight in iter_dataset(path, include_archive='--archive' in sys.argv):
+            total += 1
+            if (flight.get('delay') or 0) >= 180:
+                delayed += 1
+            if flight.get('eligible_for_compensation', False):
+                eligible += 1
+            if 'cancel' in str(flight.get('status', '')).lower():
+                cancelled += 1
+                if len(samples) < 5:
+                    samples.append(flight)
+
         print(f"Total flights: {total}")
-        
-        # Count delayed flights
-        delayed = sum(1 for f in flights if f.get('delay', 0) >= 180)
         print(f"Delayed flights (3+ hrs): {delayed}")
-        
-        # Count cancelled flights
-        cancelled = sum(1 for f in flights if 'cancel' in str(f.get('status', '')).lower())
         print(f"Cancelled flights: {cancelled}")
-        
+
         # Show examples of cancelled flights
         if cancelled > 0:
             print("\nSample cancelled flights:")
-            count = 0
-            for flight in flights:
-                if 'cancel' in str(flight.get('status', '')).lower():
-                    flight_num = flight.get('flight', 'Unknown')
-                    status = flight.get('status', 'Unknown')
-                    dep = flight.get('departure', {}).get('airport', {}).get('iata', 'Unknown')
-                    arr = flight.get('arrival', {}).get('airport', {}).get('iata', 'Unknown')
-                    print(f"{flight_num}: {dep}-{arr} - {status}")
-                    count += 1
-                    if count >= 5:
-                        break
-            
+            for flight in samples:
+                flight_num = flight.get('flight', 'Unknown')
+                status = flight.get('status', 'Unknown')
+                dep = flight.get('departure', {}).get('airport', {}).get('iata', 'Unknown')
+                arr = flight.get('arrival', {}).get('airport', {}).get('iata', 'Unknown')
+                print(f"{flight_num}: {dep}-{arr} - {status}")
+
             if cancelled > 5:
                 print(f"... and {cancelled - 5} more cancelled flights")
-        
-        # Check for eligible flights
-        eligible = sum(1 for f in flights if f.get('eligible_for_compensation', False))
+
         print(f"\nEligible for compensation: {eligible}")
-        
+
         return 0
     except Exception as e:
         print(f"Error: {e}")
@@ -3,23 +3,27 @@ Diagnostic script to analyze flight eligibility issues
 This will check the flight data and report details on eligibility criteria
 """
 import os
-import json
 import sys
 from datetime import datetime
 
+# flight_stream lives next to this script on PythonAnywhere, in deployment/ in the repository
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'deployment'))
+from flight_stream import iter_dataset
+
 # Path for flight data storage
 DATA_FILE = "/home/PiotrS/data/flight_compensation_data.json"
 # For local testing, use a local path if needed
 LOCAL_TEST_FILE = "./sample_flight_data.json"
 
 def load_flight_data(file_path):
-    """Load flight data from the specified file"""
+    """
+    Yield the flights of the specified file one at a time, without loading the
+    whole document (data file, storage directory or .json.gz archive)
+    """
     try:
-        with open(file_path, "r") as f:
-            return json.load(f)
-    except (json.JSONDecodeError, FileNotFoundError) as e:
+        yield from iter_dataset(file_path)
+    except (ValueError, FileNotFoundError) as e:
         print(f"Error reading data file: {e}")
-        return {"flights": []}
 
 def get_status_lower(flight_record):
     """Safely get lowercase status from flight record, handling None values"""
@@ -83,34 +87,32 @@ def is_eligible_for_compensation(flight, hours_ago=None):
         return False, f"Error: {str(e)}"
 
 def analyze_flight_data(file_path):
-    """Analyze flight data for eligibility issues"""
+    """Analyze flight data for eligibility issues in a single pass over the file"""
     print(f"\n--- ANALYZING FLIGHT DATA IN {file_path} ---\n")
     
-    data = load_flight_data(file_path)
-    flights = data.get("flights", [])
-    
-    print(f"Total flights in dataset: {len(flights)}")
-    
-    if not flights:
-        print("No flights found in dataset!")
-        return
-    
-    # Check flight data structure
-    sample_flight = flights[0]
-    print("\nSample flight data structure:")
-    for key, value in sample_flight.items():
-        print(f"{key}: {type(value).__name__}")
-    
-    # Check eligibility statistics
-    print("\nAnalyzing eligibility criteria...")
+    total_count = 0
     eligible_count = 0
     cancelled_count = 0
     delayed_count = 0
     eu_flight_count = 0
+    all_eligible = []
     
-    for flight in flights:
+    eu_airports = ['MAD', 'CDG', 'FRA', 'AMS', 'FCO', 'LHR', 'MUC', 'BCN', 'ATH', 'VIE', 'WAW', 'DUB', 'BRU', 'LIS', 'HEL', 'PRG', 'CPH', 'BUD', 'ARN', 'TXL', 'OTP', 'SOF', 'LJU', 'RIX', 'VNO', 'TLL']
+    
+    for flight in load_flight_data(file_path):
+        total_count += 1
+        
+        if total_count == 1:
+            # Check flight data structure
+            print("Sample flight data structure:")
+            for key, value in flight.items():
+                print(f"{key}: {type(value).__name__}")
+            
+            print("\nDetailed eligibility analysis (first 10 flights):")
+            print("--------------------------------------------")
+        
         # Check cancellation
-        status = flight.get('status', '').lower()
+        status = get_status_lower(flight)
         if "cancel" in status:
             cancelled_count += 1
         
@@ -123,30 +125,12 @@ def analyze_flight_data(file_path):
         departure_airport = flight.get('departure', {}).get('airport', {}).get('iata', '')
         arrival_airport = flight.get('arrival', {}).get('airport', {}).get('iata', '')
         
-        eu_airports = ['MAD', 'CDG', 'FRA', 'AMS', 'FCO', 'LHR', 'MUC', 'BCN', 'ATH', 'VIE', 'WAW', 'DUB', 'BRU', 'LIS', 'HEL', 'PRG', 'CPH', 'BUD', 'ARN', 'TXL', 'OTP', 'SOF', 'LJU', 'RIX', 'VNO', 'TLL']
-        
         if departure_airport in eu_airports or arrival_airport in eu_airports:
             eu_flight_count += 1
-    
-    print(f"\nFlights with cancellation: {cancelled_count}")
-    print(f"Flights with >= 3 hour delay: {delayed_count}")
-    print(f"Flights with EU airport: {eu_flight_count}")
-    
-    print("\nDetailed eligibility analysis (first 10 flights):")
-    print("--------------------------------------------")
-    
-    eligible_count = 0
-    for i, flight in enumerate(flights[:10]):
-        is_eligible, reason = is_eligible_for_compensation(flight)
-        print(f"Flight {i+1}: {is_eligible} - {reason}")
-        if is_eligible:
-            eligible_count += 1
-    
-    print("\nChecking for all eligible flights...")
-    all_eligible = []
-    
-    for flight in flights:
+        
         is_eligible, reason = is_eligible_for_compensation(flight)
+        if total_count <= 10:
+            print(f"Flight {total_count}: {is_eligible} - {reason}")
         if is_eligible:
             all_eligible.append({
                 'flight': flight.get('flight', ''),
@@ -154,6 +138,16 @@ def analyze_flight_data(file_path):
             })
             eligible_count += 1
     
+    print(f"\nTotal flights in dataset: {total_count}")
+    
+    if not total_count:
+        print("No flights found in dataset!")
+        return
+    
+    print(f"\nFlights with cancellation: {cancelled_count}")
+    print(f"Flights with >= 3 hour delay: {delayed_count}")
+    print(f"Flights with EU airport: {eu_flight_count}")
+    
     print(f"\nTotal eligible flights found: {eligible_count}")
     
     if all_eligible:
@@ -4,11 +4,14 @@ This script analyzes existing flight data with our enhanced detection logic
 but does NOT add any test/mock data.
 """
 
-import json
 import os
 import sys
 import logging
 
+# flight_stream lives next to this script on PythonAnywhere, in deployment/ in the repository
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'deployment'))
+from flight_stream import iter_dataset
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -22,29 +25,25 @@ except ImportError:
     EU_AIRPORTS_MODULE_LOADED = False
 
 # Path for flight data - this will be updated for PythonAnywhere
-DATA_FILE = "flight_data_backup.json"
+# (a data file, storage directory or .json.gz archive; pass another one as the first argument)
+DATA_FILE = sys.argv[1] if len(sys.argv) > 1 else "flight_data_backup.json"
 
 def analyze_flights():
     """Analyze existing flight data with enhanced EU261 detection."""
     try:
-        # Load flight data from JSON file 
-        with open(DATA_FILE, "r") as f:
-            data = json.load(f)
-        
-        if "flights" not in data:
-            logger.error(f"Invalid data format in {DATA_FILE}")
-            return
-        
-        flights = data["flights"]
-        logger.info(f"Analyzing {len(flights)} flights for EU261 eligibility")
+        # Stream flights from the JSON file one at a time (the file may be several GB)
+        logger.info(f"Analyzing flights in {DATA_FILE} for EU261 eligibility")
         
         # Count statistics
+        total_count = 0
         eligible_count = 0
         delay_count = 0
         cancel_count = 0
         
         # Check each flight with enhanced EU261 rules
-        for flight in flights:
+        for flight in iter_dataset(DATA_FILE):
+            total_count += 1
+            
             # Skip flights without required fields
             if not flight.get('flight') and not flight.get('flight_number'):
                 continue
@@ -71,13 +70,13 @@ def analyze_flights():
         
         # Report results
         logger.info(f"EU261 Eligibility Analysis Results:")
-        logger.info(f"- Total flights: {len(flights)}")
+        logger.info(f"- Total flights: {total_count}")
         logger.info(f"- Eligible for compensation: {eligible_count}")
         logger.info(f"  - Delayed flights: {delay_count}")
         logger.info(f"  - Cancelled flights: {cancel_count}")
         
         print(f"\nEU261 Eligibility Analysis Results:")
-        print(f"- Total flights analyzed: {len(flights)}")
+        print(f"- Total flights analyzed: {total_count}")
         print(f"- Eligible for compensation: {eligible_count}")
         print(f"  - Delayed flights: {delay_count}")
         print(f"  - Cancelled flights: {cancel_count}")
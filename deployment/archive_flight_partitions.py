@@ -0,0 +1,43 @@
+"""
+Archive Flight Partitions Script
+--------------------------------
+Retention job for the date-partitioned flight store: moves day partitions older
+than the retention horizon into gzip archives, so the live data stays bounded.
+
+Run daily as a PythonAnywhere scheduled task:
+  python /home/PiotrS/deployment/archive_flight_partitions.py --days 90
+"""
+
+import sys
+import argparse
+import logging
+
+from flight_data_storage import FlightDataStorage
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger("archive_flight_partitions")
+
+def main():
+    parser = argparse.ArgumentParser(description="Gzip-archive flight partitions older than the retention horizon")
+    parser.add_argument('--days', type=int, help="Days of departures to keep live (default FLIGHT_RETENTION_DAYS or 90)")
+    parser.add_argument('--data-dir', help="Storage directory (default FLIGHT_DATA_DIR)")
+    args = parser.parse_args()
+
+    storage = FlightDataStorage(data_dir=args.data_dir)
+    try:
+        archived = storage.archive_partitions(retention_days=args.days)
+    except Exception as e:
+        logger.error(f"Archiving failed: {e}")
+        return 1
+
+    for day, count in archived:
+        logger.info(f"Archived {count} flights departing {day}")
+    logger.info(f"Archived {len(archived)} partitions to {storage.archive_dir}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,219 @@
+"""
+ASGI Entry Point
+----------------
+Serves fixed_wsgi_app (same routes, middleware and storage) to an ASGI server, so a
+/compensation-check waiting on AviationStack does not hold a thread:
+
+  cd /home/PiotrS/deployment && uvicorn asgi_app:application --workers 2
+
+Per request:
+- /compensation-check that the stored data cannot answer looks the flight up on the
+  event loop (AviationStackClient.alookup_flight, pooled asyncio connections, same
+  quota, circuit breaker and stale fallback) and hands the result to the handler.
+  Hundreds of slow upstream calls can be in flight per process while the threads
+  stay free.
+- Everything else - routing, filtering, eligibility, serialization - runs in the WSGI
+  application on a bounded thread pool (ASGI_WORKER_THREADS), so CPU-bound work never
+  blocks the loop and at most that many requests compete for the interpreter.
+- Long-lived streams (/eligible_flights/stream) wait between checks on the loop, not
+  in a thread, and stop when the client disconnects.
+
+Environment variables:
+- ASGI_WORKER_THREADS: Threads running the WSGI application (default 8)
+- AVIATION_STACK_MAX_CONCURRENCY / AVIATION_STACK_POOL_SIZE: upstream calls in flight
+  and pooled upstream connections; raise both to use the extra concurrency
+"""
+
+import io
+import os
+import sys
+import time
+import asyncio
+import logging
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+
+_APP_DIR = os.path.dirname(os.path.abspath(__file__))
+if _APP_DIR not in sys.path:
+    sys.path.insert(0, _APP_DIR)
+
+import fixed_wsgi_app
+from fixed_wsgi_app import PREFETCHED_UPSTREAM, STREAM_PACED_BY_SERVER
+from wsgi_routing import PHASES_ENVIRON_KEY
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+ASGI_WORKER_THREADS = int(os.environ.get('ASGI_WORKER_THREADS', '8'))
+
+# Threads are started on demand, so a pool built before a fork is safe to inherit
+_executor = ThreadPoolExecutor(max_workers=ASGI_WORKER_THREADS, thread_name_prefix='asgi-worker')
+
+
+def _environ(scope, body):
+    """WSGI environ for an ASGI http scope and its request body."""
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', ''),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': str(server[0]),
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': client[0],
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+        STREAM_PACED_BY_SERVER: True,
+    }
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            environ[name] = value
+        else:
+            key = f'HTTP_{name}'
+            environ[key] = f'{environ[key]},{value}' if key in environ else value
+    return environ
+
+
+async def _read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return None
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body'):
+            return b''.join(chunks)
+
+
+async def _wait_for_disconnect(receive, disconnected):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+    disconnected.set()
+
+
+async def _prefetch_upstream(environ):
+    """
+    For a /compensation-check the stored data cannot answer, look the flight up
+    asynchronously and leave the result in the environ for the handler.
+    """
+    if environ['REQUEST_METHOD'] != 'GET' or environ['PATH_INFO'].rstrip('/') != '/compensation-check':
+        return
+    params = urllib.parse.parse_qs(environ['QUERY_STRING'])
+    flight_number = (params.get('flight_number', [''])[0] or '').strip()
+    if not flight_number:
+        return
+    try:
+        date = fixed_wsgi_app._check_date(params.get('date', [''])[0])
+    except ValueError:
+        return  # The handler answers 400
+    loop = asyncio.get_running_loop()
+    # The index lookup may build the index on first use: keep it off the loop
+    if await loop.run_in_executor(_executor, fixed_wsgi_app._fresh_stored_flight, flight_number, date) is not None:
+        return
+    try:
+        client = fixed_wsgi_app._aviationstack_client()
+    except Exception:
+        return  # The handler reports the unconfigured client
+    started = time.perf_counter()
+    environ[PREFETCHED_UPSTREAM] = await client.alookup_flight(flight_number)
+    environ[PHASES_ENVIRON_KEY] = {'upstream': time.perf_counter() - started}
+
+
+def _start(environ):
+    """Run the WSGI application up to its first body chunk (on an executor thread)."""
+    started = []
+
+    def start_response(status, headers, exc_info=None):
+        started[:] = [status, headers]
+
+    body = fixed_wsgi_app.application(environ, start_response)
+    iterator = iter(body)
+    return started[0], started[1], body, iterator, _pull(body, iterator)
+
+
+def _pull(body, iterator):
+    """Next body chunk, or None after closing the body when it is exhausted."""
+    chunk = next(iterator, None)
+    if chunk is None and hasattr(body, 'close'):
+        body.close()
+    return chunk
+
+
+async def _http(scope, receive, send):
+    body = await _read_body(receive)
+    if body is None:
+        return
+    environ = _environ(scope, body)
+    loop = asyncio.get_running_loop()
+    try:
+        await _prefetch_upstream(environ)
+        status, headers, response_body, iterator, chunk = await loop.run_in_executor(_executor, _start, environ)
+    except Exception as e:
+        logger.error(f"ASGI request {scope['method']} {scope['path']} failed: {e}")
+        await send({'type': 'http.response.start', 'status': 500,
+                    'headers': [(b'content-type', b'text/plain')]})
+        await send({'type': 'http.response.body', 'body': b'Internal Server Error'})
+        return
+
+    await send({
+        'type': 'http.response.start',
+        'status': int(status.split(' ', 1)[0]),
+        'headers': [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers],
+    })
+    if chunk is None:
+        await send({'type': 'http.response.body', 'body': b''})
+        return
+    # _pull closes the body once exhausted; close it here only if sending stopped early
+    exhausted = False
+    disconnected = asyncio.Event()
+    watcher = loop.create_task(_wait_for_disconnect(receive, disconnected))
+    try:
+        while not exhausted and not disconnected.is_set():
+            following = await loop.run_in_executor(_executor, _pull, response_body, iterator)
+            exhausted = following is None
+            if chunk or exhausted:
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': not exhausted})
+            if following == b'':
+                # Nothing to send yet (see STREAM_PACED_BY_SERVER): wait here, not in a thread
+                try:
+                    await asyncio.wait_for(disconnected.wait(), fixed_wsgi_app.ELIGIBLE_STREAM_POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+            chunk = following
+    finally:
+        watcher.cancel()
+        if not exhausted and hasattr(response_body, 'close'):
+            await loop.run_in_executor(_executor, response_body.close)
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            if fixed_wsgi_app.AVIATIONSTACK_MODULE_LOADED:
+                from aviationstack_client import aclose_client
+                await aclose_client()
+            _executor.shutdown(wait=False)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def application(scope, receive, send):
+    """ASGI 3 application: http requests and lifespan events."""
+    if scope['type'] == 'http':
+        await _http(scope, receive, send)
+    elif scope['type'] == 'lifespan':
+        await _lifespan(receive, send)
+    else:
+        raise ValueError(f"Unsupported ASGI scope type: {scope['type']}")
@@ -0,0 +1,180 @@
+"""
+Async HTTP Module
+-----------------
+Minimal asyncio HTTP/1.1 client with keep-alive connection pooling, for upstream
+calls made from the ASGI entry point (asgi_app) without holding a thread.
+
+Only what the AviationStack client needs: GET with query parameters, responses
+framed by Content-Length, chunked encoding or connection close, http and https.
+Idle connections are kept per host and reused; `max_connections` caps the
+connections open at once (further requests wait for one to free up).
+
+A pool belongs to the event loop it was first used on.
+"""
+
+import ssl
+import time
+import asyncio
+import logging
+import urllib.parse
+from collections import deque
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Longest status line / header line accepted
+_MAX_LINE = 65536
+
+
+class HTTPResponseError(Exception):
+    """The server's response could not be parsed."""
+
+
+class AsyncHTTPPool:
+    """Pooled keep-alive HTTP/1.1 connections (see module docstring)."""
+    def __init__(self, max_connections=10, connect_timeout=3.05, read_timeout=10.0, idle_seconds=30.0,
+                 user_agent='flight-api'):
+        """
+        Args:
+            max_connections: Connections open at once, across hosts
+            connect_timeout: Seconds to establish a connection (and TLS)
+            read_timeout: Seconds to wait for the complete response
+            idle_seconds: Idle connections older than this are closed instead of reused
+            user_agent: User-Agent header sent
+        """
+        self.max_connections = max_connections
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.idle_seconds = idle_seconds
+        self.user_agent = user_agent
+        self._idle = {}  # (scheme, host, port) -> deque of (reader, writer, idle since)
+        self._slots = None
+        self._ssl = None
+        self.opened = 0
+        self.reused = 0
+
+    async def get(self, url, params=None):
+        """
+        GET `url` with `params` added to its query string.
+
+        Returns:
+            tuple: (status code, headers dict with lower-case names, body bytes)
+
+        Raises:
+            asyncio.TimeoutError: connect or read timeout
+            OSError: connection failure
+            HTTPResponseError: malformed response
+        """
+        parts = urllib.parse.urlsplit(url)
+        query = parts.query
+        if params:
+            query = (query + '&' if query else '') + urllib.parse.urlencode(params)
+        target = (parts.path or '/') + ('?' + query if query else '')
+        https = parts.scheme == 'https'
+        port = parts.port or (443 if https else 80)
+        key = (parts.scheme, parts.hostname, port)
+        request = (f"GET {target} HTTP/1.1\r\nHost: {parts.netloc}\r\nUser-Agent: {self.user_agent}\r\n"
+                   f"Accept: application/json\r\nConnection: keep-alive\r\n\r\n").encode('latin-1')
+
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_connections)
+        async with self._slots:
+            # A reused connection may have been closed by the server meanwhile: retry once on a new one
+            for attempt in (0, 1):
+                reader, writer, reused = await self._connection(key, https, fresh=attempt > 0)
+                try:
+                    writer.write(request)
+                    status, headers, body, keep_alive = await asyncio.wait_for(
+                        self._read_response(reader), self.read_timeout)
+                except (ConnectionError, asyncio.IncompleteReadError, HTTPResponseError):
+                    writer.close()
+                    if reused and attempt == 0:
+                        continue
+                    raise
+                except BaseException:
+                    writer.close()
+                    raise
+                if keep_alive:
+                    self._idle.setdefault(key, deque()).append((reader, writer, time.monotonic()))
+                else:
+                    writer.close()
+                return status, headers, body
+
+    async def _connection(self, key, https, fresh):
+        idle = self._idle.get(key)
+        now = time.monotonic()
+        while idle and not fresh:
+            reader, writer, since = idle.pop()
+            if now - since < self.idle_seconds and not reader.at_eof() and not writer.is_closing():
+                self.reused += 1
+                return reader, writer, True
+            writer.close()
+        context = None
+        if https:
+            if self._ssl is None:
+                self._ssl = ssl.create_default_context()
+            context = self._ssl
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(key[1], key[2], ssl=context, limit=_MAX_LINE), self.connect_timeout)
+        self.opened += 1
+        return reader, writer, False
+
+    async def _read_response(self, reader):
+        line = await reader.readline()
+        if not line:
+            raise HTTPResponseError("connection closed before the status line")
+        try:
+            version, code = line.decode('latin-1').split(None, 2)[:2]
+            status = int(code)
+        except ValueError:
+            raise HTTPResponseError(f"bad status line {line[:100]!r}")
+
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n'):
+                break
+            if not line:
+                raise HTTPResponseError("connection closed in the headers")
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+        if status in (204, 304) or 100 <= status < 200:
+            body = b''
+        elif 'chunked' in headers.get('transfer-encoding', '').lower():
+            body = await self._read_chunked(reader)
+        elif 'content-length' in headers:
+            body = await reader.readexactly(int(headers['content-length']))
+        else:
+            body = await reader.read()
+            keep_alive = False
+        return status, headers, body, keep_alive
+
+    async def _read_chunked(self, reader):
+        chunks = []
+        while True:
+            line = await reader.readline()
+            try:
+                size = int(line.split(b';', 1)[0].strip(), 16)
+            except ValueError:
+                raise HTTPResponseError(f"bad chunk size {line[:100]!r}")
+            if size == 0:
+                # Trailers, up to the blank line
+                while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                    pass
+                return b''.join(chunks)
+            chunks.append(await reader.readexactly(size))
+            await reader.readexactly(2)
+
+    async def close(self):
+        """Close every idle connection."""
+        writers = [writer for idle in self._idle.values() for _, writer, _ in idle]
+        self._idle = {}
+        for writer in writers:
+            writer.close()
+        for writer in writers:
+            try:
+                await writer.wait_closed()
+            except (OSError, ConnectionError):
+                pass
@@ -1,37 +1,441 @@
 import os
+import json
+import hashlib
+import time
+import asyncio
+import threading
+from collections import OrderedDict, deque, namedtuple
 import requests
+from requests.adapters import HTTPAdapter
 import logging
 
+from async_http import AsyncHTTPPool, HTTPResponseError
+from circuit_breaker import CircuitBreaker
+from flight_data_storage import write_bytes_atomic
+
 # Configure logging
 logger = logging.getLogger(__name__)
 
+# Client modes: "live" talks to the API, "record" talks to the API and saves every
+# response to the fixture directory, "replay" serves saved responses without network.
+CLIENT_MODES = ("live", "record", "replay")
+
+# Outcome of an upstream call.
+# source is "live", "replay", "cache" (stale copy served because the API failed or
+# the circuit is open) or "unavailable" (nothing to serve); error names the failure.
+UpstreamResult = namedtuple('UpstreamResult', ['data', 'stale', 'source', 'error'])
+
+# Maximum number of distinct successful responses kept for stale fallback
+RESPONSE_CACHE_SIZE = 512
+
+
+def _env_float(name, default):
+    try:
+        return float(os.environ.get(name, default))
+    except ValueError:
+        return float(default)
+
+
+def _resolve(waiter):
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+class QuotaManager:
+    """
+    Keeps upstream usage inside the plan's limits: at most `max_concurrent` calls in
+    flight and a token-bucket cap of `rate_per_second` calls (bursts up to `burst`).
+    """
+    def __init__(self, max_concurrent=4, rate_per_second=5.0, burst=10):
+        self.max_concurrent = max_concurrent
+        self.rate_per_second = rate_per_second
+        self.burst = burst
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+        self._tokens = float(burst)
+        self._refilled_at = time.monotonic()
+        self._lock = threading.Lock()
+        self._waiters = deque()  # (loop, future) of acquire_async() callers waiting for a slot
+        self.calls = 0
+        self.denied = 0
+
+    def _take_token(self):
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._refilled_at) * self.rate_per_second)
+            self._refilled_at = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                self.calls += 1
+                return 0.0
+            return (1 - self._tokens) / self.rate_per_second
+
+    def acquire(self, timeout=5.0):
+        """
+        Wait for a concurrency slot and a rate token.
+
+        Returns:
+            bool: False if neither became available within `timeout` seconds
+        """
+        deadline = time.monotonic() + timeout
+        if not self._slots.acquire(timeout=timeout):
+            with self._lock:
+                self.denied += 1
+            return False
+        while True:
+            wait = self._take_token()
+            if wait == 0.0:
+                return True
+            if time.monotonic() + wait > deadline:
+                self._slots.release()
+                with self._lock:
+                    self.denied += 1
+                return False
+            time.sleep(wait)
+
+    async def acquire_async(self, timeout=5.0):
+        """
+        acquire() without blocking the event loop. The slots are shared with threaded
+        callers: a coroutine that finds none free waits on a future that release()
+        resolves, and the rate wait sleeps until the next token is due.
+        """
+        deadline = time.monotonic() + timeout
+        if not await self._acquire_slot_async(deadline):
+            with self._lock:
+                self.denied += 1
+            return False
+        while True:
+            wait = self._take_token()
+            if wait == 0.0:
+                return True
+            if time.monotonic() + wait > deadline:
+                self._slots.release()
+                with self._lock:
+                    self.denied += 1
+                return False
+            await asyncio.sleep(wait)
+
+    async def _acquire_slot_async(self, deadline):
+        loop = asyncio.get_running_loop()
+        while not self._slots.acquire(blocking=False):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            entry = (loop, loop.create_future())
+            with self._lock:
+                self._waiters.append(entry)
+            woken = False
+            try:
+                # A slot freed before the waiter was registered woke nobody: look again
+                if self._slots.acquire(blocking=False):
+                    return True
+                await asyncio.wait_for(entry[1], remaining)
+                woken = True
+            except asyncio.TimeoutError:
+                return False
+            finally:
+                with self._lock:
+                    sent = entry not in self._waiters
+                    if not sent:
+                        self._waiters.remove(entry)
+                if sent and not woken:
+                    # release() picked this waiter, but it stopped waiting: wake the next one
+                    self._wake_one()
+        return True
+
+    def _wake_one(self):
+        with self._lock:
+            while self._waiters:
+                loop, waiter = self._waiters.popleft()
+                try:
+                    loop.call_soon_threadsafe(_resolve, waiter)
+                    return
+                except RuntimeError:
+                    continue  # Its loop is closed
+
+    def release(self):
+        self._slots.release()
+        if self._waiters:
+            self._wake_one()
+
+
 class AviationStackClient:
     """A client for interacting with the AviationStack API."""
 
-    def __init__(self):
-        """Initializes the client and gets the API key from environment variables."""
-        self.api_key = os.environ.get('AVIATION_STACK_API_KEY')
-        self.base_url = 'http://api.aviationstack.com/v1'
-        if not self.api_key:
+    def __init__(self, api_key=None, base_url=None, mode=None, fixture_dir=None):
+        """
+        Initializes the client and gets the API key from environment variables.
+
+        Args:
+            api_key: API key; defaults to AVIATION_STACK_API_KEY
+            base_url: API root; defaults to AVIATION_STACK_BASE_URL, so a local
+                stand-in server can be used instead of the real API
+            mode: One of "live", "record" or "replay"; defaults to AVIATION_STACK_MODE
+            fixture_dir: Directory for recorded responses; defaults to AVIATION_STACK_FIXTURE_DIR
+        """
+        self.api_key = api_key or os.environ.get('AVIATION_STACK_API_KEY')
+        self.base_url = (base_url or os.environ.get('AVIATION_STACK_BASE_URL', 'http://api.aviationstack.com/v1')).rstrip('/')
+        self.mode = (mode or os.environ.get('AVIATION_STACK_MODE', 'live')).lower()
+        self.fixture_dir = fixture_dir or os.environ.get(
+            'AVIATION_STACK_FIXTURE_DIR',
+            os.path.join(os.path.dirname(__file__), 'data', 'aviationstack_fixtures')
+        )
+        if self.mode not in CLIENT_MODES:
+            raise ValueError(f"Unknown AviationStack client mode: {self.mode}")
+        if not self.api_key and self.mode != 'replay':
             logger.error("AVIATION_STACK_API_KEY environment variable not set.")
             raise ValueError("API key for AviationStack is not configured.")
+        if self.mode == 'record':
+            os.makedirs(self.fixture_dir, exist_ok=True)
 
-    def _make_request(self, endpoint, params=None):
-        """Makes a request to a given endpoint of the AviationStack API."""
-        if not params:
-            params = {}
+        # One pooled session per client keeps upstream connections alive between requests
+        pool_size = int(os.environ.get('AVIATION_STACK_POOL_SIZE', '10'))
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        # (connect, read) timeouts; previously calls could wait forever on a dead socket
+        self.timeout = (
+            _env_float('AVIATION_STACK_CONNECT_TIMEOUT', 3.05),
+            _env_float('AVIATION_STACK_READ_TIMEOUT', 10),
+        )
+        self.breaker = CircuitBreaker(
+            'aviationstack',
+            failure_rate_threshold=_env_float('AVIATION_STACK_BREAKER_FAILURE_RATE', 0.5),
+            slow_call_threshold=_env_float('AVIATION_STACK_BREAKER_SLOW_SECONDS', 5),
+            open_seconds=_env_float('AVIATION_STACK_BREAKER_OPEN_SECONDS', 30),
+        )
+        self.quota = QuotaManager(
+            max_concurrent=int(_env_float('AVIATION_STACK_MAX_CONCURRENCY', 4)),
+            rate_per_second=_env_float('AVIATION_STACK_RATE_PER_SECOND', 5),
+            burst=int(_env_float('AVIATION_STACK_RATE_BURST', 10)),
+        )
+        # Last good response per request, served as stale data while the API is down
+        self._response_cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        # Calls made through _fetch, by (result source, error or 'none'), for metrics
+        self.outcomes = {}
+        # asyncio connection pool for _afetch, built on first async use
+        self._apool = None
+        self._apool_loop = None
+
+    def _fixture_path(self, endpoint, params):
+        """Returns the fixture file for a request; the access key is never part of the name."""
+        key_params = sorted((k, str(v)) for k, v in params.items() if k != 'access_key')
+        digest = hashlib.sha1(json.dumps([endpoint, key_params]).encode('utf-8')).hexdigest()[:16]
+        return os.path.join(self.fixture_dir, f"{endpoint.replace('/', '_')}_{digest}.json")
+
+    def _record_response(self, endpoint, params, payload):
+        """Saves a raw API payload together with the request that produced it."""
+        path = self._fixture_path(endpoint, params)
+        fixture = {
+            'endpoint': endpoint,
+            'params': {k: v for k, v in params.items() if k != 'access_key'},
+            'response': payload,
+        }
+        try:
+            # Replaced atomically: a crash or a concurrent recorder never leaves a truncated fixture
+            write_bytes_atomic(path, json.dumps(fixture).encode('utf-8'))
+        except OSError as e:
+            logger.error(f"Could not record AviationStack fixture {path}: {e}")
+
+    def _replay_response(self, endpoint, params):
+        """Loads a recorded payload, or an empty payload if the request was never recorded."""
+        path = self._fixture_path(endpoint, params)
+        try:
+            with open(path, 'r') as f:
+                return json.load(f).get('response', {})
+        except FileNotFoundError:
+            logger.warning(f"No recorded AviationStack fixture for {endpoint} {params}")
+        except (OSError, json.JSONDecodeError) as e:
+            logger.error(f"Could not read AviationStack fixture {path}: {e}")
+        return {}
+
+    def _cache_key(self, endpoint, params):
+        return (endpoint, tuple(sorted((k, str(v)) for k, v in params.items() if k != 'access_key')))
+
+    def _remember(self, key, data):
+        with self._cache_lock:
+            self._response_cache[key] = (time.time(), data)
+            self._response_cache.move_to_end(key)
+            while len(self._response_cache) > RESPONSE_CACHE_SIZE:
+                self._response_cache.popitem(last=False)
+
+    def _stale_result(self, key, error):
+        """Serve the last good response for `key`, or report the upstream as unavailable."""
+        with self._cache_lock:
+            cached = self._response_cache.get(key)
+        if cached is not None:
+            logger.warning(f"Serving stale AviationStack data ({error}), cached {int(time.time() - cached[0])}s ago")
+            return UpstreamResult(cached[1], True, 'cache', error)
+        return UpstreamResult([], False, 'unavailable', error)
+
+    def _fetch(self, endpoint, params=None):
+        """
+        Makes a request under the quota manager and through the circuit breaker.
+
+        Returns:
+            UpstreamResult: live data, a stale cached copy, or an "unavailable" marker
+        """
+        return self._count(self._fetch_uncounted(endpoint, params))
+
+    def _fetch_uncounted(self, endpoint, params):
+        params = dict(params or {})
+
+        if self.mode == 'replay':
+            return UpstreamResult(self._replay_response(endpoint, params).get('data', []), False, 'replay', None)
+
+        key = self._cache_key(endpoint, params)
+        # An open circuit fails fast: no wait for a slot, no rate token spent
+        if not self.breaker.allow_request():
+            return self._stale_result(key, 'circuit_open')
+        if not self.quota.acquire():
+            self.breaker.release()
+            logger.warning("AviationStack quota exhausted, not calling upstream")
+            return self._stale_result(key, 'quota_exhausted')
+        try:
+            return self._fetch_within_quota(endpoint, params, key)
+        finally:
+            self.quota.release()
+
+    def _fetch_within_quota(self, endpoint, params, key):
         params['access_key'] = self.api_key
-        
+        started = time.monotonic()
         try:
-            response = requests.get(f"{self.base_url}/{endpoint}", params=params)
+            response = self.session.get(f"{self.base_url}/{endpoint}", params=params, timeout=self.timeout)
             response.raise_for_status()  # Raise an exception for bad status codes (4xx or 5xx)
-            return response.json().get('data', [])
+            payload = response.json()
+        except requests.exceptions.HTTPError as e:
+            status = e.response.status_code if e.response is not None else 0
+            logger.error(f"AviationStack API returned HTTP {status}: {e}")
+            return self._http_error_result(key, status, started)
         except requests.exceptions.RequestException as e:
             logger.error(f"Error connecting to AviationStack API: {e}")
-            return []
+            return self._failure_result(key, type(e).__name__, started)
         except Exception as e:
             logger.error(f"An unexpected error occurred: {e}")
-            return []
+            return self._failure_result(key, type(e).__name__, started)
+        return self._live_result(endpoint, params, key, payload, started)
+
+    # Shared by the sync and async fetch paths: breaker accounting and the result
+
+    def _http_error_result(self, key, status, started):
+        elapsed = time.monotonic() - started
+        if status >= 500 or status == 429:
+            self.breaker.record_failure(elapsed)
+            return self._stale_result(key, f"http_{status}")
+        # Other 4xx are request/key problems, not upstream health
+        self.breaker.record_success(elapsed)
+        return UpstreamResult([], False, 'live', f"http_{status}")
+
+    def _failure_result(self, key, error, started):
+        self.breaker.record_failure(time.monotonic() - started)
+        return self._stale_result(key, error)
+
+    def _live_result(self, endpoint, params, key, payload, started):
+        self.breaker.record_success(time.monotonic() - started)
+        if self.mode == 'record':
+            self._record_response(endpoint, params, payload)
+        data = payload.get('data', []) if isinstance(payload, dict) else []
+        self._remember(key, data)
+        return UpstreamResult(data, False, 'live', None)
+
+    def _count(self, result):
+        outcome = (result.source, result.error or 'none')
+        with self._cache_lock:
+            self.outcomes[outcome] = self.outcomes.get(outcome, 0) + 1
+        return result
+
+    async def _afetch(self, endpoint, params=None):
+        """
+        _fetch for the ASGI entry point: same quota, breaker, stale cache and outcome
+        counting, but the call goes through the asyncio pool and waits without a thread.
+        Replay mode reads its fixture inline (a small local file).
+        """
+        params = dict(params or {})
+        if self.mode == 'replay':
+            return self._count(self._fetch_uncounted(endpoint, params))
+
+        key = self._cache_key(endpoint, params)
+        if not self.breaker.allow_request():
+            return self._count(self._stale_result(key, 'circuit_open'))
+        if not await self.quota.acquire_async():
+            self.breaker.release()
+            logger.warning("AviationStack quota exhausted, not calling upstream")
+            return self._count(self._stale_result(key, 'quota_exhausted'))
+        try:
+            return self._count(await self._afetch_within_quota(endpoint, params, key))
+        finally:
+            self.quota.release()
+
+    async def _afetch_within_quota(self, endpoint, params, key):
+        params['access_key'] = self.api_key
+        started = time.monotonic()
+        try:
+            status, _, body = await self._async_pool().get(f"{self.base_url}/{endpoint}", params)
+            if status >= 400:
+                logger.error(f"AviationStack API returned HTTP {status}")
+                return self._http_error_result(key, status, started)
+            payload = json.loads(body)
+        except asyncio.TimeoutError:
+            logger.error("Timed out waiting for the AviationStack API")
+            return self._failure_result(key, 'Timeout', started)
+        except (OSError, HTTPResponseError) as e:
+            logger.error(f"Error connecting to AviationStack API: {e}")
+            return self._failure_result(key, type(e).__name__, started)
+        except Exception as e:
+            logger.error(f"An unexpected error occurred: {e}")
+            return self._failure_result(key, type(e).__name__, started)
+        return self._live_result(endpoint, params, key, payload, started)
+
+    def _async_pool(self):
+        # asyncio streams are tied to their loop: one pool per running loop
+        loop = asyncio.get_running_loop()
+        if self._apool is None or self._apool_loop is not loop:
+            self._apool = AsyncHTTPPool(
+                max_connections=int(os.environ.get('AVIATION_STACK_POOL_SIZE', '10')),
+                connect_timeout=self.timeout[0],
+                read_timeout=self.timeout[1],
+            )
+            self._apool_loop = loop
+        return self._apool
+
+    async def aclose(self):
+        """Close the async pool's connections (call from the loop that used it)."""
+        if self._apool is not None:
+            await self._apool.close()
+            self._apool = None
+
+    def peek_cached(self, endpoint, params, max_age):
+        """
+        Return a cached response no older than `max_age` seconds without calling upstream.
+
+        Returns:
+            list or None: The cached `data` list, or None on a miss
+        """
+        key = self._cache_key(endpoint, dict(params or {}))
+        with self._cache_lock:
+            cached = self._response_cache.get(key)
+        if cached is not None and time.time() - cached[0] <= max_age:
+            return cached[1]
+        return None
+
+    def _make_request(self, endpoint, params=None):
+        """Makes a request to a given endpoint of the AviationStack API."""
+        return self._fetch(endpoint, params).data
+
+    def lookup_flight(self, flight_number):
+        """
+        Fetches a flight by number (IATA), reporting whether the answer is stale.
+
+        Returns:
+            UpstreamResult: see _fetch
+        """
+        return self._fetch('flights', {'flight_iata': flight_number})
+
+    async def alookup_flight(self, flight_number):
+        """lookup_flight for async callers (see _afetch)."""
+        return await self._afetch('flights', {'flight_iata': flight_number})
 
     def get_flight_by_number(self, flight_number):
         """Fetches flight data for a specific flight number (IATA)."""
@@ -41,3 +445,60 @@ class AviationStackClient:
     def get_flights(self, params=None):
         """Fetches a list of flights with optional filters."""
         return self._make_request('flights', params=params)
+
+
+# Process-wide client registry. The client (and its connection pool) is built on
+# first use and then shared by every request handled by this worker.
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """
+    Return the shared AviationStackClient, creating it on first use.
+
+    Thread-safe; a failed construction (e.g. missing API key) is not cached, so
+    the error is raised again on the next call instead of being hidden.
+    """
+    global _client
+    client = _client
+    if client is None:
+        with _client_lock:
+            if _client is None:
+                _client = AviationStackClient()
+            client = _client
+    return client
+
+
+def cached_responses():
+    """Entries in the shared client's response cache (0 if it was never built)."""
+    client = _client
+    if client is None:
+        return 0
+    with client._cache_lock:
+        return len(client._response_cache)
+
+
+def upstream_outcomes():
+    """{(source, error): calls} of the shared client ({} if it was never built)."""
+    client = _client
+    if client is None:
+        return {}
+    with client._cache_lock:
+        return dict(client.outcomes)
+
+
+def reset_client():
+    """Drop the shared client so the next get_client() call rebuilds it from the environment."""
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.session.close()
+        _client = None
+
+
+async def aclose_client():
+    """Close the shared client's async connection pool, if it was built (for ASGI shutdown)."""
+    client = _client
+    if client is not None:
+        await client.aclose()
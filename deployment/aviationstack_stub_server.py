@@ -0,0 +1,367 @@
+"""
+AviationStack Stand-in Server
+-----------------------------
+Local replacement for the AviationStack `/v1/flights` endpoint, so ingestion and
+`/compensation-check` can be exercised and load-tested without spending API quota.
+
+Uses only the standard library. Flights come either from fixtures (a file in the
+AviationStack response format, or a directory recorded by AviationStackClient in
+"record" mode) or from a seeded generator.
+
+Usage:
+  python aviationstack_stub_server.py --port 8081 --generate 20000
+  python aviationstack_stub_server.py --fixtures data/aviationstack_fixtures --latency-ms 250 --error-rate 0.02
+
+Point the backend at it with:
+  AVIATION_STACK_BASE_URL=http://127.0.0.1:8081/v1 AVIATION_STACK_API_KEY=local
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import logging
+import threading
+import urllib.parse
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger("aviationstack_stub_server")
+
+MAX_LIMIT = 100
+
+AIRLINES = [
+    ("LH", "DLH", "Lufthansa"), ("AF", "AFR", "Air France"), ("BA", "BAW", "British Airways"),
+    ("KL", "KLM", "KLM"), ("IB", "IBE", "Iberia"), ("LO", "LOT", "LOT Polish Airlines"),
+    ("FR", "RYR", "Ryanair"), ("U2", "EZY", "easyJet"), ("W6", "WZZ", "Wizz Air"),
+    ("TP", "TAP", "TAP Air Portugal"), ("SK", "SAS", "SAS"), ("EK", "UAE", "Emirates"),
+    ("TK", "THY", "Turkish Airlines"), ("UA", "UAL", "United Airlines"),
+]
+
+AIRPORTS = [
+    "FRA", "CDG", "AMS", "MAD", "FCO", "LHR", "MUC", "BCN", "LIS", "VIE", "WAW",
+    "KRK", "DUB", "CPH", "ARN", "HEL", "ATH", "PRG", "BUD", "OTP",
+    "JFK", "DXB", "IST", "DOH", "SIN",
+]
+
+# (flight_status, weight) - roughly the mix seen in real AviationStack responses
+STATUSES = [("landed", 60), ("active", 15), ("scheduled", 15), ("cancelled", 4), ("diverted", 1), ("incident", 1)]
+
+
+def generate_flights(count, hours=72, seed=None):
+    """
+    Generate AviationStack-shaped flight records scheduled within the last `hours`.
+
+    Args:
+        count: Number of flights to generate
+        hours: Width of the scheduling window ending now
+        seed: Optional random seed for reproducible datasets
+
+    Returns:
+        list: Flight dictionaries in the AviationStack `data` format
+    """
+    rng = random.Random(seed)
+    now = datetime.now(timezone.utc)
+    status_names = [s for s, _ in STATUSES]
+    status_weights = [w for _, w in STATUSES]
+    flights = []
+
+    for _ in range(count):
+        iata, icao, name = rng.choice(AIRLINES)
+        number = str(rng.randint(100, 9999))
+        dep_iata = rng.choice(AIRPORTS)
+        arr_iata = rng.choice([a for a in AIRPORTS if a != dep_iata])
+        status = rng.choices(status_names, weights=status_weights)[0]
+
+        scheduled_dep = now - timedelta(minutes=rng.randint(0, hours * 60))
+        scheduled_arr = scheduled_dep + timedelta(minutes=rng.randint(50, 660))
+        # Most flights are on time; a long tail is delayed by 3+ hours
+        delay = rng.choices([0, rng.randint(1, 59), rng.randint(60, 179), rng.randint(180, 600)],
+                            weights=[55, 30, 12, 3])[0]
+        if status == "cancelled":
+            delay = None
+
+        def _ts(dt):
+            return dt.replace(microsecond=0).isoformat()
+
+        actual_dep = _ts(scheduled_dep + timedelta(minutes=delay)) if delay is not None and status != "scheduled" else None
+        actual_arr = _ts(scheduled_arr + timedelta(minutes=delay)) if delay is not None and status == "landed" else None
+
+        flights.append({
+            "flight_date": scheduled_dep.date().isoformat(),
+            "flight_status": status,
+            "departure": {
+                "airport": f"{dep_iata} International",
+                "timezone": "UTC",
+                "iata": dep_iata,
+                "icao": None,
+                "terminal": str(rng.randint(1, 5)),
+                "gate": None,
+                "delay": delay,
+                "scheduled": _ts(scheduled_dep),
+                "estimated": _ts(scheduled_dep),
+                "actual": actual_dep,
+            },
+            "arrival": {
+                "airport": f"{arr_iata} International",
+                "timezone": "UTC",
+                "iata": arr_iata,
+                "icao": None,
+                "terminal": str(rng.randint(1, 5)),
+                "gate": None,
+                "baggage": None,
+                "delay": delay,
+                "scheduled": _ts(scheduled_arr),
+                "estimated": _ts(scheduled_arr),
+                "actual": actual_arr,
+            },
+            "airline": {"name": name, "iata": iata, "icao": icao},
+            "flight": {"number": number, "iata": f"{iata}{number}", "icao": f"{icao}{number}", "codeshared": None},
+            "aircraft": None,
+            "live": None,
+        })
+
+    return flights
+
+
+def load_fixtures(path):
+    """
+    Load flights from a fixture file or a directory of recorded fixtures.
+
+    Accepts a raw AviationStack payload ({"data": [...]}), a plain list of flights, or
+    the {"endpoint", "params", "response"} files written by the client's record mode.
+    Duplicate flights across recordings are collapsed.
+
+    Args:
+        path: Fixture file or directory
+
+    Returns:
+        list: Flight dictionaries
+    """
+    files = []
+    if os.path.isdir(path):
+        files = [os.path.join(path, name) for name in sorted(os.listdir(path)) if name.endswith('.json')]
+    else:
+        files = [path]
+
+    flights = []
+    seen = set()
+    for file_path in files:
+        try:
+            with open(file_path, 'r') as f:
+                doc = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning(f"Skipping fixture {file_path}: {e}")
+            continue
+
+        if isinstance(doc, dict) and 'response' in doc:
+            doc = doc['response']
+        records = doc.get('data', []) if isinstance(doc, dict) else doc
+
+        for record in records or []:
+            if not isinstance(record, dict):
+                continue
+            key = (
+                (record.get('flight') or {}).get('iata'),
+                (record.get('departure') or {}).get('scheduled'),
+            )
+            if key in seen:
+                continue
+            seen.add(key)
+            flights.append(record)
+
+    logger.info(f"Loaded {len(flights)} fixture flights from {len(files)} file(s)")
+    return flights
+
+
+class FlightFixtureSet:
+    """
+    In-memory flight fixtures with lookup tables for the filterable fields, so
+    large fixture sets can be served at realistic request rates.
+    """
+    def __init__(self, flights):
+        self.flights = flights
+        self._by_field = {"arr_iata": {}, "dep_iata": {}, "flight_iata": {}}
+        for pos, flight in enumerate(flights):
+            keys = {
+                "arr_iata": (flight.get('arrival') or {}).get('iata'),
+                "dep_iata": (flight.get('departure') or {}).get('iata'),
+                "flight_iata": (flight.get('flight') or {}).get('iata'),
+            }
+            for field, value in keys.items():
+                if value:
+                    self._by_field[field].setdefault(value.upper(), []).append(pos)
+
+    def query(self, params):
+        """Return the flights matching the AviationStack-style filters in `params`."""
+        candidates = None
+        for field, table in self._by_field.items():
+            value = params.get(field)
+            if not value:
+                continue
+            positions = table.get(value.upper(), [])
+            candidates = positions if candidates is None else sorted(set(candidates) & set(positions))
+
+        flights = self.flights if candidates is None else [self.flights[pos] for pos in candidates]
+
+        status_param = params.get('flight_status')
+        if status_param:
+            wanted = {s.strip().lower() for s in status_param.split(',') if s.strip()}
+            flights = [f for f in flights if (f.get('flight_status') or '').lower() in wanted]
+
+        flight_date = params.get('flight_date')
+        if flight_date:
+            flights = [f for f in flights if f.get('flight_date') == flight_date]
+
+        return flights
+
+
+class StubConfig:
+    """Latency and fault injection settings shared by all request handler threads."""
+    def __init__(self, latency_ms=0, jitter_ms=0, error_rate=0.0, error_status=500, require_key=False, seed=None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.require_key = require_key
+        self.requests_served = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def next_delay_and_fault(self):
+        """Returns (seconds to sleep, whether to fail) for one request."""
+        with self._lock:
+            self.requests_served += 1
+            jitter = self._rng.uniform(-self.jitter_ms, self.jitter_ms) if self.jitter_ms else 0
+            fail = self.error_rate > 0 and self._rng.random() < self.error_rate
+        return max(0.0, (self.latency_ms + jitter) / 1000.0), fail
+
+
+def make_handler(fixtures, config):
+    """Build a request handler class bound to a fixture set and stub configuration."""
+
+    class AviationStackStubHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _send_json(self, status, payload):
+            body = json.dumps(payload).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            parsed = urllib.parse.urlsplit(self.path)
+            params = {k: v[0] for k, v in urllib.parse.parse_qs(parsed.query).items()}
+
+            delay, fail = config.next_delay_and_fault()
+            if delay:
+                time.sleep(delay)
+
+            if parsed.path.rstrip('/') != '/v1/flights':
+                self._send_json(404, {"error": {"code": "not_found", "message": "Unknown endpoint"}})
+                return
+
+            if config.require_key and not params.get('access_key'):
+                self._send_json(401, {"error": {"code": "missing_access_key", "message": "You have not supplied an API Access Key."}})
+                return
+
+            if fail:
+                self._send_json(config.error_status, {"error": {"code": "injected_error", "message": "Injected failure from stand-in server"}})
+                return
+
+            try:
+                limit = min(max(int(params.get('limit', MAX_LIMIT)), 1), MAX_LIMIT)
+                offset = max(int(params.get('offset', 0)), 0)
+            except ValueError:
+                self._send_json(422, {"error": {"code": "validation_error", "message": "limit and offset must be integers"}})
+                return
+
+            matches = fixtures.query(params)
+            page = matches[offset:offset + limit]
+            self._send_json(200, {
+                "pagination": {"limit": limit, "offset": offset, "count": len(page), "total": len(matches)},
+                "data": page,
+            })
+
+        def log_message(self, format, *args):
+            logger.debug("%s - %s", self.address_string(), format % args)
+
+    return AviationStackStubHandler
+
+
+class _StubHTTPServer(ThreadingHTTPServer):
+    # Benchmarks open hundreds of upstream connections at once; the default
+    # listen backlog of 5 would refuse most of them
+    request_queue_size = 256
+
+
+def make_server(host='127.0.0.1', port=8081, flights=None, config=None):
+    """
+    Create (but do not start) a threaded stand-in server.
+
+    Args:
+        host: Interface to bind
+        port: Port to bind; 0 picks a free port
+        flights: Flight records to serve; defaults to 2000 generated flights
+        config: StubConfig with latency and error injection settings
+
+    Returns:
+        ThreadingHTTPServer: Call serve_forever() or run it in a thread
+    """
+    fixtures = FlightFixtureSet(flights if flights is not None else generate_flights(2000, seed=0))
+    handler = make_handler(fixtures, config or StubConfig())
+    server = _StubHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local AviationStack stand-in server")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--fixtures', help="Fixture file or directory of recorded fixtures")
+    parser.add_argument('--generate', type=int, default=2000, help="Number of flights to generate when no fixtures are given")
+    parser.add_argument('--hours', type=int, default=72, help="Scheduling window for generated flights")
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--write-fixtures', help="Write the served flights to this file and continue")
+    parser.add_argument('--latency-ms', type=float, default=0)
+    parser.add_argument('--jitter-ms', type=float, default=0)
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Fraction of requests answered with --error-status")
+    parser.add_argument('--error-status', type=int, default=500)
+    parser.add_argument('--require-key', action='store_true', help="Reject requests without access_key")
+    args = parser.parse_args(argv)
+
+    if args.fixtures:
+        flights = load_fixtures(args.fixtures)
+    else:
+        flights = generate_flights(args.generate, hours=args.hours, seed=args.seed)
+        logger.info(f"Generated {len(flights)} flights")
+
+    if args.write_fixtures:
+        with open(args.write_fixtures, 'w') as f:
+            json.dump({"data": flights}, f)
+        logger.info(f"Wrote fixtures to {args.write_fixtures}")
+
+    config = StubConfig(args.latency_ms, args.jitter_ms, args.error_rate, args.error_status, args.require_key, args.seed)
+    server = make_server(args.host, args.port, flights, config)
+    logger.info(f"AviationStack stand-in listening on http://{args.host}:{server.server_address[1]}/v1/flights")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
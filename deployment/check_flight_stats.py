@@ -0,0 +1,46 @@
+"""
+Check Flight Stats Script
+-------------------------
+Consistency check for the statistics aggregates that FlightDataStorage maintains
+on every write: recomputes them from every stored flight and reports any field
+that differs from the maintained values.
+
+Run it after storage changes, or as a PythonAnywhere scheduled task:
+  python /home/PiotrS/deployment/check_flight_stats.py
+"""
+
+import sys
+import argparse
+import logging
+
+from flight_data_storage import FlightDataStorage
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger("check_flight_stats")
+
+def main():
+    parser = argparse.ArgumentParser(description="Validate maintained flight statistics against a full recompute")
+    parser.add_argument('--data-dir', help="Storage directory (default FLIGHT_DATA_DIR)")
+    args = parser.parse_args()
+
+    storage = FlightDataStorage(data_dir=args.data_dir)
+    try:
+        result = storage.verify_stats()
+    except Exception as e:
+        logger.error(f"Stats check failed: {e}")
+        return 1
+
+    if result["consistent"]:
+        logger.info(f"Statistics consistent with a full recompute (revision {result['revision']})")
+        return 0
+    for field, values in sorted(result["differences"].items()):
+        logger.error(f"{field}: maintained {values['maintained']}, recomputed {values['recomputed']}")
+    logger.error(f"{len(result['differences'])} statistics differ from a full recompute")
+    return 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,153 @@
+"""
+Circuit Breaker Module
+----------------------
+Stops calling an upstream service that is failing or too slow, so requests fail
+fast (and can fall back to stored data) instead of piling up on dead sockets.
+
+States:
+- closed: calls go through; outcomes are recorded in a sliding window
+- open: calls are rejected until the cool-down expires
+- half_open: a limited number of probe calls decide whether to close or re-open
+"""
+
+import time
+import threading
+import logging
+from collections import deque
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """
+    Sliding-window circuit breaker that trips on error rate or slow-call rate.
+    """
+    def __init__(self, name, failure_rate_threshold=0.5, slow_call_threshold=5.0,
+                 slow_call_rate_threshold=0.8, window_size=20, minimum_calls=5,
+                 open_seconds=30.0, half_open_max_calls=1, clock=time.monotonic):
+        """
+        Args:
+            name: Label used in logs and snapshots
+            failure_rate_threshold: Fraction of failed calls in the window that trips the breaker
+            slow_call_threshold: Seconds after which a successful call counts as slow
+            slow_call_rate_threshold: Fraction of slow calls in the window that trips the breaker
+            window_size: Number of most recent calls considered
+            minimum_calls: Calls required in the window before the rates are evaluated
+            open_seconds: Cool-down before a half-open probe is allowed
+            half_open_max_calls: Concurrent probe calls allowed while half-open
+            clock: Monotonic time source (injectable for tests)
+        """
+        self.name = name
+        self.failure_rate_threshold = failure_rate_threshold
+        self.slow_call_threshold = slow_call_threshold
+        self.slow_call_rate_threshold = slow_call_rate_threshold
+        self.minimum_calls = minimum_calls
+        self.open_seconds = open_seconds
+        self.half_open_max_calls = half_open_max_calls
+        self._clock = clock
+        self._lock = threading.Lock()
+        # Each entry is (failed, slow)
+        self._window = deque(maxlen=window_size)
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._half_open_calls = 0
+        self._rejected = 0
+        self._trips = 0
+
+    @property
+    def state(self):
+        with self._lock:
+            self._maybe_half_open()
+            return self._state
+
+    def _maybe_half_open(self):
+        if self._state == OPEN and self._clock() - self._opened_at >= self.open_seconds:
+            self._state = HALF_OPEN
+            self._half_open_calls = 0
+            logger.info(f"Circuit '{self.name}' half-open, probing upstream")
+
+    def _trip(self, reason):
+        self._state = OPEN
+        self._opened_at = self._clock()
+        self._half_open_calls = 0
+        self._trips += 1
+        logger.warning(f"Circuit '{self.name}' opened: {reason}")
+
+    def allow_request(self):
+        """
+        Ask permission for one upstream call. Every permitted call must be followed
+        by record_success() or record_failure(), or by release() if it is not made.
+
+        Returns:
+            bool: False if the call should be short-circuited
+        """
+        with self._lock:
+            self._maybe_half_open()
+            if self._state == CLOSED:
+                return True
+            if self._state == HALF_OPEN and self._half_open_calls < self.half_open_max_calls:
+                self._half_open_calls += 1
+                return True
+            self._rejected += 1
+            return False
+
+    def release(self):
+        """Give back a permission from allow_request() for a call that was never made."""
+        with self._lock:
+            if self._state == HALF_OPEN and self._half_open_calls > 0:
+                self._half_open_calls -= 1
+
+    def record_success(self, elapsed):
+        """Record a completed call that took `elapsed` seconds."""
+        slow = elapsed >= self.slow_call_threshold
+        with self._lock:
+            if self._state == HALF_OPEN:
+                if slow:
+                    self._trip(f"half-open probe took {elapsed:.2f}s")
+                else:
+                    self._state = CLOSED
+                    self._window.clear()
+                    logger.info(f"Circuit '{self.name}' closed, upstream recovered")
+                return
+            self._window.append((False, slow))
+            self._evaluate()
+
+    def record_failure(self, elapsed=0.0):
+        """Record a failed call (error, timeout or upstream 5xx/429)."""
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._trip("half-open probe failed")
+                return
+            self._window.append((True, elapsed >= self.slow_call_threshold))
+            self._evaluate()
+
+    def _evaluate(self):
+        if self._state != CLOSED or len(self._window) < self.minimum_calls:
+            return
+        calls = len(self._window)
+        failure_rate = sum(1 for failed, _ in self._window if failed) / calls
+        slow_rate = sum(1 for _, slow in self._window if slow) / calls
+        if failure_rate >= self.failure_rate_threshold:
+            self._trip(f"failure rate {failure_rate:.0%} over last {calls} calls")
+        elif slow_rate >= self.slow_call_rate_threshold:
+            self._trip(f"slow-call rate {slow_rate:.0%} over last {calls} calls")
+
+    def snapshot(self):
+        """Return the breaker state as a JSON-serialisable dictionary."""
+        with self._lock:
+            self._maybe_half_open()
+            calls = len(self._window)
+            return {
+                "name": self.name,
+                "state": self._state,
+                "window_calls": calls,
+                "window_failures": sum(1 for failed, _ in self._window if failed),
+                "window_slow_calls": sum(1 for _, slow in self._window if slow),
+                "rejected_calls": self._rejected,
+                "trips": self._trips,
+            }
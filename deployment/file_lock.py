@@ -0,0 +1,117 @@
+"""
+File Lock Module
+----------------
+Cross-process exclusive lock used to give the flight data file a single writer at
+a time across PythonAnywhere web workers, scheduled tasks and scripts.
+
+Uses fcntl.flock advisory locking where available (Linux/PythonAnywhere). On
+platforms without fcntl (Windows development machines) it falls back to a lock
+file created with O_EXCL that holds a lease; a lease older than `lease_seconds`
+is treated as abandoned by a crashed process and broken.
+"""
+
+import os
+import time
+import logging
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+
+class LockTimeout(Exception):
+    """The lock could not be acquired within the timeout."""
+
+
+class FileLock:
+    """
+    Exclusive inter-process lock on `<path>`.
+
+    Not re-entrant: acquiring it twice from the same thread deadlocks until timeout.
+    Usable as a context manager.
+    """
+    def __init__(self, path, timeout=30.0, lease_seconds=30.0, poll_interval=0.001):
+        """
+        Args:
+            path: Lock file path (created if missing)
+            timeout: Seconds to wait before raising LockTimeout
+            lease_seconds: Age after which a fallback lock file is considered stale
+            poll_interval: Initial sleep between attempts (backs off up to 10ms)
+        """
+        self.path = path
+        self.timeout = timeout
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self._fd = None
+        self.wait_seconds = 0.0
+
+    def _try_acquire(self):
+        if fcntl is not None:
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except (BlockingIOError, PermissionError):
+                os.close(fd)
+                return False
+            self._fd = fd
+            return True
+
+        try:
+            fd = os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+        except FileExistsError:
+            try:
+                age = time.time() - os.path.getmtime(self.path)
+            except OSError:
+                return False
+            if age > self.lease_seconds:
+                logger.warning(f"Breaking stale lock {self.path} ({age:.0f}s old)")
+                try:
+                    os.unlink(self.path)
+                except OSError:
+                    pass
+            return False
+        os.write(fd, f"{os.getpid()} {time.time()}\n".encode('ascii'))
+        self._fd = fd
+        return True
+
+    def acquire(self):
+        """
+        Block until the lock is held.
+
+        Raises:
+            LockTimeout: if it is still held elsewhere after `timeout` seconds
+        """
+        started = time.monotonic()
+        delay = self.poll_interval
+        while not self._try_acquire():
+            if time.monotonic() - started >= self.timeout:
+                raise LockTimeout(f"Timed out after {self.timeout}s waiting for {self.path}")
+            time.sleep(delay)
+            delay = min(delay * 2, 0.01)
+        self.wait_seconds = time.monotonic() - started
+
+    def release(self):
+        if self._fd is None:
+            return
+        fd, self._fd = self._fd, None
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+        else:
+            os.close(fd)
+            try:
+                os.unlink(self.path)
+            except OSError:
+                pass
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+        return False
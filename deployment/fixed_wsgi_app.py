@@ -1,10 +1,18 @@
 # fixed_wsgi_app.py - Updated WSGI application with fixes for 500 errors
-import json
 import os
 import logging
-from datetime import datetime, timedelta
-import urllib.parse
+from datetime import datetime, timedelta, date as calendar_date
 import sys
+import time
+import threading
+import hmac
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# Make sibling modules importable. Done once at import time; appending on every
+# request made sys.path grow for the lifetime of the worker.
+_APP_DIR = os.path.dirname(os.path.abspath(__file__))
+if _APP_DIR not in sys.path:
+    sys.path.insert(0, _APP_DIR)
 
 # Import EU airports module
 try:
@@ -14,6 +22,40 @@ except ImportError:
     logging.warning("EU airports module not found. Using basic eligibility checks.")
     EU_AIRPORTS_MODULE_LOADED = False
 
+# Import the shared AviationStack client registry
+try:
+    from aviationstack_client import get_client as get_aviationstack_client, UpstreamResult, upstream_outcomes, cached_responses, reset_client
+    AVIATIONSTACK_MODULE_LOADED = True
+except ImportError as e:
+    logging.warning(f"AviationStack client module not available: {e}")
+    AVIATIONSTACK_MODULE_LOADED = False
+
+import json_codec
+import flight_columns
+from wsgi_routing import Router, Response, HTTPError, ResponseCache, GzipMiddleware, error_mapper, cors, phase
+from wsgi_metrics import RequestMetrics
+from request_profiler import RequestProfiler
+from memory_diagnostics import MemoryDiagnostics
+import prefork
+from flight_index import FlightNumberIndex, is_fresh
+from flight_schema import status_of
+from flight_data_storage import FlightDataStorage, StorageConflictError
+from flight_changes import ChangesTruncated
+
+# Stored records younger than this answer /compensation-check without an upstream call
+COMPENSATION_CHECK_FRESHNESS_SECONDS = int(os.environ.get('COMPENSATION_CHECK_FRESHNESS_SECONDS', '1800'))
+# Days of departures held in the /compensation-check index; older dates read their day partition
+COMPENSATION_CHECK_INDEX_DAYS = int(os.environ.get('COMPENSATION_CHECK_INDEX_DAYS', '14'))
+# environ key of the UpstreamResult for /compensation-check when the ASGI entry point
+# (asgi_app) already looked the flight up asynchronously
+PREFETCHED_UPSTREAM = 'flight_api.upstream'
+
+def _aviationstack_client():
+    """Return the worker-wide AviationStack client (built once, reused by every request)."""
+    if not AVIATIONSTACK_MODULE_LOADED:
+        raise ImportError("aviationstack_client module not available")
+    return get_aviationstack_client()
+
 # Helper: check if any provided timestamp is within the last N hours
 def _is_within_hours(hours, *iso_timestamps):
     try:
@@ -44,47 +86,80 @@ logger = logging.getLogger(__name__)
 # Path for flight data storage
 DATA_FILE = "./data/flight_compensation_data.json"
 
-# Create data directory if it doesn't exist
-os.makedirs(os.path.dirname(DATA_FILE), exist_ok=True)
-
-# Initialize empty data if file doesn't exist
-if not os.path.exists(DATA_FILE):
-    with open(DATA_FILE, "w") as f:
-        json.dump({"flights": []}, f)
+# All reads and writes go through FlightDataStorage: writes append to its log,
+# reads come from its in-memory view, and an unreadable file is never re-initialised.
+_storage = FlightDataStorage(data_dir=os.path.dirname(os.path.abspath(DATA_FILE)),
+                             filename=os.path.basename(DATA_FILE))
 
 # Load flight data
-def load_flight_data():
-    try:
-        with open(DATA_FILE, "r") as f:
-            return json.load(f)
-    except (json.JSONDecodeError, FileNotFoundError):
-        return {"flights": []}
+def load_flight_data(strict=False):
+    return _storage.load(strict=strict)
 
-# Save flight data
+# Save flight data (refused if another writer saved since `data` was loaded)
 def save_flight_data(data):
-    with open(DATA_FILE, "w") as f:
-        json.dump(data, f, indent=2)
+    try:
+        return _storage.save(data)
+    except StorageConflictError as e:
+        logger.error(f"Not saving flight data: {e}")
+        return False
+
+# Stored flights departing or arriving in the last `hours` hours (or later) that pass
+# at least the basic eligibility test: 3h+ delay, cancelled, or flagged eligible.
+# Answered from the memory-mapped columnar snapshot without parsing stored JSON.
+def load_recent_candidates(hours, only_live=False, filters=None):
+    since = int(time.time()) - hours * 3600
+    return _storage.window_flights(since, any_flags=flight_columns.CANDIDATE,
+                                   all_flags=flight_columns.LIVE if only_live else 0,
+                                   filters=filters)
+
+# Query parameters narrowing /flights and /eligible_flights: airline, departure and
+# arrival airport IATA codes and status (case-insensitive), and minimum delay in minutes
+FLIGHT_FILTER_PARAMS = ("airline", "dep", "arr", "status", "min_delay")
+
+# Filters present in the query, as accepted by FlightDataStorage.window_flights
+# (raises ValueError if min_delay is not a number)
+def _flight_filters(params):
+    filters = {}
+    for name in FLIGHT_FILTER_PARAMS:
+        value = (params.get(name, [''])[0] or '').strip()
+        if value:
+            filters[name] = int(value) if name == 'min_delay' else value
+    return filters
+
+# Filters of a request, or a 400 invalid_filter error for an unparseable parameter
+def _request_filters(request):
+    try:
+        return _flight_filters(request.params)
+    except ValueError as e:
+        raise HTTPError('400 Bad Request', {"error": "invalid_filter", "message": str(e), "flights": []})
         
-# Process flights and return formatted JSON response
-def process_and_return_flights(raw_flights, start_response):
+# Process flights and return formatted JSON response. Stored records are in the
+# canonical flight_schema shape, so fields are read directly.
+def process_and_return_flights(raw_flights):
+    with phase('serialize'):
+        transformed_flights = _transform_eligible(raw_flights)
+
+    # Return results
+    return Response.json({
+        "flights": transformed_flights,
+        "count": len(transformed_flights),
+        "source": "database"
+    })
+
+def _transform_eligible(raw_flights):
     # Transform flight data to match what the app expects
     transformed_flights = []
     for flight in raw_flights:
-        # Skip flights without required fields
-        if not flight.get('flight') or not flight.get('departure') or not flight.get('arrival'):
+        # Skip flights without a flight number
+        if not flight['flight']:
             continue
             
         # Calculate if this flight is eligible for compensation (3+ hour delay or cancellation)
-        delay_minutes = flight.get('delay', 0)
-        
-        # FIX: Check flight status for cancellations - handle None status safely
-        status = flight.get('status')
-        # First check if status is None or empty, then call .lower() only if it's a valid string
-        status_lower = status.lower() if status else ""
-        is_cancelled = 'cancel' in status_lower  # Check if status contains 'cancelled' or similar
+        delay_minutes = flight['delay']
+        is_cancelled = 'CANCEL' in status_of(flight)
         
         # Flight is eligible if it has 3+ hour delay, is cancelled, or was already marked eligible
-        is_eligible = delay_minutes >= 180 or is_cancelled or flight.get('eligible_for_compensation', False)
+        is_eligible = delay_minutes >= 180 or is_cancelled or flight['eligible_for_compensation']
         
         # Calculate compensation amount based on distance
         compensation_amount = 0
@@ -98,54 +173,31 @@ def process_and_return_flights(raw_flights, start_response):
                 compensation_amount = 600  # Long haul
             
         transformed = {
-            'flight_number': flight.get('flight'),
-            'airline': flight.get('airline', {}).get('iata', 'Unknown'),
-            'departure_airport': flight.get('departure', {}).get('airport', {}).get('iata', 'Unknown'),
-            'arrival_airport': flight.get('arrival', {}).get('airport', {}).get('iata', 'Unknown'),
-            'departure_date': flight.get('departure', {}).get('scheduledTime', ''),
-            'arrival_date': flight.get('arrival', {}).get('scheduledTime', ''),
-            'status': 'Delayed' if delay_minutes > 0 else flight.get('status', 'Unknown'),
+            'flight_number': flight['flight'],
+            'airline': flight['airline']['iata'] or 'Unknown',
+            'departure_airport': flight['departure']['airport']['iata'] or 'Unknown',
+            'arrival_airport': flight['arrival']['airport']['iata'] or 'Unknown',
+            'departure_date': flight['departure']['scheduledTime'],
+            'arrival_date': flight['arrival']['scheduledTime'],
+            'status': 'Delayed' if delay_minutes > 0 else flight['status'],
             'delay_minutes': delay_minutes,
             'eligible_for_compensation': is_eligible,
             'compensation_amount_eur': compensation_amount,
             'distance_km': flight.get('distance_km', 2000)
         }
         transformed_flights.append(transformed)
-    
-    # Return results
-    response = json.dumps({
-        "flights": transformed_flights,
-        "count": len(transformed_flights),
-        "source": "database"
-    }).encode('utf-8')
-    
-    start_response('200 OK', [('Content-Type', 'application/json'),
-                            ('Access-Control-Allow-Origin', '*')])
-    return [response]
+    return transformed_flights
 
 # Add a flight to storage
 def add_flight(flight_data, source="API"):
     try:
-        data = load_flight_data()
-        
         # Add source information
         flight_data["source"] = source
         flight_data["added_at"] = datetime.now().isoformat()
-        
-        # Check if flight already exists to avoid duplicates
-        flight_exists = False
-        for existing_flight in data["flights"]:
-            if (existing_flight.get("flight") == flight_data.get("flight") and
-                existing_flight.get("departure", {}).get("scheduledTime") == 
-                flight_data.get("departure", {}).get("scheduledTime")):
-                flight_exists = True
-                break
-                
-        if not flight_exists:
-            data["flights"].append(flight_data)
-            save_flight_data(data)
-            return True
-        return False
+
+        # Appended to the storage write-ahead log under the writer lock, unless the
+        # same flight number is already stored for that departure date
+        return _storage.put_flights([flight_data], if_absent=True) > 0
     except Exception as e:
         logger.error(f"Error adding flight: {str(e)}")
         return False
@@ -209,9 +261,7 @@ def _map_avstack_to_internal(flight):
 # Refresh eligible flights from AviationStack and persist to local JSON cache
 def _refresh_eu_eligible_flights_from_aviationstack(hours=72):
     try:
-        sys.path.append(os.path.dirname(__file__))
-        from aviationstack_client import AviationStackClient
-        client = AviationStackClient()
+        client = _aviationstack_client()
     except Exception as e:
         logger.error(f"Cannot initialize AviationStack client: {str(e)}")
         return {'refreshed': False, 'added': 0, 'errors': 1, 'message': str(e)}
@@ -323,76 +373,277 @@ def _refresh_eu_eligible_flights_from_aviationstack(hours=72):
     logger.info(f"AviationStack refresh complete. Added {added} eligible flights, errors: {errors}")
     return {'refreshed': True, 'added': added, 'errors': errors}
 
-# WSGI application
-def application(environ, start_response):
-    path = environ.get('PATH_INFO', '').rstrip('/')
-    
-    # Log request for debugging
-    logger.info(f"Request path: {path}")
-    
-    if path == '' or path == '/':
-        # Parse query parameters to see if we need to return JSON instead of HTML
-        query_string = environ.get('QUERY_STRING', '')
-        params = urllib.parse.parse_qs(query_string)
-        
-        # Check if hours parameter exists - if so, treat as EU compensation request
-        if 'hours' in params:
-            logger.info("Root path with hours parameter - treating as EU compensation request")
+# Normalize an AviationStack API flight for /compensation-check
+def _normalize_avstack_for_check(f, flight_number):
+    dep = f.get('departure') or {}
+    arr = f.get('arrival') or {}
+    airline = f.get('airline') or {}
+    flight_field = f.get('flight') or {}
+
+    # Determine delay minutes
+    delay_minutes = 0
+    try:
+        d = dep.get('delay')
+        if isinstance(d, int):
+            delay_minutes = max(delay_minutes, d)
+    except Exception:
+        pass
+    try:
+        a = arr.get('delay')
+        if isinstance(a, int):
+            delay_minutes = max(delay_minutes, a)
+    except Exception:
+        pass
+
+    normalized = {
+        'flight_number': flight_field.get('iata') or flight_number,
+        'airline': airline.get('iata') or airline.get('name') or 'Unknown',
+        'departure_airport': dep.get('iata') or '',
+        'arrival_airport': arr.get('iata') or '',
+        'status': (f.get('flight_status') or '').upper(),
+        'delay_minutes': delay_minutes,
+    }
+    return normalized, airline.get('name')
+
+# Normalize a stored flight record (canonical flight_schema shape) for /compensation-check
+def _normalize_stored_for_check(record, flight_number):
+    airline = record['airline']
+    normalized = {
+        'flight_number': record['flight'] or flight_number,
+        'airline': airline['iata'] or airline.get('name') or 'Unknown',
+        'departure_airport': record['departure']['airport']['iata'],
+        'arrival_airport': record['arrival']['airport']['iata'],
+        'status': status_of(record),
+        'delay_minutes': record['delay'],
+    }
+    return normalized, airline.get('name')
+
+# Flight number + date index over recently departed and upcoming stored flights, rebuilt
+# only when the stored data changes. Held as one (generation, index) tuple so it is swapped atomically.
+_flight_index_cache = (None, None)
+
+def _stored_flight_index():
+    global _flight_index_cache
+    generation = _storage.generation
+    cached_generation, index = _flight_index_cache
+    if index is None or cached_generation != generation:
+        since = (datetime.utcnow() - timedelta(days=COMPENSATION_CHECK_INDEX_DAYS)).date()
+        index = FlightNumberIndex(_storage.flights_since(since))
+        logger.info(f"Built flight number index with {len(index)} entries")
+        _flight_index_cache = (generation, index)
+    return index, _storage.last_modified
+
+# Optional date of a /compensation-check as YYYY-MM-DD ('' if absent); ValueError if not a date.
+# It selects a storage partition file, so it is never passed on unparsed.
+def _check_date(value):
+    value = (value or '').strip()
+    return calendar_date.fromisoformat(value).isoformat() if value else ''
+
+# Find a stored record for a flight number (and optional YYYY-MM-DD date)
+def _find_stored_flight(flight_number, date=''):
+    return _lookup_stored_flight(flight_number, date)[0]
+
+def _lookup_stored_flight(flight_number, date=''):
+    index, file_mtime = _stored_flight_index()
+    record = index.lookup(flight_number, date)
+    if record is None and date:
+        # Departures older than the index window: scan just that day's partition
+        record = FlightNumberIndex(_storage.flights_on(date)).lookup(flight_number, date)
+    return record, file_mtime
+
+# Stored record that is fresh enough to answer /compensation-check locally, or None
+def _fresh_stored_flight(flight_number, date=''):
+    record, file_mtime = _lookup_stored_flight(flight_number, date)
+    if record is not None and is_fresh(record, COMPENSATION_CHECK_FRESHNESS_SECONDS, fallback_timestamp=file_mtime):
+        return record
+    return None
+
+# EU261 evaluation shared by the live and stored /compensation-check paths
+def _compensation_result(normalized, airline_name=None):
+    status = normalized['status']
+    delay_minutes = normalized['delay_minutes']
+    try:
+        if EU_AIRPORTS_MODULE_LOADED:
+            eligible = is_eligible_for_eu261(normalized)
+            compensation = calculate_eu261_compensation(normalized) if eligible else 0
+        else:
+            # Basic rule: 3+ hours delay or cancelled/diverted
+            is_cancelled = 'CANCEL' in status
+            is_diverted = 'DIVERT' in status
+            eligible = (delay_minutes >= 180) or is_cancelled or is_diverted
+            compensation = 400 if eligible else 0
+    except Exception as e:
+        logger.error(f"EU261 evaluation error: {e}")
+        eligible = delay_minutes >= 180 or 'CANCEL' in status or 'DIVERT' in status
+        compensation = 400 if eligible else 0
+
+    return {
+        'flight_number': normalized['flight_number'],
+        'airline': airline_name or normalized['airline'],
+        'status': status,
+        'departure_airport': normalized['departure_airport'],
+        'arrival_airport': normalized['arrival_airport'],
+        'delay_minutes': delay_minutes,
+        'is_eligible': bool(eligible),
+        'compensation_amount_eur': int(compensation) if isinstance(compensation, int) else 0,
+        'currency': 'EUR',
+        'eu_regulation_applies': True,
+    }
+
+# /compensation-check result for a stored record
+def _stored_check_result(record, flight_number, stale):
+    normalized, airline_name = _normalize_stored_for_check(record, flight_number)
+    result = _compensation_result(normalized, airline_name)
+    result['stale'] = stale
+    result['data_source'] = 'stored'
+    return result
+
+# Turn an AviationStack lookup into a (status line, payload) pair for /compensation-check
+def _check_result_from_upstream(upstream, flight_number, date=''):
+    if upstream.source == 'unavailable':
+        # AviationStack is down and nothing is cached: answer from stored flight data
+        stored = _find_stored_flight(flight_number, date)
+        if stored is None:
+            return '503 Service Unavailable', {
+                "eligible": False,
+                "message": "Flight data provider is temporarily unavailable. Please try again later.",
+                "error": "upstream_unavailable",
+                "stale": True
+            }
+        return '200 OK', _stored_check_result(stored, flight_number, stale=True)
+
+    flights = upstream.data or []
+
+    # Optionally filter by date (by flight_date or scheduled departure)
+    if date:
+        filtered = []
+        for f in flights:
             try:
-                # Get hours parameter with default
-                hours_param = params.get('hours', ['72'])[0]
-                try:
-                    hours = int(hours_param)
-                except ValueError:
-                    hours = 72
-                # Optional onlyLive filter
-                only_live_param = params.get('onlyLive', params.get('only_live', ['false']))[0].lower()
-                only_live = only_live_param in ('true', '1', 'yes')
-                
-                # Process like /eu-compensation-eligible
-                # Load all flights from the database
-                all_flights = load_flight_data().get("flights", [])
-                logger.info(f"Loaded {len(all_flights)} flights from database")
-                if only_live:
-                    before = len(all_flights)
-                    all_flights = [f for f in all_flights if f.get('source') == 'AviationStack']
-                    logger.info(f"Filtered to live flights only: {len(all_flights)} of {before} remain")
-                
-                # Add additional eligible flights based on delay criteria
-                eligible_flights = []
-                for flight in all_flights:
-                    # Skip flights without required fields
-                    if not flight.get('flight') or not flight.get('departure') or not flight.get('arrival'):
-                        continue
-                    # Time window filter (use dep or arr scheduledTime)
-                    dep_time = flight.get('departure', {}).get('scheduledTime')
-                    arr_time = flight.get('arrival', {}).get('scheduledTime')
-                    if not _is_within_hours(hours, dep_time, arr_time):
-                        continue
-                    
-                    # FIX: Safely handle None status
-                    delay = flight.get('delay', 0)
-                    # Check flight status for cancellations - fixed to handle None status
-                    status = flight.get('status')
-                    # First check if status is None or empty, then call .lower() only if it's a valid string
-                    is_cancelled = False
-                    if status:
-                        is_cancelled = 'cancel' in status.lower()  # Check if status contains 'cancelled' or similar
-                    
-                    # Mark as eligible if 3+ hour delay, cancellation, or already marked
-                    if delay >= 180 or is_cancelled or flight.get('eligible_for_compensation', False):
-                        eligible_flights.append(flight)
-                
-                # Process and return the flights as JSON
-                return process_and_return_flights(eligible_flights, start_response)
-                
-            except Exception as e:
-                logger.error(f"Error processing root path as EU compensation request: {str(e)}")
-                # Fall through to regular home page
-        
-        # Regular home page
-        start_response('200 OK', [('Content-Type', 'text/html')])
-        return [b"""
+                if ((f.get('flight_date') and date in str(f.get('flight_date'))) or
+                    (f.get('departure', {}).get('scheduled') and date in str(f['departure']['scheduled']))):
+                    filtered.append(f)
+            except Exception:
+                continue
+        flights = filtered
+
+    if not flights:
+        return '200 OK', {
+            "eligible": False,
+            "message": "No flight found for given number/date",
+            "stale": upstream.stale
+        }
+
+    # Take the most relevant flight (first)
+    normalized, airline_name = _normalize_avstack_for_check(flights[0], flight_number)
+    result = _compensation_result(normalized, airline_name)
+    # Tell the app whether this came from a stale cached response
+    result['stale'] = upstream.stale
+    result['data_source'] = upstream.source
+    return '200 OK', result
+
+# Batch limits for POST /compensation-check/batch
+COMPENSATION_BATCH_MAX_ITEMS = int(os.environ.get('COMPENSATION_BATCH_MAX_ITEMS', '100'))
+COMPENSATION_BATCH_CACHE_SECONDS = int(os.environ.get('COMPENSATION_BATCH_CACHE_SECONDS', '300'))
+_batch_executor = None
+_batch_executor_lock = threading.Lock()
+
+def _get_batch_executor(client):
+    # Sized to the quota manager so batch lookups never queue on more sockets than it allows
+    global _batch_executor
+    if _batch_executor is None:
+        with _batch_executor_lock:
+            if _batch_executor is None:
+                _batch_executor = ThreadPoolExecutor(max_workers=client.quota.max_concurrent,
+                                                     thread_name_prefix='compensation-batch')
+    return _batch_executor
+
+def _ndjson_line(index, item, result):
+    line = {"index": index, "request": item}
+    line.update(result)
+    return json_codec.dumps(line) + b"\n"
+
+# POST /compensation-check/batch: JSON list of {flight_number, date}; streams NDJSON results
+def _compensation_check_batch(request):
+    if request.method == 'OPTIONS':
+        return Response(b"", '204 No Content', [('Access-Control-Allow-Methods', 'POST, OPTIONS'),
+                                                ('Access-Control-Allow-Headers', 'Content-Type')])
+    if request.method != 'POST':
+        raise HTTPError('405 Method Not Allowed',
+                        {"error": "method_not_allowed", "message": "Use POST with a JSON list of flights"})
+
+    try:
+        length = int(request.environ.get('CONTENT_LENGTH') or 0)
+        body = json_codec.loads(request.environ['wsgi.input'].read(length) or b'null')
+    except (ValueError, KeyError) as e:
+        raise HTTPError('400 Bad Request', {"error": "invalid_json", "message": str(e)})
+
+    items = body.get('flights') if isinstance(body, dict) else body
+    if not isinstance(items, list):
+        raise HTTPError('400 Bad Request',
+                        {"error": "invalid_request", "message": "Expected a JSON list of {flight_number, date}"})
+    if len(items) > COMPENSATION_BATCH_MAX_ITEMS:
+        raise HTTPError('413 Payload Too Large', {"error": "too_many_flights", "max_items": COMPENSATION_BATCH_MAX_ITEMS})
+
+    return Response(_stream_batch_results(items), '200 OK', [('Content-Type', 'application/x-ndjson')])
+
+def _stream_batch_results(items):
+    # 1) Resolve what we can locally: invalid items, fresh stored records, recent upstream responses
+    pending = {}  # flight number -> [(index, item, date)]
+    try:
+        client = _aviationstack_client()
+    except Exception as e:
+        logger.error(f"AviationStack client error: {e}")
+        client = None
+
+    for index, item in enumerate(items):
+        flight_number = str((item or {}).get('flight_number') or '').strip() if isinstance(item, dict) else ''
+        if not flight_number:
+            yield _ndjson_line(index, item, {"eligible": False, "error": "missing_flight_number"})
+            continue
+        try:
+            date = _check_date(str(item.get('date') or ''))
+        except ValueError:
+            yield _ndjson_line(index, item, {"eligible": False, "error": "invalid_date"})
+            continue
+
+        stored = _fresh_stored_flight(flight_number, date)
+        if stored is not None:
+            yield _ndjson_line(index, item, _stored_check_result(stored, flight_number, stale=False))
+            continue
+
+        if client is not None:
+            cached = client.peek_cached('flights', {'flight_iata': flight_number}, COMPENSATION_BATCH_CACHE_SECONDS)
+            if cached is not None:
+                _, result = _check_result_from_upstream(UpstreamResult(cached, False, 'cache', None), flight_number, date)
+                yield _ndjson_line(index, item, result)
+                continue
+
+        pending.setdefault(flight_number.upper(), []).append((index, item, date))
+
+    if not pending:
+        return
+
+    if client is None:
+        for waiting in pending.values():
+            for index, item, date in waiting:
+                yield _ndjson_line(index, item, {"eligible": False, "error": "upstream_not_configured"})
+        return
+
+    # 2) One upstream lookup per distinct flight number, run concurrently under the quota manager
+    executor = _get_batch_executor(client)
+    futures = {executor.submit(client.lookup_flight, number): number for number in pending}
+    for future in as_completed(futures):
+        number = futures[future]
+        try:
+            upstream = future.result()
+        except Exception as e:
+            logger.error(f"Batch lookup failed for {number}: {e}")
+            upstream = UpstreamResult([], False, 'unavailable', type(e).__name__)
+        for index, item, date in pending[number]:
+            _, result = _check_result_from_upstream(upstream, number, date)
+            yield _ndjson_line(index, item, result)
+
+HOME_PAGE = b"""
         <html>
             <head>
                 <title>Flight Compensation API</title>
@@ -418,6 +669,7 @@ def application(environ, start_response):
                 <ul>
                     <li><a href="/compensation-check?flight_number=LO282&date=2024-03-15">Test Compensation Check</a></li>
                     <li><a href="/flights">View All Flights</a></li>
+                    <li><a href="/stats">Flight Statistics</a></li>
                     <li><a href="/eu-compensation-eligible?hours=72">EU Compensation Eligible Flights</a></li>
                     <li><a href="/?hours=72">EU Compensation Eligible Flights (Alternative)</a></li>
                     <li><a href="/test-aviationstack">Test AviationStack Connection</a></li>
@@ -425,333 +677,9 @@ def application(environ, start_response):
                 <p>Your Flutter app will connect to this API for both WiFi and mobile data connections.</p>
             </body>
         </html>
-        """]
-    
-    elif path == '/flights':
-        # Get all flights
-        data = load_flight_data()
-        raw_flights = data.get("flights", [])
-        
-        # Transform flight data to match what the app expects
-        transformed_flights = []
-        for flight in raw_flights:
-            # Skip flights without required fields
-            if not flight.get('flight') or not flight.get('departure') or not flight.get('arrival'):
-                continue
-                
-            transformed = {
-                'flight_number': flight.get('flight'),
-                'airline': flight.get('airline', {}).get('iata', 'Unknown'),
-                'departure_airport': flight.get('departure', {}).get('airport', {}).get('iata', 'Unknown'),
-                'arrival_airport': flight.get('arrival', {}).get('airport', {}).get('iata', 'Unknown'),
-                'departure_date': flight.get('departure', {}).get('scheduledTime', ''),
-                'arrival_date': flight.get('arrival', {}).get('scheduledTime', ''),
-                'status': flight.get('status', 'Unknown'),
-                'delay_minutes': flight.get('delay', 0),
-                'eligible_for_compensation': flight.get('eligible_for_compensation', False),
-                'compensation_amount_eur': flight.get('compensation_amount_eur', 0),
-                'distance_km': flight.get('distance_km', 0)
-            }
-            transformed_flights.append(transformed)
-        
-        response = json.dumps({"flights": transformed_flights}).encode('utf-8')
-        start_response('200 OK', [('Content-Type', 'application/json')])
-        return [response]
-    
-    elif path == '/compensation-check':
-        # Live ad-hoc eligibility check via AviationStack (server-side)
-        # Parse query parameters
-        query_string = environ.get('QUERY_STRING', '')
-        params = urllib.parse.parse_qs(query_string)
-
-        flight_number = (params.get('flight_number', [''])[0] or '').strip()
-        date = (params.get('date', [''])[0] or '').strip()  # optional YYYY-MM-DD
-
-        if not flight_number:
-            response = json.dumps({
-                "eligible": False,
-                "message": "Missing flight number",
-                "error": "missing_flight_number"
-            }).encode('utf-8')
-            start_response('400 Bad Request', [('Content-Type', 'application/json'), ('Access-Control-Allow-Origin', '*')])
-            return [response]
-
-        try:
-            # Initialize AviationStack client
-            try:
-                sys.path.append(os.path.dirname(__file__))
-                from aviationstack_client import AviationStackClient
-                client = AviationStackClient()
-            except Exception as e:
-                logger.error(f"AviationStack client error: {e}")
-                response = json.dumps({
-                    "eligible": False,
-                    "message": "AviationStack client not configured",
-                    "error": str(e)
-                }).encode('utf-8')
-                start_response('500 Internal Server Error', [('Content-Type', 'application/json'), ('Access-Control-Allow-Origin', '*')])
-                return [response]
-
-            # Fetch flights by number
-            flights = client.get_flight_by_number(flight_number) or []
-
-            # Optionally filter by date (by flight_date or scheduled departure)
-            if date:
-                filtered = []
-                for f in flights:
-                    try:
-                        if ((f.get('flight_date') and date in str(f.get('flight_date'))) or
-                            (f.get('departure', {}).get('scheduled') and date in str(f['departure']['scheduled']))):
-                            filtered.append(f)
-                    except Exception:
-                        continue
-                flights = filtered
-
-            if not flights:
-                response = json.dumps({
-                    "eligible": False,
-                    "message": "No flight found for given number/date"
-                }).encode('utf-8')
-                start_response('200 OK', [('Content-Type', 'application/json'), ('Access-Control-Allow-Origin', '*')])
-                return [response]
-
-            # Take the most relevant flight (first)
-            f = flights[0]
-
-            # Build a minimal structure for EU261 checks
-            dep = f.get('departure') or {}
-            arr = f.get('arrival') or {}
-            airline = f.get('airline') or {}
-            flight_field = f.get('flight') or {}
-
-            # Determine delay minutes
-            delay_minutes = 0
-            try:
-                d = dep.get('delay')
-                if isinstance(d, int):
-                    delay_minutes = max(delay_minutes, d)
-            except Exception:
-                pass
-            try:
-                a = arr.get('delay')
-                if isinstance(a, int):
-                    delay_minutes = max(delay_minutes, a)
-            except Exception:
-                pass
-
-            status = (f.get('flight_status') or '').upper()
-
-            # Compose a normalized flight for EU261 helpers
-            normalized = {
-                'flight_number': flight_field.get('iata') or flight_number,
-                'airline': airline.get('iata') or airline.get('name') or 'Unknown',
-                'departure_airport': dep.get('iata') or '',
-                'arrival_airport': arr.get('iata') or '',
-                'status': status,
-                'delay_minutes': delay_minutes,
-            }
-
-            # EU261 evaluation
-            try:
-                eu_applies = True  # Assume EU evaluation is applicable; helper determines specifics
-                if EU_AIRPORTS_MODULE_LOADED:
-                    eligible = is_eligible_for_eu261(normalized)
-                    compensation = calculate_eu261_compensation(normalized) if eligible else 0
-                else:
-                    # Basic rule: 3+ hours delay or cancelled/diverted
-                    is_cancelled = 'CANCEL' in status
-                    is_diverted = 'DIVERT' in status
-                    eligible = (delay_minutes >= 180) or is_cancelled or is_diverted
-                    compensation = 400 if eligible else 0
-            except Exception as e:
-                logger.error(f"EU261 evaluation error: {e}")
-                eligible = delay_minutes >= 180 or 'CANCEL' in status or 'DIVERT' in status
-                compensation = 400 if eligible else 0
-
-            result = {
-                'flight_number': normalized['flight_number'],
-                'airline': airline.get('name') or normalized['airline'],
-                'status': status,
-                'departure_airport': normalized['departure_airport'],
-                'arrival_airport': normalized['arrival_airport'],
-                'delay_minutes': delay_minutes,
-                'is_eligible': bool(eligible),
-                'compensation_amount_eur': int(compensation) if isinstance(compensation, int) else 0,
-                'currency': 'EUR',
-                'eu_regulation_applies': True,
-            }
-
-            response = json.dumps(result).encode('utf-8')
-            start_response('200 OK', [('Content-Type', 'application/json'), ('Access-Control-Allow-Origin', '*')])
-            return [response]
-
-        except Exception as e:
-            logger.error(f"Error in compensation check: {str(e)}")
-            response = json.dumps({
-                "eligible": False,
-                "error": str(e),
-                "message": "An error occurred while checking compensation eligibility."
-            }).encode('utf-8')
-            start_response('500 Internal Server Error', [('Content-Type', 'application/json'), ('Access-Control-Allow-Origin', '*')])
-            return [response]
-    
-    elif path == '/eu-compensation-eligible' or path == '/eligible_flights' or path == '/eligible-flights':
-        # New endpoint for EU-wide compensation eligible flights - optimized version
-        try:
-            # Parse query parameters
-            query_string = environ.get('QUERY_STRING', '')
-            params = urllib.parse.parse_qs(query_string)
-            
-            # Get hours parameter with default
-            hours_param = params.get('hours', ['24'])[0]
-            try:
-                hours = int(hours_param)
-            except ValueError:
-                hours = 24
-            
-            # Optional: only live flights (AviationStack-sourced)
-            only_live_param = params.get('onlyLive', params.get('only_live', ['false']))[0].lower()
-            only_live = only_live_param in ('true', '1', 'yes')
-            
-            # Optional: refresh cache from AviationStack when requested
-            refresh_param = params.get('refreshData', ['false'])[0].lower()
-            if refresh_param in ('true', '1', 'yes'):
-                logger.info("Refresh requested via query param: fetching from AviationStack before serving data")
-                try:
-                    _refresh_eu_eligible_flights_from_aviationstack(hours=hours)
-                except Exception as e:
-                    logger.error(f"Refresh failed: {str(e)}")
+        """
 
-            logger.info(f"Processing EU compensation request for last {hours} hours")
-            
-            # Load all flights from the database 
-            try:
-                # Use direct file access for maximum speed
-                all_flights = load_flight_data().get("flights", [])
-                logger.info(f"Loaded {len(all_flights)} flights from database")
-                
-                # Add additional eligible flights based on delay criteria
-                # This is faster than using the FlightDataStorage class
-                eligible_flights = []
-                for flight in all_flights:
-                    # Skip flights without required fields
-                    if not flight.get('flight') or not flight.get('departure') or not flight.get('arrival'):
-                        continue
-                        
-                    # Use enhanced EU261 eligibility check if module is loaded
-                    if EU_AIRPORTS_MODULE_LOADED:
-                        # Check using the comprehensive EU airport database
-                        is_eligible = is_eligible_for_eu261(flight)
-                        
-                        if is_eligible:
-                            # Calculate compensation amount using the enhanced module
-                            compensation_amount = calculate_eu261_compensation(flight)
-                            # Add compensation amount to flight data if not already present
-                            if 'compensation_amount_eur' not in flight:
-                                flight['compensation_amount_eur'] = compensation_amount
-                            # Mark as eligible
-                            flight['eligible_for_compensation'] = True
-                            eligible_flights.append(flight)
-                    else:
-                        # Fall back to basic eligibility check
-                        delay = flight.get('delay', 0)
-                        
-                        # FIX: Safely handle None status
-                        status = flight.get('status')
-                        # First check if status is None or empty, then call .lower() only if it's a valid string
-                        is_cancelled = False
-                        if status:
-                            is_cancelled = 'cancel' in status.lower()  # Check if status contains 'cancelled' or similar
-                        
-                        # Mark as eligible if 3+ hour delay, cancellation, or already marked
-                        if delay >= 180 or is_cancelled or flight.get('eligible_for_compensation', False):
-                            eligible_flights.append(flight)
-                
-                logger.info(f"Found {len(eligible_flights)} eligible flights in database")
-                
-                # Process and return the flights
-                return process_and_return_flights(eligible_flights, start_response)
-                
-            except Exception as e:
-                logger.error(f"Error accessing flight database: {str(e)}")
-                response = json.dumps({
-                    "error": str(e),
-                    "flights": [],
-                    "message": "Error accessing flight database. Please try again later."
-                }).encode('utf-8')
-                start_response('500 Internal Server Error', [
-                    ('Content-Type', 'application/json'),
-                    ('Access-Control-Allow-Origin', '*')
-                ])
-                return [response]
-        
-        except Exception as e:
-            logger.error(f"Error in EU compensation endpoint: {str(e)}")
-            response = json.dumps({
-                "error": str(e),
-                "flights": []
-            }).encode('utf-8')
-            start_response('500 Internal Server Error', [
-                ('Content-Type', 'application/json'),
-                ('Access-Control-Allow-Origin', '*')
-            ])
-            return [response]
-    
-    elif path == '/test-aviationstack':
-        # Test endpoint for AviationStack API
-        try:
-            # Import AviationStack client
-            try:
-                sys.path.append(os.path.dirname(__file__))  # Ensure module is in path
-                from aviationstack_client import AviationStackClient
-                client = AviationStackClient()
-            except ImportError as e:
-                logger.error(f"Error importing AviationStack client: {e}")
-                response = json.dumps({
-                    "success": False,
-                    "error": f"AviationStack client not available: {str(e)}"
-                }).encode('utf-8')
-                start_response('500 Internal Server Error', [('Content-Type', 'application/json')])
-                return [response]
-            
-            # Make a test request
-            test_flight = "LO282"
-            result = client.get_flight_by_number(test_flight)
-            
-            response = json.dumps({
-                "success": True,
-                "message": "Successfully connected to AviationStack API",
-                "test_flight": test_flight,
-                "results_count": len(result),
-                "sample_data": result[0] if result else None
-            }).encode('utf-8')
-            
-            start_response('200 OK', [('Content-Type', 'application/json')])
-            return [response]
-            
-        except Exception as e:
-            logger.error(f"Error testing AviationStack API: {str(e)}")
-            response = json.dumps({
-                "success": False,
-                "error": str(e)
-            }).encode('utf-8')
-            start_response('500 Internal Server Error', [('Content-Type', 'application/json')])
-            return [response]
-    
-    # Added health check endpoint
-    elif path == '/health' or path == '/ping':
-        start_response('200 OK', [('Content-Type', 'application/json')])
-        response = json.dumps({
-            "status": "ok",
-            "message": "API is healthy",
-            "version": "1.1"
-        }).encode('utf-8')
-        return [response]
-    
-    else:
-        # 404 Not Found
-        start_response('404 Not Found', [('Content-Type', 'text/html')])
-        return [b"""
+NOT_FOUND_PAGE = b"""
         <html>
             <head>
                 <title>404 Not Found</title>
@@ -766,7 +694,604 @@ def application(environ, start_response):
                 <p><a href="/">Return to home page</a></p>
             </body>
         </html>
-        """]
+        """
+
+# Hours parameter of a request, falling back to `default` when missing or not a number
+def _request_hours(request, default):
+    try:
+        return int(request.arg('hours', str(default)))
+    except ValueError:
+        return default
+
+# GET /: home page, or with ?hours=N the eligible flights like /eligible_flights
+def _home(request):
+    # Check if hours parameter exists - if so, treat as EU compensation request
+    if 'hours' in request.params:
+        logger.info("Root path with hours parameter - treating as EU compensation request")
+        try:
+            hours = _request_hours(request, 72)
+            # Optional onlyLive filter
+            only_live = request.flag('onlyLive', 'only_live')
+
+            # Process like /eu-compensation-eligible
+            # Candidates in the time window (and live-only if requested)
+            with phase('load'):
+                all_flights = load_recent_candidates(hours, only_live=only_live)
+            logger.info(f"Loaded {len(all_flights)} candidate flights from database")
+
+            # Add additional eligible flights based on delay criteria
+            eligible_flights = []
+            with phase('eligibility'):
+                for flight in all_flights:
+                    # Skip flights without a flight number
+                    if not flight['flight']:
+                        continue
+
+                    # Mark as eligible if 3+ hour delay, cancellation, or already marked
+                    if flight['delay'] >= 180 or 'CANCEL' in status_of(flight) or flight['eligible_for_compensation']:
+                        eligible_flights.append(flight)
+
+            # Process and return the flights as JSON
+            return process_and_return_flights(eligible_flights)
+
+        except Exception as e:
+            logger.error(f"Error processing root path as EU compensation request: {str(e)}")
+            # Fall through to regular home page
+
+    # Regular home page
+    return Response.html(HOME_PAGE)
+
+# GET /flights: all stored flights, optionally filtered
+def _flights(request):
+    filters = _request_filters(request)
+    if filters:
+        # Intersect the storage's posting lists instead of scanning every flight
+        with phase('filter'):
+            raw_flights = _storage.window_flights(flight_columns.NO_TIME, filters=filters)
+    else:
+        # Get all flights
+        with phase('load'):
+            raw_flights = load_flight_data().get("flights", [])
+
+    with phase('serialize'):
+        transformed_flights = _transform_stored(raw_flights)
+    return Response.json({"flights": transformed_flights})
+
+def _transform_stored(raw_flights):
+    # Transform flight data to match what the app expects
+    transformed_flights = []
+    for flight in raw_flights:
+        # Skip flights without a flight number
+        if not flight['flight']:
+            continue
+
+        transformed = {
+            'flight_number': flight['flight'],
+            'airline': flight['airline']['iata'] or 'Unknown',
+            'departure_airport': flight['departure']['airport']['iata'] or 'Unknown',
+            'arrival_airport': flight['arrival']['airport']['iata'] or 'Unknown',
+            'departure_date': flight['departure']['scheduledTime'],
+            'arrival_date': flight['arrival']['scheduledTime'],
+            'status': flight['status'],
+            'delay_minutes': flight['delay'],
+            'eligible_for_compensation': flight['eligible_for_compensation'],
+            'compensation_amount_eur': flight.get('compensation_amount_eur', 0),
+            'distance_km': flight.get('distance_km', 0)
+        }
+        transformed_flights.append(transformed)
+    return transformed_flights
+
+# GET /stats: running aggregates maintained by the storage on every write
+def _stats(request):
+    with phase('load'):
+        stats = _storage.get_stats()
+    return Response.json(stats, '500 Internal Server Error' if 'error' in stats else '200 OK')
+
+# GET /compensation-check: live ad-hoc eligibility check via AviationStack (server-side)
+def _compensation_check(request):
+    flight_number = request.arg('flight_number')
+
+    if not flight_number:
+        raise HTTPError('400 Bad Request', {
+            "eligible": False,
+            "message": "Missing flight number",
+            "error": "missing_flight_number"
+        })
+    try:
+        date = _check_date(request.arg('date'))  # optional YYYY-MM-DD
+    except ValueError:
+        raise HTTPError('400 Bad Request', {
+            "eligible": False,
+            "message": "Invalid date, expected YYYY-MM-DD",
+            "error": "invalid_date"
+        })
+
+    try:
+        # Local first: a fresh stored record answers without touching AviationStack
+        with phase('load'):
+            stored = _fresh_stored_flight(flight_number, date)
+        if stored is not None:
+            return Response.json(_stored_check_result(stored, flight_number, stale=False))
+
+        # Initialize AviationStack client
+        try:
+            client = _aviationstack_client()
+        except Exception as e:
+            logger.error(f"AviationStack client error: {e}")
+            return Response.json({
+                "eligible": False,
+                "message": "AviationStack client not configured",
+                "error": str(e)
+            }, '500 Internal Server Error')
+
+        # Fetch flights by number (under the quota manager and circuit breaker),
+        # unless the ASGI entry point already did without holding this thread
+        upstream = request.environ.get(PREFETCHED_UPSTREAM)
+        if upstream is None:
+            with phase('upstream'):
+                upstream = client.lookup_flight(flight_number)
+        with phase('eligibility'):
+            status_line, result = _check_result_from_upstream(upstream, flight_number, date)
+        headers = [('Retry-After', '30')] if status_line.startswith('503') else []
+        return Response.json(result, status_line, headers)
+
+    except Exception as e:
+        logger.error(f"Error in compensation check: {str(e)}")
+        return Response.json({
+            "eligible": False,
+            "error": str(e),
+            "message": "An error occurred while checking compensation eligibility."
+        }, '500 Internal Server Error')
+
+# GET /eligible_flights (and aliases): EU-wide compensation eligible flights
+def _eligible_flights(request):
+    hours = _request_hours(request, 24)
+
+    # Optional: airline / airport / status / delay filters
+    filters = _request_filters(request)
+
+    # Optional: refresh cache from AviationStack when requested
+    if request.flag('refreshData'):
+        logger.info("Refresh requested via query param: fetching from AviationStack before serving data")
+        try:
+            with phase('upstream'):
+                _refresh_eu_eligible_flights_from_aviationstack(hours=hours)
+        except Exception as e:
+            logger.error(f"Refresh failed: {str(e)}")
+
+    logger.info(f"Processing EU compensation request for last {hours} hours")
+
+    # Candidates in the time window
+    try:
+        with phase('filter' if filters else 'load'):
+            # Read before the flights: /eligible_flights/changes from this version
+            # repeats anything written meanwhile rather than missing it
+            version = _storage.revision
+            all_flights = load_recent_candidates(hours, filters=filters)
+        logger.info(f"Loaded {len(all_flights)} candidate flights from database")
+
+        # Add additional eligible flights based on delay criteria
+        with phase('eligibility'):
+            eligible_flights = _eligible_candidates(all_flights)
+        logger.info(f"Found {len(eligible_flights)} eligible flights in database")
+
+        # Process and return the flights
+        response = process_and_return_flights(eligible_flights)
+        response.set_header('X-Data-Version', str(version))
+        response.set_header('Access-Control-Expose-Headers', 'X-Data-Version')
+        return response
+
+    except Exception as e:
+        logger.error(f"Error accessing flight database: {str(e)}")
+        return Response.json({
+            "error": str(e),
+            "flights": [],
+            "message": "Error accessing flight database. Please try again later."
+        }, '500 Internal Server Error')
+
+# Candidates passing the EU261 check (or the basic one without the EU airports module)
+def _eligible_candidates(all_flights):
+    eligible_flights = []
+    for flight in all_flights:
+        # Skip flights without a flight number
+        if not flight['flight']:
+            continue
+
+        # Use enhanced EU261 eligibility check if module is loaded
+        if EU_AIRPORTS_MODULE_LOADED:
+            # Check using the comprehensive EU airport database
+            is_eligible = is_eligible_for_eu261(flight)
+
+            if is_eligible:
+                # Annotate a copy: the storage hands out its own records
+                flight = dict(flight)
+                # Calculate compensation amount using the enhanced module
+                compensation_amount = calculate_eu261_compensation(flight)
+                # Add compensation amount to flight data if not already present
+                if 'compensation_amount_eur' not in flight:
+                    flight['compensation_amount_eur'] = compensation_amount
+                # Mark as eligible
+                flight['eligible_for_compensation'] = True
+                eligible_flights.append(flight)
+        else:
+            # Fall back to basic eligibility check: 3+ hour delay, cancellation, or already marked
+            if flight['delay'] >= 180 or 'CANCEL' in status_of(flight) or flight['eligible_for_compensation']:
+                eligible_flights.append(flight)
+    return eligible_flights
+
+# Server-Sent Events feed of eligible flight changes (GET /eligible_flights/stream):
+# seconds between checks for new writes, between keep-alive comments, and before the
+# server ends a stream (the client reconnects with Last-Event-ID)
+ELIGIBLE_STREAM_POLL_SECONDS = float(os.environ.get('ELIGIBLE_STREAM_POLL_SECONDS', '2'))
+ELIGIBLE_STREAM_HEARTBEAT_SECONDS = float(os.environ.get('ELIGIBLE_STREAM_HEARTBEAT_SECONDS', '15'))
+ELIGIBLE_STREAM_MAX_SECONDS = float(os.environ.get('ELIGIBLE_STREAM_MAX_SECONDS', '120'))
+# Served by a plain WSGI server, an open stream holds a worker thread even while it
+# waits: such streams end after a few seconds (clients reconnect after the retry
+# delay), and at most ELIGIBLE_STREAM_WSGI_LIMIT are open per process - more are
+# refused with 503 so the other endpoints keep their threads. 0 leaves streaming to
+# the ASGI entry point (asgi_app), which waits without a thread.
+ELIGIBLE_STREAM_WSGI_MAX_SECONDS = float(os.environ.get('ELIGIBLE_STREAM_WSGI_MAX_SECONDS', '5'))
+ELIGIBLE_STREAM_WSGI_LIMIT = int(os.environ.get('ELIGIBLE_STREAM_WSGI_LIMIT', '2'))
+_wsgi_stream_slots = threading.BoundedSemaphore(max(0, ELIGIBLE_STREAM_WSGI_LIMIT))
+# Changes read from the storage per check, and the client's reconnection delay
+ELIGIBLE_STREAM_BATCH = 500
+ELIGIBLE_STREAM_RETRY_MS = 3000
+# environ key set by a server that waits between checks itself (asgi_app): the stream
+# then yields b'' when it has nothing to send instead of sleeping in its thread
+STREAM_PACED_BY_SERVER = 'flight_api.stream_paced'
+
+# The /eligible_flights entry of a stored record (plus its storage key as "id"), or
+# None if the record is not eligible
+def _eligible_payload(key, record):
+    if record is None or not flight_columns.flags_of(flight_columns.row_values(record)) & flight_columns.CANDIDATE:
+        return None
+    eligible = _transform_eligible(_eligible_candidates([record]))
+    if not eligible:
+        return None
+    payload = eligible[0]
+    payload['id'] = key
+    return payload
+
+def _sse_event(event, data, event_id):
+    return f"event: {event}\nid: {event_id}\ndata: ".encode() + json_codec.dumps(data) + b"\n\n"
+
+# Storage changes (as changes_since returns them) as seen by an /eligible_flights
+# client: (kind, revision, key, payload) per changed key at its latest revision, where
+# kind is "inserted" (eligible now, was not a candidate), "updated" (eligible now and
+# before) or "removed" (a candidate before, not eligible now; payload None)
+def _eligible_changes(changes):
+    latest = {}
+    for change, record in changes:
+        earlier = latest.get(change.key)
+        latest[change.key] = (change, record, earlier[2] if earlier else change.before)
+    classified = []
+    for change, record, before in sorted(latest.values(), key=lambda item: item[0].revision):
+        was_candidate = before is not None and before & flight_columns.CANDIDATE
+        payload = _eligible_payload(change.key, record)
+        if payload is not None:
+            classified.append(("updated" if was_candidate else "inserted", change.revision, change.key, payload))
+        elif was_candidate:
+            classified.append(("removed", change.revision, change.key, None))
+    return classified
+
+# SSE events for storage changes: "flight" for inserted and updated, "removed" by id
+def _eligible_change_events(changes):
+    return [_sse_event('flight', payload, revision) if kind != "removed"
+            else _sse_event('removed', {"id": key}, revision)
+            for kind, revision, key, payload in _eligible_changes(changes)]
+
+def _eligible_event_stream(since, paced):
+    started = last_sent = time.monotonic()
+    max_seconds = ELIGIBLE_STREAM_MAX_SECONDS if paced else ELIGIBLE_STREAM_WSGI_MAX_SECONDS
+    yield f"retry: {ELIGIBLE_STREAM_RETRY_MS}\n\n".encode() + _sse_event('ready', {"version": since}, since)
+    while time.monotonic() - started < max_seconds:
+        try:
+            changes, revision = _storage.changes_since(since, limit=ELIGIBLE_STREAM_BATCH)
+        except ChangesTruncated as e:
+            # Too far behind for the change log: re-read /eligible_flights, then carry on from here
+            since = e.revision
+            yield _sse_event('resync', {"version": e.revision, "reason": "changes_truncated"}, e.revision)
+            last_sent = time.monotonic()
+            continue
+        events = _eligible_change_events(changes)
+        if events:
+            yield b''.join(events)
+            last_sent = time.monotonic()
+        if len(changes) == ELIGIBLE_STREAM_BATCH:
+            since = changes[-1][0].revision
+            continue
+        since = revision
+        if time.monotonic() - last_sent >= ELIGIBLE_STREAM_HEARTBEAT_SECONDS:
+            yield b": keep-alive\n\n"
+            last_sent = time.monotonic()
+        if paced:
+            yield b''
+        else:
+            time.sleep(max(0.0, min(ELIGIBLE_STREAM_POLL_SECONDS, max_seconds - (time.monotonic() - started))))
+
+# GET /eligible_flights/stream: Server-Sent Events of flights that became eligible or
+# changed ("flight", same fields as /eligible_flights plus "id") and of flights no
+# longer eligible ("removed"), as the refresh pipeline writes them. Event ids are
+# storage revisions: Last-Event-ID (or ?last_event_id=) resumes after one; without
+# it the stream starts at the current data. "resync" means the id is too old: re-read
+# /eligible_flights. Time windows are left to the client.
+def _eligible_flights_stream(request):
+    last_event_id = request.header('Last-Event-ID') or request.arg('last_event_id')
+    if last_event_id:
+        try:
+            since = int(last_event_id)
+        except ValueError:
+            raise HTTPError('400 Bad Request', {"error": "invalid_last_event_id", "message": "Expected a revision number"})
+    else:
+        since = _storage.revision
+    paced = bool(request.environ.get(STREAM_PACED_BY_SERVER))
+    if not paced:
+        if not _wsgi_stream_slots.acquire(blocking=False):
+            raise HTTPError('503 Service Unavailable', {
+                "error": "too_many_streams",
+                "message": "Too many open streams in this worker; retry, or poll /eligible_flights/changes",
+            }, [('Retry-After', str(int(ELIGIBLE_STREAM_WSGI_MAX_SECONDS) + 1))])
+        request.on_close(lambda sent, seconds: _wsgi_stream_slots.release())
+    return Response(_eligible_event_stream(since, paced), '200 OK', [
+        ('Content-Type', 'text/event-stream'),
+        ('Cache-Control', 'no-cache'),
+        ('X-Accel-Buffering', 'no'),
+    ])
+
+# Most changes one /eligible_flights/changes response carries (?limit=, default 1000)
+ELIGIBLE_CHANGES_MAX_LIMIT = 5000
+
+# GET /eligible_flights/changes?since=<version>: what changed for /eligible_flights
+# since a data version - "inserted" and "updated" entries (same fields as
+# /eligible_flights plus "id") and "removed" ids - and the "version" to pass next
+# time. "more" is true when the limit cut the list short: call again right away.
+# 410 Gone when the change journal no longer reaches back that far: re-read
+# /eligible_flights (its X-Data-Version header is the version to continue from).
+# The journal starts at the last compaction on disk, so every worker agrees on 410.
+def _eligible_flights_changes(request):
+    try:
+        since = int(request.arg('since'))
+        limit = min(max(int(request.arg('limit', '1000')), 1), ELIGIBLE_CHANGES_MAX_LIMIT)
+    except ValueError:
+        raise HTTPError('400 Bad Request', {"error": "invalid_parameter",
+                                            "message": "since (a data version) and limit must be integers"})
+    try:
+        with phase('load'):
+            changes, version = _storage.changes_since(since, limit=limit)
+    except ChangesTruncated as e:
+        raise HTTPError('410 Gone', {
+            "error": "changes_truncated",
+            "message": "Changes since this version are no longer available; re-read the full list",
+            "since": since,
+            "oldest_version": e.floor,
+            "version": e.revision,
+            "resync": "/eligible_flights",
+        })
+    more = len(changes) == limit
+    if more:
+        version = changes[-1][0].revision
+    result = {"since": since, "version": version, "more": more, "inserted": [], "updated": [], "removed": []}
+    with phase('eligibility'):
+        for kind, _, key, payload in _eligible_changes(changes):
+            result[kind].append(key if kind == "removed" else payload)
+    return Response.json(result)
+
+# GET /test-aviationstack: test request against the AviationStack API
+def _test_aviationstack(request):
+    try:
+        # Shared AviationStack client
+        try:
+            client = _aviationstack_client()
+        except ImportError as e:
+            logger.error(f"Error importing AviationStack client: {e}")
+            return Response.json({
+                "success": False,
+                "error": f"AviationStack client not available: {str(e)}"
+            }, '500 Internal Server Error')
+
+        # Make a test request
+        test_flight = "LO282"
+        result = client.get_flight_by_number(test_flight)
+
+        return Response.json({
+            "success": True,
+            "message": "Successfully connected to AviationStack API",
+            "test_flight": test_flight,
+            "results_count": len(result),
+            "sample_data": result[0] if result else None,
+            "circuit": client.breaker.snapshot()
+        })
+
+    except Exception as e:
+        logger.error(f"Error testing AviationStack API: {str(e)}")
+        return Response.json({
+            "success": False,
+            "error": str(e)
+        }, '500 Internal Server Error')
+
+# GET /health, /ping
+def _health(request):
+    return Response.json({
+        "status": "ok",
+        "message": "API is healthy",
+        "version": "1.1"
+    })
+
+# GET /metrics: request metrics of every worker in Prometheus text format
+def _metrics(request):
+    return Response(request_metrics.render(), '200 OK', [('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')])
+
+# Admin endpoints answer only requests carrying X-Admin-Token: ADMIN_TOKEN,
+# and don't exist at all while ADMIN_TOKEN is unset.
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN', '')
+
+def _require_admin(request):
+    if not ADMIN_TOKEN:
+        raise HTTPError('404 Not Found', {"error": "not_found"})
+    # Compared as bytes: compare_digest rejects str with non-ASCII characters
+    if not hmac.compare_digest(request.header('X-Admin-Token').encode(), ADMIN_TOKEN.encode()):
+        raise HTTPError('403 Forbidden', {"error": "forbidden", "message": "Missing or wrong X-Admin-Token"})
+
+# GET /admin/profiles: stored request profiles, newest first (?route=, ?id=)
+def _admin_profiles(request):
+    _require_admin(request)
+    profiles = request_profiler.profiles(route=request.arg('route') or None,
+                                         profile_id=request.arg('id') or None)
+    return Response.json({"enabled": request_profiler.enabled, "count": len(profiles), "profiles": profiles})
+
+# Admin memory diagnostics of the worker serving the request (see memory_diagnostics);
+# snapshots live in one worker, so compare them through the same process.
+# Deepest traceback /admin/memory/start records (tracemalloc cost grows with the depth)
+MEMORY_MAX_FRAMES = 64
+
+def _memory_int(request, name, default, maximum=None):
+    try:
+        value = max(0, int(request.arg(name, str(default))))
+    except ValueError:
+        raise HTTPError('400 Bad Request', {"error": "invalid_parameter", "parameter": name})
+    if maximum is not None and value > maximum:
+        raise HTTPError('400 Bad Request', {"error": "invalid_parameter", "parameter": name, "maximum": maximum})
+    return value
+
+# GET /admin/memory: RSS, tracemalloc state and cache sizes (?objects=N: top N object types)
+def _admin_memory(request):
+    _require_admin(request)
+    return Response.json(memory_diagnostics.report(object_types=_memory_int(request, 'objects', 0)))
+
+# POST /admin/memory/start (?frames=N), POST /admin/memory/stop: tracemalloc on/off
+def _admin_memory_start(request):
+    _require_admin(request)
+    return Response.json(memory_diagnostics.start(frames=max(1, _memory_int(request, 'frames', 1, MEMORY_MAX_FRAMES))))
+
+def _admin_memory_stop(request):
+    _require_admin(request)
+    return Response.json(memory_diagnostics.stop())
+
+# POST /admin/memory/snapshots?name=X: keep a named tracemalloc snapshot
+def _admin_memory_snapshot(request):
+    _require_admin(request)
+    name = request.arg('name') or datetime.utcnow().strftime('%Y%m%dT%H%M%S')
+    try:
+        return Response.json(memory_diagnostics.snapshot(name), '201 Created')
+    except RuntimeError as e:
+        raise HTTPError('409 Conflict', {"error": "not_tracing", "message": str(e)})
+
+# GET /admin/memory/diff?old=A&new=B: growth from snapshot A to B (or to now), by file:line
+def _admin_memory_diff(request):
+    _require_admin(request)
+    old = request.arg('old')
+    if not old:
+        raise HTTPError('400 Bad Request', {"error": "missing_parameter", "parameter": "old"})
+    try:
+        diff = memory_diagnostics.diff(old, request.arg('new') or None, top=_memory_int(request, 'top', 25))
+    except KeyError as e:
+        raise HTTPError('404 Not Found', {"error": "unknown_snapshot", "snapshot": e.args[0]})
+    except RuntimeError as e:
+        raise HTTPError('409 Conflict', {"error": "not_tracing", "message": str(e)})
+    return Response.json(diff)
+
+def _not_found(request):
+    return Response.html(NOT_FOUND_PAGE, '404 Not Found')
+
+# Log every request for debugging
+def _log_request(request, handler):
+    logger.info(f"Request path: {request.path}")
+    return handler(request)
+
+# Responses that only change with the stored data (and the clock, for time windows)
+# are cached for RESPONSE_CACHE_SECONDS; a refreshData request always goes upstream.
+RESPONSE_CACHE_SECONDS = float(os.environ.get('RESPONSE_CACHE_SECONDS', '30'))
+
+def _cacheable_eligible(request):
+    return not request.flag('refreshData')
+
+_router = Router(not_found=_not_found)
+_router.add('/', _home, name='home', cache=True)
+_router.add('/flights', _flights, cache=True)
+_router.add('/stats', _stats, cache=True)
+_router.add('/compensation-check/batch', _compensation_check_batch)
+_router.add('/compensation-check', _compensation_check)
+_router.add(['/eligible_flights', '/eu-compensation-eligible', '/eligible-flights'], _eligible_flights,
+            cache=_cacheable_eligible)
+_router.add('/eligible_flights/stream', _eligible_flights_stream)
+_router.add('/eligible_flights/changes', _eligible_flights_changes, cache=True)
+_router.add('/test-aviationstack', _test_aviationstack)
+_router.add(['/health', '/ping'], _health)
+_router.add('/metrics', _metrics)
+_router.add('/admin/profiles', _admin_profiles)
+_router.add('/admin/memory', _admin_memory)
+_router.add('/admin/memory/start', _admin_memory_start, methods=['POST'])
+_router.add('/admin/memory/stop', _admin_memory_stop, methods=['POST'])
+_router.add('/admin/memory/snapshots', _admin_memory_snapshot, methods=['POST'])
+_router.add('/admin/memory/diff', _admin_memory_diff)
+
+# Upstream AviationStack calls of this worker, for /metrics
+def _upstream_counters():
+    if not AVIATIONSTACK_MODULE_LOADED:
+        return {}
+    return {("upstream_calls_total", (("source", source), ("error", error))): calls
+            for (source, error), calls in upstream_outcomes().items()}
+
+# Per-worker metrics files, merged by whichever worker answers /metrics
+METRICS_DIR = os.environ.get('METRICS_DIR', os.path.join(_storage.data_dir, 'metrics'))
+
+# Request profiling: off unless PROFILE_REQUESTS is set; then a request is profiled
+# when it sends X-Profile-Token: PROFILE_TOKEN (default ADMIN_TOKEN) or falls in the
+# PROFILE_SAMPLE_RATE sample. Send Cache-Control: no-cache as well to profile the
+# handler rather than a cache hit.
+request_profiler = RequestProfiler(
+    enabled=os.environ.get('PROFILE_REQUESTS', '').lower() in ('1', 'true', 'yes'),
+    token=os.environ.get('PROFILE_TOKEN', ADMIN_TOKEN),
+    sample_rate=float(os.environ.get('PROFILE_SAMPLE_RATE', '0')),
+    top=int(os.environ.get('PROFILE_TOP', '25')),
+    per_route=int(os.environ.get('PROFILE_BUFFER', '20')),
+    directory=os.path.join(_storage.data_dir, 'profiles'),
+)
+
+# In-memory caches whose sizes /admin/memory reports
+memory_diagnostics = MemoryDiagnostics(sources={
+    "storage": _storage.cache_sizes,
+    "flight_index_entries": lambda: len(_flight_index_cache[1] or ()),
+    "response_cache_entries": lambda: len(response_cache),
+    "aviationstack_cached_responses": lambda: cached_responses() if AVIATIONSTACK_MODULE_LOADED else 0,
+    "sys_path_entries": lambda: len(sys.path),
+    "prefork": lambda: prefork.status(_storage),
+})
+
+# Middleware every request passes through, outermost first
+request_metrics = RequestMetrics(directory=METRICS_DIR, collectors=[_upstream_counters])
+response_cache = ResponseCache(ttl=RESPONSE_CACHE_SECONDS, version=lambda: _storage.generation)
+
+# WSGI application
+application = _router.wsgi([
+    request_metrics,
+    cors,
+    error_mapper,
+    _log_request,
+    response_cache,
+    request_profiler,
+    GzipMiddleware(),
+])
+
+# Build the AviationStack client (and its connection pool) at startup rather than
+# on the first request; an unconfigured key is reported again on use.
+if AVIATIONSTACK_MODULE_LOADED:
+    try:
+        get_aviationstack_client()
+    except Exception as e:
+        logger.warning(f"AviationStack client not initialised at startup: {e}")
+
+# Workers forked from a pre-forking master get their own connection pool and
+# start with empty request metrics and profiles
+if AVIATIONSTACK_MODULE_LOADED:
+    prefork.at_fork_in_child(reset_client)
+prefork.at_fork_in_child(request_metrics.reset)
+prefork.at_fork_in_child(request_profiler.reset)
+
+# PREFORK_WARM=1 (set by gunicorn.conf.py; for uWSGI set it in the environment):
+# read the whole dataset now, in the master, so workers start warm and share it
+if os.environ.get('PREFORK_WARM', '').lower() in ('1', 'true', 'yes'):
+    prefork.warm(_storage, builders=[_stored_flight_index])
 
 # For WSGI compatibility
 flask_app = application
@@ -0,0 +1,127 @@
+"""
+Flight Changes Module
+---------------------
+Bounded in-memory log of the record changes a FlightDataStorage applies, numbered
+by storage revision, so clients can be sent what changed since a revision instead
+of the whole dataset.
+
+Every write to the storage is a log entry carrying a revision that all processes
+agree on, and each process records the entries it replays; any worker can answer
+"what changed after revision N". The log is complete from `floor` on and holds at
+most `max_entries` changes. When full, it is first compacted - of several changes
+to one record only the newest is kept - and only if that does not free a quarter
+of it are the oldest changes truncated, moving the floor up. Installing a snapshot
+(a compaction, a full save or archiving) moves the floor to its revision, in the
+process that wrote it as in every other: the log lines before it are gone from
+disk. So the floor follows from the files alone - the snapshot revision, raised
+by truncation of the same entries in the same order - and every worker (with the
+same `max_entries`) gives the same answer. Asking for an older revision raises
+ChangesTruncated, and the client re-reads the full list.
+
+Entries hold the record key and the flight_columns flags before and after the write,
+not the record itself; readers look the current record up. A compacted entry's
+`before` combines the flags of every change folded into it, so a reader starting
+anywhere in that range still learns that the record was, at some point, a candidate.
+"""
+
+import logging
+from collections import deque, namedtuple
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# One applied write. before/after are the flight_columns flags of the record
+# (before is None when the write created it).
+Change = namedtuple('Change', ['revision', 'key', 'day', 'before', 'after'])
+
+DEFAULT_MAX_ENTRIES = 10000
+
+
+class ChangesTruncated(Exception):
+    """The change log does not reach back to the requested revision."""
+    def __init__(self, since, floor, revision):
+        super().__init__(f"Changes since revision {since} are no longer available (log starts at {floor})")
+        self.since = since
+        self.floor = floor
+        self.revision = revision
+
+
+class ChangeLog:
+    """
+    Changes by ascending revision (see module docstring). Not thread-safe: the
+    storage calls it under its cache lock.
+    """
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES):
+        """
+        Args:
+            max_entries: Changes kept; older ones are dropped and the floor moves up
+        """
+        self.max_entries = max_entries
+        self._entries = deque()
+        self.floor = 0     # revision the log is complete from
+        self.revision = 0  # latest revision seen
+
+    def __len__(self):
+        return len(self._entries)
+
+    def record(self, change):
+        """Append a change (revisions must increase)."""
+        self._entries.append(change)
+        self.revision = change.revision
+        if len(self._entries) > self.max_entries:
+            target = self.max_entries * 3 // 4
+            self.compact()
+            while len(self._entries) > target:
+                self.floor = self._entries.popleft().revision
+
+    def compact(self):
+        """
+        Fold every change into the newest change of the same record.
+
+        Returns:
+            int: Entries removed
+        """
+        newest = {}
+        for change in self._entries:
+            earlier = newest.get(change.key)
+            if earlier is not None:
+                before = (earlier.before or 0) | earlier.after | (change.before or 0)
+                change = change._replace(before=before)
+            newest[change.key] = change
+        removed = len(self._entries) - len(newest)
+        if removed:
+            self._entries = deque(sorted(newest.values(), key=lambda change: change.revision))
+        return removed
+
+    def advance(self, revision):
+        """Note a revision that changed no record."""
+        self.revision = max(self.revision, revision)
+
+    def reset(self, revision):
+        """Forget every change: the data was replaced wholesale at `revision`."""
+        if self._entries:
+            logger.info(f"Change log restarts at revision {revision} ({len(self._entries)} changes dropped)")
+        self._entries.clear()
+        self.floor = self.revision = revision
+
+    def since(self, revision, limit=None):
+        """
+        Changes after `revision`, oldest first.
+
+        Args:
+            revision: Last revision the caller has seen
+            limit: Return at most this many (the oldest ones)
+
+        Raises:
+            ChangesTruncated: `revision` is older than the floor, or newer than any
+                seen (from before the data was replaced)
+        """
+        if revision < self.floor or revision > self.revision:
+            raise ChangesTruncated(revision, self.floor, self.revision)
+        changes = []
+        for change in reversed(self._entries):
+            if change.revision <= revision:
+                break
+            changes.append(change)
+        changes.reverse()
+        return changes[:limit] if limit is not None else changes
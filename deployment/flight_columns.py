@@ -0,0 +1,643 @@
+"""
+Flight Columns Module
+---------------------
+Binary columnar snapshot of the flight dataset, memory-mapped by readers.
+
+FlightDataStorage writes it next to the JSON snapshot whenever it compacts. Workers
+mmap the file instead of parsing JSON, so they start instantly and share one copy
+through the page cache. Time-window and eligibility queries run directly over the
+columns, and airline/airport/status/delay filters over posting lists stored in
+the file; only the matching rows are turned back into flight dictionaries.
+
+Layout (native byte order, every section 8-byte aligned):
+- header: magic, byte-order mark, revision, row count, string count, string bytes
+- fixed-width columns (see COLUMNS), rows sorted by `window`
+- string table: uint32 offsets into a UTF-8 blob of the strings in sorted
+  order; string columns hold indexes into it, code 0 being the empty string
+- per INDEXES entry: key count, sorted key codes, uint32 start offsets and the
+  row numbers (ascending within each key) of every normalized value
+- delay index: rows sorted by delay, and the delays in that order
+- aggregates: byte length and JSON of the FlightStats of all rows
+"""
+
+import sys
+import json
+import mmap
+import array
+import bisect
+import struct
+import calendar
+import logging
+from datetime import datetime
+
+from flight_index import departure_time_of, flight_number_of
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+MAGIC = b"FLTCOLS3"
+_BYTE_ORDER_MARK = 0x01020304
+_HEADER = struct.Struct("=8sIqQQQ")
+
+# Epoch value of a missing or unparseable time
+NO_TIME = -(2 ** 63)
+
+# Bits of the `flags` column
+ELIGIBLE = 1      # stored eligible_for_compensation is true
+CANCELLED = 2     # status mentions a cancellation
+DELAYED_3H = 4    # delay of 180 minutes or more
+LIVE = 8          # fetched from AviationStack
+# Rows that can pass any of the app's eligibility checks
+CANDIDATE = ELIGIBLE | CANCELLED | DELAYED_3H
+
+# (name, array typecode, holds string codes)
+COLUMNS = (
+    ("window", "q", False),        # max(dep_epoch, arr_epoch): sort key for time windows
+    ("dep_epoch", "q", False),
+    ("arr_epoch", "q", False),
+    ("delay", "i", False),         # minutes
+    ("distance", "i", False),      # km, -1 if unknown
+    ("compensation", "i", False),  # EUR, -1 if not stored
+    ("flags", "B", False),
+    ("number", "I", True),
+    ("airline", "I", True),
+    ("dep_iata", "I", True),
+    ("arr_iata", "I", True),
+    ("dep_time", "I", True),
+    ("arr_time", "I", True),
+    ("status", "I", True),
+    ("source", "I", True),
+)
+_COLUMN_INDEX = {name: i for i, (name, _, _) in enumerate(COLUMNS)}
+
+# Query filter -> string column with a posting list per (normalized) value
+INDEXES = {
+    "number": "number",
+    "airline": "airline",
+    "dep": "dep_iata",
+    "arr": "arr_iata",
+    "status": "status",
+}
+_COUNT = struct.Struct("=Q")
+
+
+def _align(size):
+    return (size + 7) & ~7
+
+
+def epoch_of(timestamp):
+    """ISO timestamp as epoch seconds (naive times are UTC), or NO_TIME."""
+    if not timestamp:
+        return NO_TIME
+    try:
+        dt = datetime.fromisoformat(str(timestamp).replace('Z', '+00:00'))
+    except ValueError:
+        return NO_TIME
+    if dt.tzinfo is not None:
+        return int(dt.timestamp())
+    return calendar.timegm(dt.timetuple())
+
+
+def _int(value, default):
+    """Numeric field as an int32 column value."""
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or value != value:
+        return default
+    return max(-2 ** 31, min(int(value), 2 ** 31 - 1))
+
+
+def _iata(section):
+    airport = (section or {}).get('airport')
+    if isinstance(airport, dict):
+        return airport.get('iata') or ''
+    return airport if isinstance(airport, str) else ''
+
+
+def row_values(record):
+    """
+    Column values of one stored flight, in COLUMNS order (strings not yet encoded).
+    Also used to evaluate records that are not in a snapshot yet.
+    """
+    dep_time = departure_time_of(record)
+    arrival = record.get('arrival') or {}
+    arr_time = arrival.get('scheduledTime') or arrival.get('scheduled') or ''
+    dep_epoch, arr_epoch = epoch_of(dep_time), epoch_of(arr_time)
+    status = str(record.get('status') or '')
+    delay = _int(record.get('delay', record.get('delay_minutes', record.get('delayMinutes'))), 0)
+    airline = record.get('airline')
+    airline = (airline.get('iata') or '') if isinstance(airline, dict) else (airline or '')
+    source = str(record.get('source') or '')
+
+    flags = 0
+    if record.get('eligible_for_compensation') is True:
+        flags |= ELIGIBLE
+    if 'cancel' in status.lower():
+        flags |= CANCELLED
+    if delay >= 180:
+        flags |= DELAYED_3H
+    if source == 'AviationStack':
+        flags |= LIVE
+
+    return (max(dep_epoch, arr_epoch), dep_epoch, arr_epoch, delay,
+            _int(record.get('distance_km'), -1), _int(record.get('compensation_amount_eur'), -1), flags,
+            flight_number_of(record), str(airline), _iata(record.get('departure')),
+            _iata(arrival), dep_time, arr_time, status, source)
+
+
+def flags_of(values):
+    """The `flags` column of row_values() (or ColumnarSnapshot.values())."""
+    return values[_COLUMN_INDEX["flags"]]
+
+
+def index_key(name, value):
+    """Normalized posting-list key of a filter value (statuses lowercase, codes uppercase)."""
+    value = str(value or '').strip()
+    return value.lower() if name == "status" else value.upper()
+
+
+def matches(values, since_epoch, any_flags=0, all_flags=0, filters=None):
+    """
+    Whether row_values() output falls in the window, carries the requested flags
+    and passes `filters` (see ColumnarSnapshot.select_rows).
+    """
+    flags = values[_COLUMN_INDEX["flags"]]
+    if not (values[0] >= since_epoch
+            and (not any_flags or flags & any_flags)
+            and (flags & all_flags) == all_flags):
+        return False
+    for name, value in (filters or {}).items():
+        if name == "min_delay":
+            if values[_COLUMN_INDEX["delay"]] < value:
+                return False
+        elif index_key(name, values[_COLUMN_INDEX[INDEXES[name]]]) != index_key(name, value):
+            return False
+    return True
+
+
+class RecordIndex:
+    """
+    Inverted index over flight records that are not in a snapshot yet, updated
+    record by record: INDEXES value -> set of record keys.
+    """
+    def __init__(self):
+        self._records = {}  # key -> (row_values, record)
+        self._postings = {name: {} for name in INDEXES}
+
+    def __len__(self):
+        return len(self._records)
+
+    def __contains__(self, key):
+        return key in self._records
+
+    def put(self, key, record):
+        """Insert or replace the record stored under `key`."""
+        self.discard(key)
+        values = row_values(record)
+        self._records[key] = (values, record)
+        for name, column in INDEXES.items():
+            self._postings[name].setdefault(index_key(name, values[_COLUMN_INDEX[column]]), set()).add(key)
+
+    def discard(self, key):
+        entry = self._records.pop(key, None)
+        if entry is None:
+            return
+        for name, column in INDEXES.items():
+            value = index_key(name, entry[0][_COLUMN_INDEX[column]])
+            keys = self._postings[name][value]
+            keys.discard(key)
+            if not keys:
+                del self._postings[name][value]
+
+    def select(self, since_epoch=NO_TIME, any_flags=0, all_flags=0, filters=None):
+        """Records passing matches() with the same arguments."""
+        postings = [self._postings[name].get(index_key(name, value), set())
+                    for name, value in (filters or {}).items() if name != "min_delay"]
+        if postings:
+            postings.sort(key=len)
+            keys = postings[0].intersection(*postings[1:])
+        else:
+            keys = self._records
+        return [self._records[key][1] for key in keys
+                if matches(self._records[key][0], since_epoch, any_flags, all_flags, filters)]
+
+
+class FlightStats:
+    """
+    Additive aggregates over flights: totals, per airline / departure airport /
+    arrival airport (flights, eligible, compensation EUR), per status and a
+    histogram by scheduled departure hour (UTC). Records are added or removed one
+    at a time from their row_values(), so the totals can follow every write.
+    """
+    TOTALS = ("flights", "eligible", "cancelled", "delayed_3h", "compensation_eur")
+    GROUPS = (("by_airline", "airline"), ("by_departure_airport", "dep_iata"), ("by_arrival_airport", "arr_iata"))
+
+    def __init__(self):
+        self.totals = dict.fromkeys(self.TOTALS, 0)
+        self.groups = {name: {} for name, _ in self.GROUPS}  # name -> code -> [flights, eligible, compensation]
+        self.by_status = {}
+        self.by_hour = [[0, 0] for _ in range(24)]          # [flights, eligible] per departure hour
+
+    def add(self, values, sign=1):
+        """Count a record given its row_values() (sign=-1 removes it again)."""
+        flags = values[_COLUMN_INDEX["flags"]]
+        eligible = sign if flags & ELIGIBLE else 0
+        compensation = max(values[_COLUMN_INDEX["compensation"]], 0) * sign
+        totals = self.totals
+        totals["flights"] += sign
+        totals["eligible"] += eligible
+        totals["cancelled"] += sign if flags & CANCELLED else 0
+        totals["delayed_3h"] += sign if flags & DELAYED_3H else 0
+        totals["compensation_eur"] += compensation
+
+        for name, column in self.GROUPS:
+            group = self.groups[name]
+            code = index_key("airline", values[_COLUMN_INDEX[column]])
+            counts = group.setdefault(code, [0, 0, 0])
+            counts[0] += sign
+            counts[1] += eligible
+            counts[2] += compensation
+            if not any(counts):
+                del group[code]
+
+        status = index_key("status", values[_COLUMN_INDEX["status"]])
+        self.by_status[status] = self.by_status.get(status, 0) + sign
+        if not self.by_status[status]:
+            del self.by_status[status]
+
+        dep_epoch = values[_COLUMN_INDEX["dep_epoch"]]
+        if dep_epoch != NO_TIME:
+            hour = self.by_hour[(dep_epoch // 3600) % 24]
+            hour[0] += sign
+            hour[1] += eligible
+
+    def update(self, other):
+        """Add every count of another FlightStats."""
+        for name in self.TOTALS:
+            self.totals[name] += other.totals[name]
+        for name, _ in self.GROUPS:
+            group = self.groups[name]
+            for code, counts in other.groups[name].items():
+                merged = [a + b for a, b in zip(group.get(code, (0, 0, 0)), counts)]
+                if any(merged):
+                    group[code] = merged
+                else:
+                    group.pop(code, None)
+        for status, count in other.by_status.items():
+            self.by_status[status] = self.by_status.get(status, 0) + count
+            if not self.by_status[status]:
+                del self.by_status[status]
+        for hour, counts in zip(self.by_hour, other.by_hour):
+            hour[0] += counts[0]
+            hour[1] += counts[1]
+
+    def copy(self):
+        stats = FlightStats()
+        stats.update(self)
+        return stats
+
+    def to_dict(self):
+        """JSON-ready form (also the form stored in snapshots)."""
+        data = dict(self.totals)
+        for name, _ in self.GROUPS:
+            data[name] = {code: {"flights": n, "eligible": e, "compensation_eur": c}
+                          for code, (n, e, c) in sorted(self.groups[name].items())}
+        data["by_status"] = dict(sorted(self.by_status.items()))
+        data["by_hour"] = [{"hour": hour, "flights": n, "eligible": e} for hour, (n, e) in enumerate(self.by_hour)]
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        stats = cls()
+        for name in cls.TOTALS:
+            stats.totals[name] = data[name]
+        for name, _ in cls.GROUPS:
+            stats.groups[name] = {code: [c["flights"], c["eligible"], c["compensation_eur"]]
+                                  for code, c in data[name].items()}
+        stats.by_status = dict(data["by_status"])
+        stats.by_hour = [[h["flights"], h["eligible"]] for h in data["by_hour"]]
+        return stats
+
+    def __eq__(self, other):
+        return isinstance(other, FlightStats) and self.to_dict() == other.to_dict()
+
+
+def _postings(codes):
+    """(sorted key codes, start offsets, row numbers) grouping rows by code."""
+    groups = {}
+    for row, code in enumerate(codes):
+        groups.setdefault(code, []).append(row)
+    keys = sorted(groups)
+    starts = array.array('I', [0])
+    rows = array.array('I')
+    for code in keys:
+        rows.extend(groups[code])
+        starts.append(len(rows))
+    return array.array('I', keys), starts, rows
+
+
+def encode_snapshot(flights, revision):
+    """
+    Build the binary snapshot of `flights`.
+
+    Args:
+        flights: Iterable of stored flight dictionaries
+        revision: Storage revision the flights correspond to
+
+    Returns:
+        bytes
+    """
+    rows = sorted((row_values(f) for f in flights), key=lambda values: values[0])
+    stats = FlightStats()
+    for values in rows:
+        stats.add(values)
+    string_columns = [i for i, (_, _, is_string) in enumerate(COLUMNS) if is_string]
+    keys = {name: [index_key(name, row[_COLUMN_INDEX[column]]) for row in rows]
+            for name, column in INDEXES.items()}
+    # Sorted, so a string's code can be found by binary search ('' sorts first: code 0)
+    table = {''}
+    for i in string_columns:
+        table.update(row[i] for row in rows)
+    for values in keys.values():
+        table.update(values)
+    table = sorted(table)
+    strings = {value: code for code, value in enumerate(table)}
+
+    sections = []
+    for i, (name, typecode, is_string) in enumerate(COLUMNS):
+        if is_string:
+            values = [strings[row[i]] for row in rows]
+        else:
+            values = [row[i] for row in rows]
+        sections.append(array.array(typecode, values).tobytes())
+
+    encoded = [s.encode('utf-8') for s in table]
+    offsets = array.array('I', [0])
+    for s in encoded:
+        offsets.append(offsets[-1] + len(s))
+    blob = b''.join(encoded)
+    sections += [offsets.tobytes(), blob]
+
+    for name in INDEXES:
+        key_codes, starts, key_rows = _postings([strings[value] for value in keys[name]])
+        sections += [_COUNT.pack(len(key_codes)), key_codes.tobytes(), starts.tobytes(), key_rows.tobytes()]
+    delay = _COLUMN_INDEX["delay"]
+    by_delay = sorted(range(len(rows)), key=lambda row: rows[row][delay])
+    sections += [array.array('I', by_delay).tobytes(),
+                 array.array('i', [rows[row][delay] for row in by_delay]).tobytes()]
+    encoded_stats = json.dumps(stats.to_dict(), separators=(',', ':')).encode('utf-8')
+    sections += [_COUNT.pack(len(encoded_stats)), encoded_stats]
+
+    parts = [_HEADER.pack(MAGIC, _BYTE_ORDER_MARK, revision, len(rows), len(encoded), len(blob))]
+    for section in sections:
+        parts.append(b'\0' * (_align(sum(map(len, parts))) - sum(map(len, parts))))
+        parts.append(section)
+    return b''.join(parts)
+
+
+class ColumnarSnapshot:
+    """
+    Read-only, memory-mapped view of a snapshot written by encode_snapshot().
+    """
+    def __init__(self, path):
+        """
+        Args:
+            path: Snapshot file
+
+        Raises:
+            OSError: the file can't be opened
+            ValueError: it is not a snapshot this build can read
+        """
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._views = []
+        try:
+            self._map_sections()
+        except Exception:
+            self.close()
+            raise
+        self._decoded = {}
+
+    def _map_sections(self):
+        buffer = memoryview(self._mmap)
+        self._views.append(buffer)
+        if len(buffer) < _HEADER.size:
+            raise ValueError("truncated columnar snapshot")
+        magic, mark, revision, rows, string_count, blob_size = _HEADER.unpack_from(buffer)
+        if magic != MAGIC:
+            raise ValueError(f"snapshot format {magic!r} is not {MAGIC!r} (rewritten by the next compaction)")
+        if mark != _BYTE_ORDER_MARK:
+            raise ValueError(f"not a {sys.byteorder}-endian columnar snapshot")
+        self.revision = revision
+        self.rows = rows
+
+        offset = _align(_HEADER.size)
+        self._columns = {}
+        for name, typecode, _ in COLUMNS:
+            size = array.array(typecode).itemsize * rows
+            self._columns[name] = self._cast(buffer, offset, size, typecode)
+            offset = _align(offset + size)
+        offsets_size = 4 * (string_count + 1)
+        self._string_offsets = self._cast(buffer, offset, offsets_size, 'I')
+        offset = _align(offset + offsets_size)
+        self._blob = buffer[offset:offset + blob_size]
+        self._views.append(self._blob)
+        if offset + blob_size > len(buffer):
+            raise ValueError("truncated columnar snapshot")
+        offset = _align(offset + blob_size)
+        self._string_count = string_count
+
+        self._indexes = {}
+        for name in INDEXES:
+            if offset + _COUNT.size > len(buffer):
+                raise ValueError("truncated columnar snapshot")
+            key_count, = _COUNT.unpack_from(buffer, offset)
+            offset = _align(offset + _COUNT.size)
+            sections = []
+            for count in (key_count, key_count + 1, rows):
+                sections.append(self._cast(buffer, offset, 4 * count, 'I'))
+                offset = _align(offset + 4 * count)
+            self._indexes[name] = sections
+        self._by_delay = self._cast(buffer, offset, 4 * rows, 'I')
+        offset = _align(offset + 4 * rows)
+        self._sorted_delays = self._cast(buffer, offset, 4 * rows, 'i')
+        offset = _align(offset + 4 * rows)
+        if offset + _COUNT.size > len(buffer):
+            raise ValueError("truncated columnar snapshot")
+        stats_size, = _COUNT.unpack_from(buffer, offset)
+        offset = _align(offset + _COUNT.size)
+        if offset + stats_size > len(buffer):
+            raise ValueError("truncated columnar snapshot")
+        self._stats = FlightStats.from_dict(json.loads(bytes(buffer[offset:offset + stats_size])))
+
+    def _cast(self, buffer, offset, size, typecode):
+        if offset + size > len(buffer):
+            raise ValueError("truncated columnar snapshot")
+        view = buffer[offset:offset + size].cast(typecode)
+        self._views.append(view)
+        return view
+
+    def close(self):
+        """Release the mapping (no rows can be read afterwards)."""
+        for view in reversed(self._views):
+            view.release()
+        self._views = []
+        self._mmap.close()
+
+    def __len__(self):
+        return self.rows
+
+    @property
+    def nbytes(self):
+        """Size of the mapped file."""
+        return len(self._mmap)
+
+    def string(self, code):
+        value = self._decoded.get(code)
+        if value is None:
+            start, end = self._string_offsets[code], self._string_offsets[code + 1]
+            value = self._decoded[code] = bytes(self._blob[start:end]).decode('utf-8')
+        return value
+
+    def column(self, name):
+        """Zero-copy view of a column (string columns hold string codes)."""
+        return self._columns[name]
+
+    def code_of(self, value):
+        """String code of `value`, or None if the snapshot does not contain it."""
+        low, high = 0, self._string_count
+        while low < high:
+            mid = (low + high) // 2
+            if self.string(mid) < value:
+                low = mid + 1
+            else:
+                high = mid
+        if low < self._string_count and self.string(low) == value:
+            return low
+        return None
+
+    def posting(self, name, value):
+        """Ascending rows whose INDEXES[name] column normalizes to `value` (zero-copy)."""
+        key_codes, starts, rows = self._indexes[name]
+        code = self.code_of(index_key(name, value))
+        if code is None:
+            return rows[0:0]
+        i = bisect.bisect_left(key_codes, code)
+        if i == len(key_codes) or key_codes[i] != code:
+            return rows[0:0]
+        return rows[starts[i]:starts[i + 1]]
+
+    def delay_rows(self, min_delay):
+        """Rows delayed by at least `min_delay` minutes (in delay order, not row order)."""
+        return self._by_delay[bisect.bisect_left(self._sorted_delays, min_delay):]
+
+    def select_rows(self, since_epoch=NO_TIME, any_flags=0, all_flags=0, filters=None):
+        """
+        Rows matching a time window, flag bits and equality filters.
+
+        Posting lists of the filters are intersected smallest first, checking
+        membership in the others by binary search, so the cost follows the most
+        selective filter rather than the dataset size.
+
+        Args:
+            since_epoch: Window start, epoch seconds
+            any_flags: Only rows with at least one of these flag bits
+            all_flags: Only rows with all of these flag bits
+            filters: Optional {INDEXES name: value, "min_delay": minutes}
+
+        Returns:
+            list: Row numbers, ascending
+        """
+        start = bisect.bisect_left(self._columns["window"], since_epoch) if since_epoch > NO_TIME else 0
+        filters = filters or {}
+        postings = [self.posting(name, value) for name, value in filters.items() if name != "min_delay"]
+        min_delay = filters.get("min_delay")
+        if min_delay is not None:
+            delayed = self.delay_rows(min_delay)
+            if not postings or len(delayed) < min(map(len, postings)):
+                postings.append(sorted(delayed))
+                min_delay = None
+        flags = self._columns["flags"]
+        if not postings and min_delay is None:
+            return [row for row in range(start, self.rows)
+                    if (not any_flags or flags[row] & any_flags) and (flags[row] & all_flags) == all_flags]
+
+        delay = self._columns["delay"]
+        if postings:
+            postings.sort(key=len)
+            smallest, others = postings[0], postings[1:]
+            candidates = smallest[bisect.bisect_left(smallest, start):]
+        else:
+            others = []
+            candidates = range(start, self.rows)
+
+        selected = []
+        for row in candidates:
+            if any_flags and not flags[row] & any_flags or (flags[row] & all_flags) != all_flags:
+                continue
+            if min_delay is not None and delay[row] < min_delay:
+                continue
+            for posting in others:
+                i = bisect.bisect_left(posting, row)
+                if i == len(posting) or posting[i] != row:
+                    break
+            else:
+                selected.append(row)
+        return selected
+
+    def window_rows(self, since_epoch, any_flags=0, all_flags=0):
+        """
+        Rows whose scheduled departure or arrival is at or after `since_epoch`.
+
+        Args:
+            since_epoch: Window start, epoch seconds
+            any_flags: Only rows with at least one of these flag bits
+            all_flags: Only rows with all of these flag bits
+
+        Returns:
+            list: Row numbers
+        """
+        return self.select_rows(since_epoch, any_flags, all_flags)
+
+    def key(self, row):
+        """flight_index.record_key() of a row."""
+        return f"{self.string(self._columns['number'][row])}|{self.string(self._columns['dep_time'][row])[:10]}"
+
+    def find(self, key):
+        """Row stored under a flight_index.record_key(), or None."""
+        number = key.partition('|')[0]
+        for row in self.posting("number", number):
+            if self.key(row) == key:
+                return row
+        return None
+
+    def values(self, row):
+        """row_values() of the record a row was built from."""
+        return tuple(self.string(self._columns[name][row]) if is_string else self._columns[name][row]
+                     for name, _, is_string in COLUMNS)
+
+    def stats(self):
+        """Copy of the FlightStats of all rows, computed when the snapshot was built."""
+        return self._stats.copy()
+
+    def record(self, row):
+        """
+        Rebuild a row as a flight dictionary in the app's internal format
+        (flight, airline.iata, departure/arrival airport.iata and scheduledTime,
+        status, delay, distance_km, eligible_for_compensation, source).
+        """
+        c = self._columns
+        s = self.string
+        record = {
+            'flight': s(c['number'][row]),
+            'airline': {'iata': s(c['airline'][row])},
+            'departure': {'airport': {'iata': s(c['dep_iata'][row])}, 'scheduledTime': s(c['dep_time'][row])},
+            'arrival': {'airport': {'iata': s(c['arr_iata'][row])}, 'scheduledTime': s(c['arr_time'][row])},
+            'status': s(c['status'][row]) or None,
+            'delay': c['delay'][row],
+            'eligible_for_compensation': bool(c['flags'][row] & ELIGIBLE),
+            'source': s(c['source'][row]),
+        }
+        if c['distance'][row] >= 0:
+            record['distance_km'] = c['distance'][row]
+        if c['compensation'][row] >= 0:
+            record['compensation_amount_eur'] = c['compensation'][row]
+        return record
@@ -1,13 +1,48 @@
 """
 Flight Data Storage Module
 --------------------------
-Handles persistent storage of flight data in JSON format
+Handles persistent storage of flight data in JSON format.
+
+On disk the dataset is:
+- `flight_compensation_data.json`: metadata (revision) plus flights without a
+  scheduled departure date
+- `flight_compensation_data_partitions/YYYY-MM-DD.json`: one snapshot per scheduled
+  departure day, read only when a query covers that day
+- `flight_compensation_data.json.wal`: append-only write-ahead log, one JSON
+  operation per line
+- `flight_compensation_data.columns`: memory-mapped columnar copy of all live
+  flights as of the last compaction (see flight_columns)
+
+Each instance also keeps the record changes of the log lines after the snapshot,
+by revision (changes_since(), see flight_changes), for clients that sync deltas.
+
+A write appends and fsyncs only the changed records; each instance replays new log
+lines onto its in-memory view, and once the log grows past `FLIGHT_WAL_COMPACT_BYTES`
+it is folded into the partitions it touched. Every log entry carries a revision, so
+replay is idempotent across compactions. archive_partitions() moves days older than
+`FLIGHT_RETENTION_DAYS` to gzip files in `flight_compensation_data_archive/`.
+
+Records are stored in the canonical shape of flight_schema, normalized once on
+write. Files and log entries from an older schema version are normalized when read
+and rewritten by the next compaction (or migrate_schema()).
 """
 
 import os
-import json
+import re
+import gzip
+import stat
+import time
+import tempfile
+import threading
 import logging
-from datetime import datetime
+from datetime import datetime, date, timedelta
+
+import json_codec
+import flight_columns
+from flight_changes import Change, ChangeLog, DEFAULT_MAX_ENTRIES as DEFAULT_CHANGE_LOG_SIZE
+from flight_schema import SCHEMA_VERSION, normalize_flight, schema_version_of
+from flight_index import record_key, departure_time_of
+from file_lock import FileLock, LockTimeout
 
 # Configure logging
 logging.basicConfig(
@@ -16,121 +51,1042 @@ logging.basicConfig(
 )
 logger = logging.getLogger("flight_data_storage")
 
+# Log size after which a write folds the log into a new snapshot
+DEFAULT_WAL_COMPACT_BYTES = 4 * 1024 * 1024
+# Days of partitions kept live before archive_partitions() moves them to gzip files
+DEFAULT_RETENTION_DAYS = 90
+
+
+class StorageReadError(Exception):
+    """The data file exists but could not be parsed, even after retrying."""
+
+
+class StorageConflictError(Exception):
+    """The file changed since the document being saved was loaded (lost update prevented)."""
+
+
+def _fsync_directory(directory):
+    """Persist a rename by syncing its directory (not supported on Windows)."""
+    if not hasattr(os, 'O_DIRECTORY'):
+        return
+    try:
+        fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def write_bytes_atomic(path, payload):
+    """
+    Replace `path` with `payload` without ever exposing a partial file.
+
+    The bytes are written to a temporary file in the same directory, fsynced and
+    renamed over the target with os.replace, so concurrent readers see either the
+    old or the new file, and a crash mid-write leaves the old file intact.
+
+    Args:
+        path: Target file
+        payload: Bytes to write
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{os.path.basename(path)}.", suffix=".tmp", dir=directory)
+    try:
+        try:
+            mode = stat.S_IMODE(os.stat(path).st_mode)
+        except FileNotFoundError:
+            mode = 0o644
+        os.chmod(tmp_path, mode)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+    _fsync_directory(directory)
+
+
+def write_json_atomic(path, data):
+    """
+    Atomically replace `path` with the compact JSON encoding of `data` (see write_bytes_atomic).
+
+    Args:
+        path: Target file
+        data: JSON-serialisable object
+    """
+    write_bytes_atomic(path, json_codec.dumps(data))
+
+
+def read_json_file(path, retries=3, retry_delay=0.05):
+    """
+    Read a JSON file, retrying briefly if it does not parse.
+
+    Retrying covers files still being written in place by older, non-atomic writers.
+
+    Raises:
+        FileNotFoundError: The file does not exist
+        StorageReadError: The file never parsed; it is left untouched
+    """
+    last_error = None
+    for attempt in range(retries + 1):
+        try:
+            with open(path, 'rb') as f:
+                return json_codec.loads(f.read())
+        except json_codec.JSONDecodeError as e:
+            last_error = e
+            if attempt < retries:
+                time.sleep(retry_delay * (attempt + 1))
+    raise StorageReadError(f"Invalid JSON in {path}: {last_error}")
+
+def storage_paths(filepath):
+    """
+    Files that make up the dataset whose main file is `filepath`.
+
+    Returns:
+        dict: wal, partition_dir, archive_dir, columns and lock paths
+    """
+    data_dir, filename = os.path.split(filepath)
+    stem = os.path.splitext(filename)[0]
+    return {
+        "wal": filepath + ".wal",
+        "partition_dir": os.path.join(data_dir, f"{stem}_partitions"),
+        "archive_dir": os.path.join(data_dir, f"{stem}_archive"),
+        "columns": os.path.join(data_dir, f"{stem}.columns"),
+        "lock": filepath + ".lock",
+    }
+
+# A partition name is joined into a file path: nothing but a YYYY-MM-DD date is accepted
+DAY_PATTERN = re.compile(r'[0-9]{4}-[0-9]{2}-[0-9]{2}')
+
+def partition_of(record):
+    """Partition of a record: its scheduled departure date (YYYY-MM-DD), or '' if unknown."""
+    day = departure_time_of(record)[:10]
+    return day if DAY_PATTERN.fullmatch(day) else ''
+
+
 class FlightDataStorage:
     """
-    Manages storage and retrieval of flight data from a JSON file.
+    Manages storage and retrieval of flight data from date-partitioned JSON
+    snapshots plus a write-ahead log.
+
+    Records are identified by flight_index.record_key (flight number + departure date).
     """
-    def __init__(self, data_dir=None, filename=None):
+    def __init__(self, data_dir=None, filename=None, compact_bytes=None):
         """
         Initialize the storage with configurable directory and filename.
-        
+
         Args:
             data_dir: Directory where the data file will be stored
             filename: Name of the JSON data file
+            compact_bytes: Log size that triggers compaction (default FLIGHT_WAL_COMPACT_BYTES)
         """
         # Default to "/home/PiotrS/data" for PythonAnywhere compatibility
         self.data_dir = data_dir or os.environ.get('FLIGHT_DATA_DIR', '/home/PiotrS/data')
         self.filename = filename or "flight_compensation_data.json"
         self.filepath = os.path.join(self.data_dir, self.filename)
-        
+        paths = storage_paths(self.filepath)
+        self.wal_path = paths["wal"]
+        self.compact_bytes = compact_bytes or int(
+            os.environ.get('FLIGHT_WAL_COMPACT_BYTES', DEFAULT_WAL_COMPACT_BYTES))
+        self.partition_dir = paths["partition_dir"]
+        self.archive_dir = paths["archive_dir"]
+        self.columns_path = paths["columns"]
+        self.retention_days = int(os.environ.get('FLIGHT_RETENTION_DAYS', DEFAULT_RETENTION_DAYS))
+
         # Ensure data directory exists
         os.makedirs(self.data_dir, exist_ok=True)
-        
+
         logger.info(f"Flight data will be stored at: {self.filepath}")
-        
+
+        # Single-writer coordination across processes
+        self.lock_path = paths["lock"]
+        self.lock_timeout = float(os.environ.get('FLIGHT_STORAGE_LOCK_TIMEOUT', '30'))
+
+        # In-memory view: main file records grouped by partition, day partitions
+        # loaded on demand, and log entries not yet compacted. If a file becomes
+        # unreadable, readers keep being served the last good copy.
+        self._cache_lock = threading.RLock()
+        self._metadata = None
+        self._schema = SCHEMA_VERSION  # schema version of the main file
+        self._main = {}        # partition -> {key: record}, from the main file
+        self._partitions = {}  # day -> (stat signature, revision, {key: record})
+        self._overlay = {}     # partition -> {key: (revision, record)}, from the log
+        self._overlay_index = flight_columns.RecordIndex()  # the same log records, by airline/airport/status
+        self._revision = 0
+        self._snapshot_revision = 0
+        self._snapshot_signature = None
+        self._snapshot_error = None
+        self._columns = None        # (stat signature, ColumnarSnapshot or None)
+        # Change the log made to the snapshot's aggregates (None: unknown, recompute)
+        self._stats_delta = flight_columns.FlightStats()
+        self._stats_cache = None    # (generation, FlightStats) when recomputed
+        self._wal_inode = None
+        self._wal_offset = 0
+        self._last_modified = None
+        self._generation = 0
+        self.compactions = 0
+        # Recent record changes by revision, for changes_since()
+        self._changes = ChangeLog(int(os.environ.get('FLIGHT_CHANGE_LOG_SIZE', DEFAULT_CHANGE_LOG_SIZE)))
+
         # Initialize empty data structure if file doesn't exist
         if not os.path.exists(self.filepath):
             self._initialize_data_file()
-    
+
     def _initialize_data_file(self):
         """Create an empty data file with basic structure."""
         initial_data = {
             "metadata": {
                 "created": datetime.now().isoformat(),
                 "updated": datetime.now().isoformat(),
-                "version": "3.0"
+                "version": "3.0",
+                "schema_version": SCHEMA_VERSION
             },
             "flights": []
         }
-        
+
         try:
-            with open(self.filepath, 'w') as f:
-                json.dump(initial_data, f, indent=2)
+            # O_EXCL so a racing worker can never truncate a file another one just created
+            with open(self.filepath, 'xb') as f:
+                f.write(json_codec.dumps(initial_data))
             logger.info(f"Created new flight data file at {self.filepath}")
+        except FileExistsError:
+            pass
         except Exception as e:
             logger.error(f"Failed to initialize data file: {e}")
-    
-    def _load_data(self):
-        """Load flight data from the JSON file."""
+
+    @staticmethod
+    def _empty_document():
+        return {"metadata": {"version": "3.0", "schema_version": SCHEMA_VERSION}, "flights": []}
+
+    @staticmethod
+    def _revision_of(data):
+        return int((data.get("metadata") or {}).get("revision", 0))
+
+    @staticmethod
+    def _stat(path):
         try:
-            if not os.path.exists(self.filepath):
-                logger.warning(f"Data file not found at {self.filepath}, initializing new file")
-                self._initialize_data_file()
-                return {"metadata": {"version": "3.0"}, "flights": []}
-            
-            with open(self.filepath, 'r') as f:
-                data = json.load(f)
-            logger.info(f"Loaded {len(data.get('flights', []))} flights from storage")
-            return data
-        except json.JSONDecodeError:
-            logger.error(f"Invalid JSON in {self.filepath}, initializing new file")
-            self._initialize_data_file()
-            return {"metadata": {"version": "3.0"}, "flights": []}
+            return os.stat(path)
+        except OSError:
+            return None
+
+    @staticmethod
+    def _signature(st):
+        return (st.st_ino, st.st_mtime_ns, st.st_size) if st else None
+
+    def _install_snapshot(self, data, signature):
+        self._schema = schema_version_of(data.get("metadata"))
+        flights = data.get("flights", [])
+        if self._schema < SCHEMA_VERSION:
+            flights = [normalize_flight(f) for f in flights]
+        main = {}
+        for flight in flights:
+            main.setdefault(partition_of(flight), {})[record_key(flight)] = flight
+        self._main = main
+        self._overlay = {}
+        self._overlay_index = flight_columns.RecordIndex()
+        self._stats_delta = flight_columns.FlightStats()
+        self._metadata = dict(data.get("metadata") or {"version": "3.0"})
+        revision = self._revision_of(data)
+        # The change log starts at the snapshot, even where this instance applied the
+        # entries before it: only the log lines after it are on disk for every process,
+        # so every worker holds the same changes and truncates at the same revision
+        self._changes.reset(revision)
+        self._revision = self._snapshot_revision = revision
+        self._snapshot_signature = signature
+        self._snapshot_error = None
+        self._generation += 1
+        # Re-read the whole log: entries already folded into this snapshot are skipped by revision
+        self._wal_inode = None
+        self._wal_offset = 0
+
+    def _apply_entry(self, entry):
+        revision = entry.get("rev", 0)
+        if revision <= self._revision:
+            return
+        if entry.get("op") == "put":
+            flight = entry["flight"]
+            if entry.get("v", 1) < SCHEMA_VERSION:
+                flight = normalize_flight(flight)
+            key = record_key(flight)
+            day = partition_of(flight)
+            values = flight_columns.row_values(flight)
+            previous = self._previous_values(day, key)
+            if self._stats_delta is not None:
+                self._track_stats(previous, values)
+            self._changes.record(Change(revision, key, day,
+                                        flight_columns.flags_of(previous) if previous is not None else None,
+                                        flight_columns.flags_of(values)))
+            self._overlay.setdefault(day, {})[key] = (revision, flight)
+            self._overlay_index.put(key, flight)
+        else:
+            self._changes.advance(revision)
+        self._revision = revision
+        self._generation += 1
+        if entry.get("at"):
+            self._metadata["updated"] = entry["at"]
+
+    def _previous_values(self, day, key):
+        """row_values() of the record a log entry for `key` replaces, or None if it is new."""
+        previous = self._overlay.get(day, {}).get(key)
+        if previous is not None:
+            return flight_columns.row_values(previous[1])
+        snapshot = self._columnar_snapshot()
+        if snapshot is not None:
+            row = snapshot.find(key)
+            return snapshot.values(row) if row is not None else None
+        try:
+            record = self._lookup(day, key)
+        except StorageReadError:
+            return None
+        return flight_columns.row_values(record) if record is not None else None
+
+    def _track_stats(self, previous, values):
+        """Move the log's aggregate delta from the replaced record's values (if any) to `values`."""
+        if self._columnar_snapshot() is None:
+            # Without snapshot aggregates to add it to, the delta is of no use
+            self._stats_delta = None
+            return
+        if previous is not None:
+            self._stats_delta.add(previous, -1)
+        self._stats_delta.add(values)
+
+    def _replay_wal(self):
+        """Apply complete log lines written since the last replay."""
+        try:
+            with open(self.wal_path, 'rb') as f:
+                st = os.fstat(f.fileno())
+                if st.st_ino != self._wal_inode:
+                    # New log after a compaction
+                    self._wal_inode = st.st_ino
+                    self._wal_offset = 0
+                self._last_modified = max(self._last_modified or 0, st.st_mtime)
+                if st.st_size <= self._wal_offset:
+                    return
+                f.seek(self._wal_offset)
+                chunk = f.read()
+        except FileNotFoundError:
+            return
+
+        # A line without its newline is still being appended (or was torn by a crash)
+        end = chunk.rfind(b'\n')
+        if end < 0:
+            return
+        for line in chunk[:end].split(b'\n'):
+            if not line.strip():
+                continue
+            try:
+                self._apply_entry(json_codec.loads(line))
+            except (ValueError, KeyError, TypeError) as e:
+                logger.error(f"Skipping unreadable log entry in {self.wal_path}: {e}")
+        self._wal_offset += end + 1
+
+    def _refresh(self, strict=False):
+        """
+        Bring the in-memory view up to date with the snapshot and log on disk.
+
+        Args:
+            strict: Raise StorageReadError if the snapshot does not parse, instead of
+                keeping the last good copy
+        """
+        with self._cache_lock:
+            # A compaction can swap snapshot and log while we read; go round again if so
+            for _ in range(3):
+                st = self._stat(self.filepath)
+                signature = self._signature(st)
+                if self._metadata is None or signature != self._snapshot_signature:
+                    try:
+                        data = read_json_file(self.filepath)
+                        logger.info(f"Loaded {len(data.get('flights', []))} flights from storage snapshot")
+                        self._install_snapshot(data, signature)
+                    except FileNotFoundError:
+                        logger.warning(f"Data file not found at {self.filepath}, initializing new file")
+                        self._initialize_data_file()
+                        if self._metadata is None:
+                            self._install_snapshot(self._empty_document(), None)
+                    except StorageReadError as e:
+                        logger.error(f"{e}; leaving the file untouched")
+                        if strict:
+                            raise
+                        if self._metadata is None:
+                            self._install_snapshot(self._empty_document(), None)
+                        # Keep serving the last good snapshot, plus whatever the log adds
+                        self._snapshot_signature = signature
+                        self._snapshot_error = e
+                    if st is not None:
+                        self._last_modified = st.st_mtime
+                self._replay_wal()
+                if self._signature(self._stat(self.filepath)) == signature:
+                    break
+            if strict and self._snapshot_error is not None:
+                raise self._snapshot_error
+
+    def _partition_path(self, day):
+        if not DAY_PATTERN.fullmatch(day):
+            raise ValueError(f"Invalid partition date {day!r}, expected YYYY-MM-DD")
+        return os.path.join(self.partition_dir, f"{day}.json")
+
+    def _partition(self, day, strict=False):
+        """
+        (revision, {key: record}) of a day's partition file, or None if there is none.
+        Re-read only when the file changed.
+        """
+        st = self._stat(self._partition_path(day))
+        cached = self._partitions.get(day)
+        if st is None:
+            if cached is not None:
+                # Archived, or removed by a full save
+                del self._partitions[day]
+                self._generation += 1
+            return None
+        signature = self._signature(st)
+        if cached is not None and cached[0] == signature:
+            return cached[1], cached[2]
+        try:
+            data = read_json_file(self._partition_path(day))
+        except FileNotFoundError:
+            self._partitions.pop(day, None)
+            return None
+        except StorageReadError as e:
+            logger.error(f"{e}; leaving the file untouched")
+            if strict or cached is None:
+                raise
+            return cached[1], cached[2]
+        flights = data.get("flights", [])
+        if schema_version_of(data.get("metadata")) < SCHEMA_VERSION:
+            flights = [normalize_flight(f) for f in flights]
+        records = {record_key(f): f for f in flights}
+        self._partitions[day] = (signature, self._revision_of(data), records)
+        self._generation += 1
+        return self._partitions[day][1], records
+
+    def _day_view(self, day, strict=False):
+        """{key: record} for one partition: main file, day file, then newer log entries."""
+        base = self._main.get(day)
+        part = self._partition(day, strict=strict) if day else None
+        overlay = self._overlay.get(day)
+        if part is None and not overlay:
+            return base or {}
+        records = dict(base) if base else {}
+        part_revision = 0
+        if part is not None:
+            part_revision, part_records = part
+            records.update(part_records)
+        if overlay:
+            for key, (revision, record) in overlay.items():
+                if revision > part_revision:
+                    records[key] = record
+        return records
+
+    def _lookup(self, day, key):
+        """The record _day_view(day) holds under `key`, or None, without building the view."""
+        part = self._partition(day) if day else None
+        entry = self._overlay.get(day, {}).get(key)
+        if entry is not None and (part is None or entry[0] > part[0]):
+            return entry[1]
+        if part is not None and key in part[1]:
+            return part[1][key]
+        return self._main.get(day, {}).get(key)
+
+    def _has_key(self, day, key):
+        if key in self._overlay.get(day, ()) or key in self._main.get(day, ()):
+            return True
+        part = self._partition(day, strict=True) if day else None
+        return part is not None and key in part[1]
+
+    def _partition_dates(self, since=''):
+        """Sorted days that have a partition file, main file records or log entries."""
+        try:
+            names = os.listdir(self.partition_dir)
+        except FileNotFoundError:
+            names = []
+        days = {name[:-5] for name in names if name.endswith(".json") and DAY_PATTERN.fullmatch(name[:-5])}
+        days.update(self._main)
+        days.update(self._overlay)
+        days.discard('')
+        return sorted(day for day in days if day >= since)
+
+    def _collect(self, days, strict=False):
+        flights = []
+        for day in days:
+            flights.extend(self._day_view(day, strict=strict).values())
+        flights.extend(self._day_view('').values())
+        return flights
+
+    def _document(self, copy_records=False, strict=False):
+        flights = self._collect(self._partition_dates(), strict=strict)
+        if copy_records:
+            flights = [dict(f) for f in flights]
+        metadata = dict(self._metadata)
+        metadata["revision"] = self._revision
+        return {"metadata": metadata, "flights": flights}
+
+    def _load_data(self, strict=False):
+        """
+        Load flight data: the snapshot with the write-ahead log replayed onto it.
+
+        A file that exists but does not parse is never re-initialised: readers get the
+        last good copy (or an empty list), and with strict=True the error is raised so
+        writers don't overwrite the dataset with a partial view.
+
+        Args:
+            strict: Raise StorageReadError instead of falling back
+        """
+        try:
+            with self._cache_lock:
+                self._refresh(strict=strict)
+                return self._document(strict=strict)
+        except StorageReadError:
+            raise
         except Exception as e:
             logger.error(f"Error loading flight data: {e}")
-            return {"metadata": {"version": "3.0"}, "flights": []}
-    
+            if strict:
+                raise
+            return self._empty_document()
+
+    def flights_since(self, since):
+        """
+        Flights departing on or after a day, reading only the partitions from that
+        day on (plus flights without a departure date).
+
+        Args:
+            since: datetime.date or 'YYYY-MM-DD'
+
+        Returns:
+            list: Flight dictionaries (shared with the in-memory view; copy before modifying)
+        """
+        since = since.isoformat() if isinstance(since, date) else str(since)[:10]
+        try:
+            with self._cache_lock:
+                self._refresh()
+                return self._collect(self._partition_dates(since))
+        except Exception as e:
+            logger.error(f"Error loading flights since {since}: {e}")
+            return []
+
+    def flights_on(self, day):
+        """
+        Flights scheduled to depart on one day.
+
+        Args:
+            day: datetime.date or 'YYYY-MM-DD'
+
+        Raises:
+            ValueError: `day` is not a YYYY-MM-DD date
+        """
+        day = day.isoformat() if isinstance(day, date) else str(day)
+        if not DAY_PATTERN.fullmatch(day):
+            raise ValueError(f"Invalid date {day!r}, expected YYYY-MM-DD")
+        try:
+            with self._cache_lock:
+                self._refresh()
+                return list(self._day_view(day).values())
+        except Exception as e:
+            logger.error(f"Error loading flights on {day}: {e}")
+            return []
+
+    def _columnar_snapshot(self):
+        """The mapped columnar snapshot if it matches the main file's revision, else None."""
+        if self._schema < SCHEMA_VERSION:
+            # Built from records in the old shape; the migrating compaction replaces it
+            return None
+        signature = self._signature(self._stat(self.columns_path))
+        if self._columns is None or self._columns[0] != signature:
+            if self._columns is not None and self._columns[1] is not None:
+                self._columns[1].close()
+            snapshot = None
+            if signature is not None:
+                try:
+                    snapshot = flight_columns.ColumnarSnapshot(self.columns_path)
+                except (OSError, ValueError) as e:
+                    logger.error(f"Ignoring columnar snapshot {self.columns_path}: {e}")
+            self._columns = (signature, snapshot)
+        snapshot = self._columns[1]
+        if snapshot is not None and snapshot.revision == self._snapshot_revision:
+            return snapshot
+        return None
+
+    def window_flights(self, since_epoch, any_flags=0, all_flags=0, filters=None):
+        """
+        Flights scheduled to depart or arrive at or after `since_epoch`.
+
+        Served from the columnar snapshot (its posting lists when `filters` are given)
+        plus the indexed log entries written since it was built, without parsing any
+        JSON partition; falls back to scanning the day partitions in range when the
+        snapshot is missing or behind. Snapshot rows are rebuilt in the app's internal
+        format (see ColumnarSnapshot.record).
+
+        Args:
+            since_epoch: Window start, epoch seconds (flight_columns.NO_TIME for all flights)
+            any_flags: Only flights with at least one of these flight_columns flags
+            all_flags: Only flights with all of these flight_columns flags
+            filters: Optional {"airline"/"dep"/"arr"/"status": code, "min_delay": minutes}
+
+        Returns:
+            list: Flight dictionaries
+        """
+        try:
+            with self._cache_lock:
+                self._refresh()
+                snapshot = self._columnar_snapshot()
+                if snapshot is None:
+                    if since_epoch > flight_columns.NO_TIME:
+                        # A flight can arrive the day after it departs
+                        since_day = datetime.utcfromtimestamp(max(since_epoch, 86400) - 86400).date().isoformat()
+                        candidates = self._collect(self._partition_dates(since_day))
+                    else:
+                        candidates = self._collect(self._partition_dates())
+                    return [f for f in candidates
+                            if flight_columns.matches(flight_columns.row_values(f), since_epoch,
+                                                      any_flags, all_flags, filters)]
+
+                # Everything in the log is newer than the snapshot
+                newer = self._overlay_index
+                flights = [snapshot.record(row)
+                           for row in snapshot.select_rows(since_epoch, any_flags, all_flags, filters)
+                           if not newer or snapshot.key(row) not in newer]
+                flights.extend(newer.select(since_epoch, any_flags, all_flags, filters))
+                return flights
+        except Exception as e:
+            logger.error(f"Error querying flights since {since_epoch}: {e}")
+            return []
+
+    def changes_since(self, revision, limit=None):
+        """
+        Record changes after a revision, each with the record now stored under its key.
+
+        Args:
+            revision: Last revision the caller has seen
+            limit: Return at most this many changes (the oldest ones)
+
+        Returns:
+            tuple: ([(Change, record or None), ...] oldest first, current revision)
+
+        Raises:
+            flight_changes.ChangesTruncated: changes after `revision` are no longer
+                known; re-read the full dataset
+        """
+        with self._cache_lock:
+            self._refresh()
+            changes = self._changes.since(revision, limit)
+            return [(change, self._lookup(change.day, change.key)) for change in changes], self._revision
+
+    @property
+    def revision(self):
+        """Current revision of the dataset (changes on every write, in any process)."""
+        with self._cache_lock:
+            self._refresh()
+            return self._revision
+
+    @property
+    def generation(self):
+        """
+        Counter bumped whenever this instance's view of the data changes, including
+        snapshots rewritten by tools that don't maintain the revision. Use it to
+        invalidate anything derived from the flights.
+        """
+        with self._cache_lock:
+            self._refresh()
+            return self._generation
+
+    @property
+    def last_modified(self):
+        """Epoch seconds of the latest snapshot or log write seen, or None."""
+        with self._cache_lock:
+            self._refresh()
+            return self._last_modified
+
+    def cache_sizes(self):
+        """
+        Sizes of this instance's in-memory view, for memory diagnostics. Does not
+        refresh, so it reports what is held right now.
+
+        Returns:
+            dict: Record counts per cache, plus the mapped columnar snapshot bytes
+        """
+        with self._cache_lock:
+            columns = self._columns[1] if self._columns else None
+            return {
+                "main_records": sum(len(records) for records in self._main.values()),
+                "partitions_loaded": len(self._partitions),
+                "partition_records": sum(len(entry[2]) for entry in self._partitions.values()),
+                "log_records": sum(len(records) for records in self._overlay.values()),
+                "log_index_records": len(self._overlay_index),
+                "columnar_rows": len(columns) if columns is not None else 0,
+                "columnar_mapped_bytes": columns.nbytes if columns is not None else 0,
+                "stats_cached": self._stats_cache is not None,
+                "generation": self._generation,
+                "change_log_entries": len(self._changes),
+            }
+
+    def warm(self):
+        """
+        Read every day partition into the in-memory view, map the columnar snapshot
+        and compute the statistics now rather than on first use. Called before a
+        server forks its workers, so they start with the records parsed and share
+        them copy-on-write (see prefork); later changes are picked up per worker by
+        the usual refresh.
+
+        Returns:
+            int: Records held in memory
+        """
+        with self._cache_lock:
+            self._refresh(strict=True)
+            for day in self._partition_dates():
+                self._partition(day, strict=True)
+            self._columnar_snapshot()
+            self._current_stats()
+            sizes = self.cache_sizes()
+        return sizes["main_records"] + sizes["partition_records"] + sizes["log_records"]
+
+    def _writer_lock(self):
+        return FileLock(self.lock_path, timeout=self.lock_timeout)
+
+    def _append_wal_locked(self, entries):
+        """Append entries to the log and fsync it. Caller holds the writer lock and is refreshed."""
+        payload = b''.join(json_codec.dumps(entry) + b'\n' for entry in entries)
+        fd = os.open(self.wal_path, os.O_RDWR | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            st = os.fstat(fd)
+            if st.st_ino != self._wal_inode:
+                # Log created just now
+                self._wal_inode = st.st_ino
+                self._wal_offset = 0
+                _fsync_directory(self.data_dir)
+            if st.st_size > self._wal_offset:
+                # Torn tail from a writer that crashed mid-append; replay already
+                # consumed every complete line, so cut back to there
+                logger.warning(f"Truncating {st.st_size - self._wal_offset} bytes of torn log tail")
+                os.ftruncate(fd, self._wal_offset)
+            view = memoryview(payload)
+            while view:
+                written = os.write(fd, view)
+                view = view[written:]
+            os.fsync(fd)
+            self._wal_offset += len(payload)
+            self._last_modified = time.time()
+        finally:
+            os.close(fd)
+        for entry in entries:
+            self._apply_entry(entry)
+        if self._wal_offset >= self.compact_bytes or self._needs_migration():
+            self._compact_locked()
+
+    def _write_partition_locked(self, day, records):
+        os.makedirs(self.partition_dir, exist_ok=True)
+        path = self._partition_path(day)
+        write_json_atomic(path, {
+            "metadata": {"partition": day, "revision": self._revision,
+                         "schema_version": SCHEMA_VERSION, "updated": datetime.now().isoformat()},
+            "flights": list(records.values()),
+        })
+        self._partitions[day] = (self._signature(os.stat(path)), self._revision, records)
+
+    def _write_snapshot_locked(self, document, flights):
+        """
+        Write the columnar snapshot of `flights` (the whole live dataset) and the main
+        file, install it as the in-memory view and start a fresh log.
+        """
+        started = time.perf_counter()
+        write_bytes_atomic(self.columns_path,
+                           flight_columns.encode_snapshot(flights, self._revision_of(document)))
+        logger.info(f"Built columnar snapshot of {len(flights)} flights in {time.perf_counter() - started:.2f}s")
+        write_json_atomic(self.filepath, document)
+        st = os.stat(self.filepath)
+        self._install_snapshot(document, self._signature(st))
+        self._last_modified = st.st_mtime
+        # Start a fresh log (new inode, so other processes notice the switch). A crash
+        # before this point leaves the old log, whose entries are now all skipped.
+        write_bytes_atomic(self.wal_path, b'')
+        self._wal_inode = os.stat(self.wal_path).st_ino
+        self._wal_offset = 0
+
+    def _needs_migration(self):
+        """
+        True while the main file still holds dated flights (pre-partitioning layout)
+        or the files were written with an older record schema.
+        """
+        return self._schema < SCHEMA_VERSION or any(day for day in self._main)
+
+    def _compact_locked(self):
+        started = time.perf_counter()
+        log_bytes = self._wal_offset
+        if self._schema < SCHEMA_VERSION:
+            # Schema migration: every day file is rewritten in the canonical shape
+            touched = self._partition_dates()
+        else:
+            # Only days with log entries (or still in the main file) are rewritten
+            touched = sorted(day for day in set(self._overlay) | set(self._main) if day)
+        for day in touched:
+            self._write_partition_locked(day, self._day_view(day, strict=True))
+        metadata = dict(self._metadata, revision=self._revision, partitioned=True,
+                        schema_version=SCHEMA_VERSION)
+        self._write_snapshot_locked({"metadata": metadata, "flights": list(self._day_view('').values())},
+                                    self._collect(self._partition_dates()))
+        self.compactions += 1
+        logger.info(f"Compacted {log_bytes} bytes of log into {len(touched)} day partitions "
+                    f"(revision {self._revision}) in {time.perf_counter() - started:.2f}s")
+
+    def compact(self):
+        """Fold the write-ahead log into the day partitions now."""
+        with self._writer_lock(), self._cache_lock:
+            self._refresh(strict=True)
+            self._compact_locked()
+        return True
+
+    def migrate_schema(self):
+        """
+        Rewrite files written with an older record schema in the canonical shape.
+
+        Returns:
+            bool: True if anything was rewritten, False if already current
+        """
+        with self._writer_lock(), self._cache_lock:
+            self._refresh(strict=True)
+            if not self._needs_migration():
+                return False
+            self._compact_locked()
+        return True
+
+    def archive_partitions(self, retention_days=None, today=None):
+        """
+        Move day partitions older than the retention horizon into gzip archives.
+
+        Archived flights no longer appear in any read. A day that already has an
+        archive (late updates to an old flight) is merged into it.
+
+        Args:
+            retention_days: Days to keep live (default FLIGHT_RETENTION_DAYS)
+            today: datetime.date the horizon is counted from (default today)
+
+        Returns:
+            list: (day, flight count) for every archived partition
+        """
+        retention_days = self.retention_days if retention_days is None else retention_days
+        horizon = ((today or date.today()) - timedelta(days=retention_days)).isoformat()
+        archived = []
+        with self._writer_lock(), self._cache_lock:
+            self._refresh(strict=True)
+            # Fold the log first so archived days are complete
+            self._compact_locked()
+            os.makedirs(self.archive_dir, exist_ok=True)
+            for day in self._partition_dates():
+                if day >= horizon:
+                    break
+                records = self._day_view(day, strict=True)
+                archive_path = os.path.join(self.archive_dir, f"{day}.json.gz")
+                if os.path.exists(archive_path):
+                    with gzip.open(archive_path, 'rb') as f:
+                        archive = json_codec.loads(f.read())
+                    previous = archive.get("flights", [])
+                    if schema_version_of(archive.get("metadata")) < SCHEMA_VERSION:
+                        previous = [normalize_flight(r) for r in previous]
+                    merged = {record_key(r): r for r in previous}
+                    merged.update(records)
+                    records = merged
+                payload = json_codec.dumps({"metadata": {"partition": day, "archived": datetime.now().isoformat(),
+                                                         "schema_version": SCHEMA_VERSION},
+                                            "flights": list(records.values())})
+                write_bytes_atomic(archive_path, gzip.compress(payload))
+                os.unlink(self._partition_path(day))
+                self._partitions.pop(day, None)
+                archived.append((day, len(records)))
+            if archived:
+                # New revision, so other processes drop the archived days from their views
+                self._revision += 1
+                metadata = dict(self._metadata, revision=self._revision, archived_before=horizon)
+                self._write_snapshot_locked({"metadata": metadata, "flights": list(self._day_view('').values())},
+                                            self._collect(self._partition_dates()))
+                logger.info(f"Archived {len(archived)} day partitions older than {horizon}")
+        return archived
+
+    def put_flights(self, flights, if_absent=False):
+        """
+        Insert or replace records by record key, appending one log line per record.
+
+        Args:
+            flights: List of flight dictionaries
+            if_absent: Only insert records whose key is not stored yet
+
+        Returns:
+            int: Number of records written
+
+        Raises:
+            LockTimeout, StorageReadError
+        """
+        with self._writer_lock() as lock:
+            if lock.wait_seconds > 1:
+                logger.warning(f"Waited {lock.wait_seconds:.1f}s for the storage writer lock")
+            with self._cache_lock:
+                self._refresh(strict=True)
+                now = datetime.now().isoformat()
+                entries = []
+                seen = set()
+                for flight in flights:
+                    flight = normalize_flight(flight)
+                    key = record_key(flight)
+                    if if_absent and (key in seen or self._has_key(partition_of(flight), key)):
+                        continue
+                    seen.add(key)
+                    entries.append({"rev": self._revision + len(entries) + 1, "op": "put",
+                                    "v": SCHEMA_VERSION, "at": now, "flight": flight})
+                if entries:
+                    self._append_wal_locked(entries)
+                    logger.info(f"Logged {len(entries)} flights (revision {self._revision})")
+                return len(entries)
+
     def _save_data(self, data):
-        """Save flight data to the JSON file."""
+        """
+        Replace the whole dataset with `data` (atomically, under the writer lock).
+
+        The document's metadata.revision must match the current revision; the save
+        becomes a new snapshot one revision later, so a writer holding an outdated
+        copy is detected.
+
+        Raises:
+            StorageConflictError: the data changed since `data` was loaded
+        """
         try:
-            # Update metadata
-            data["metadata"] = data.get("metadata", {})
-            data["metadata"]["updated"] = datetime.now().isoformat()
-            
-            with open(self.filepath, 'w') as f:
-                json.dump(data, f, indent=2)
-            logger.info(f"Saved {len(data.get('flights', []))} flights to storage")
-            return True
+            with self._writer_lock(), self._cache_lock:
+                self._refresh(strict=True)
+                return self._save_data_locked(data)
+        except StorageConflictError:
+            raise
         except Exception as e:
             logger.error(f"Error saving flight data: {e}")
             return False
-    
+
+    def _save_data_locked(self, data):
+        # Update metadata
+        data["metadata"] = data.get("metadata", {})
+        expected = self._revision_of(data)
+        if self._revision != expected:
+            raise StorageConflictError(
+                f"{self.filepath} is at revision {self._revision}, document was loaded at {expected}")
+        data["metadata"]["revision"] = expected + 1
+        data["metadata"]["updated"] = datetime.now().isoformat()
+        data["metadata"]["partitioned"] = True
+        data["metadata"]["schema_version"] = SCHEMA_VERSION
+        data["flights"] = [normalize_flight(f) for f in data.get("flights", [])]
+        self._revision = expected + 1
+
+        # Day files first, then the main file: until it is replaced, readers keep the old revision
+        by_day = {}
+        for flight in data.get("flights", []):
+            by_day.setdefault(partition_of(flight), {})[record_key(flight)] = flight
+        for day in self._partition_dates():
+            if day not in by_day:
+                try:
+                    os.unlink(self._partition_path(day))
+                except FileNotFoundError:
+                    pass
+                self._partitions.pop(day, None)
+        for day, records in by_day.items():
+            if day:
+                self._write_partition_locked(day, records)
+        self._write_snapshot_locked({"metadata": data["metadata"], "flights": list(by_day.get('', {}).values())},
+                                    data.get("flights", []))
+        logger.info(f"Saved {len(data.get('flights', []))} flights to storage (revision {expected + 1})")
+        return True
+
+    def update(self, mutate, retries=3):
+        """
+        Read-modify-write the whole document while holding the cross-process writer lock.
+
+        This rewrites the snapshot; use put_flights() to add or replace records.
+
+        Args:
+            mutate: Callable receiving a copy of the current document; modifies it in place
+                and returns a value, or returns False to skip saving
+            retries: Attempts after a revision conflict (a writer that bypassed the lock)
+
+        Returns:
+            The value returned by `mutate` (False if nothing was saved)
+
+        Raises:
+            LockTimeout, StorageReadError, StorageConflictError
+        """
+        for attempt in range(retries + 1):
+            with self._writer_lock() as lock:
+                if lock.wait_seconds > 1:
+                    logger.warning(f"Waited {lock.wait_seconds:.1f}s for the storage writer lock")
+                with self._cache_lock:
+                    self._refresh(strict=True)
+                    data = self._document(copy_records=True, strict=True)
+                    result = mutate(data)
+                    if result is False:
+                        return False
+                    try:
+                        self._save_data_locked(data)
+                        return result
+                    except StorageConflictError as e:
+                        if attempt == retries:
+                            raise
+                        logger.warning(f"{e}; retrying update")
+        return False
+
+    def load(self, strict=False):
+        """
+        Return the stored document ({"metadata": ..., "flights": [...]}).
+
+        The flight dictionaries are shared with the in-memory view; copy one before
+        modifying it.
+
+        Args:
+            strict: Raise StorageReadError on an unreadable file; use this before
+                modifying and saving the document
+        """
+        return self._load_data(strict=strict)
+
+    def save(self, data):
+        """
+        Atomically replace the stored document, if nobody wrote since it was loaded.
+        Prefer update() for read-modify-write, which retries conflicts itself.
+
+        Returns:
+            bool: True if successful, False otherwise
+
+        Raises:
+            StorageConflictError: the data changed since `data` was loaded
+        """
+        return self._save_data(data)
+
     def store_flights(self, flights, source="api"):
         """
         Store a list of flight records in the data file.
-        
+
+        A stored record with the same flight number and departure date is replaced.
+
         Args:
             flights: List of flight dictionaries to store
             source: Source of the flight data (e.g., "api", "mock")
-        
+
         Returns:
             bool: True if successful, False otherwise
         """
         try:
-            data = self._load_data()
-            existing_flights = data.get("flights", [])
-            
             # Add source and timestamp to each flight
             timestamp = datetime.now().isoformat()
             for flight in flights:
                 flight["source"] = source
                 flight["stored_at"] = timestamp
                 flight["status"] = flight.get("status", "UNKNOWN").upper()  # Standardize status
-            
-            # Update existing flights or append new ones
-            flight_ids = {f.get("flight", {}).get("iata") for f in flights if f.get("flight")}
-            
-            # Remove existing entries for these flights (to avoid duplicates)
-            data["flights"] = [f for f in existing_flights if f.get("flight", {}).get("iata") not in flight_ids]
-            
-            # Add the new flights
-            data["flights"].extend(flights)
-            
-            return self._save_data(data)
+
+            # One log line per flight instead of rewriting the whole file
+            self.put_flights(flights)
+            return True
         except Exception as e:
             logger.error(f"Error storing flights: {e}")
             return False
-    
+
     def get_eligible_flights(self):
         """
         Retrieve only compensation-eligible flights.
@@ -170,27 +1126,72 @@ class FlightDataStorage:
             logger.error(f"Error retrieving all flights: {e}")
             return []
     
+    def _current_stats(self):
+        """FlightStats of the live dataset: snapshot aggregates plus the log's delta."""
+        snapshot = self._columnar_snapshot()
+        if snapshot is not None and self._stats_delta is not None:
+            stats = snapshot.stats()
+            stats.update(self._stats_delta)
+            return stats
+        if self._stats_cache is None or self._stats_cache[0] != self._generation:
+            self._stats_cache = (self._generation, self._recompute_stats())
+        return self._stats_cache[1].copy()
+
+    def _recompute_stats(self):
+        stats = flight_columns.FlightStats()
+        for flight in self._collect(self._partition_dates()):
+            stats.add(flight_columns.row_values(flight))
+        return stats
+
     def get_stats(self):
         """
         Get statistics about the stored flights.
-        
+
+        Answered from aggregates kept in the columnar snapshot and updated by every
+        log entry, so the cost does not grow with the number of flights (a full
+        recompute only happens while no snapshot matches the data).
+
         Returns:
-            dict: Dictionary with statistics
+            dict: total_flights, eligible_flights, last_updated, revision and the
+                FlightStats breakdowns (per airline, airport, status and hour)
         """
         try:
-            data = self._load_data()
-            flights = data.get("flights", [])
-            eligible_count = sum(1 for f in flights if f.get("eligible_for_compensation") is True)
-            
-            return {
-                "total_flights": len(flights),
-                "eligible_flights": eligible_count,
-                "last_updated": data.get("metadata", {}).get("updated", "unknown")
-            }
+            with self._cache_lock:
+                self._refresh()
+                stats = self._current_stats().to_dict()
+                return dict({
+                    "total_flights": stats["flights"],
+                    "eligible_flights": stats["eligible"],
+                    "last_updated": (self._metadata or {}).get("updated", "unknown"),
+                    "revision": self._revision,
+                }, **stats)
         except Exception as e:
             logger.error(f"Error retrieving stats: {e}")
             return {"error": str(e)}
-    
+
+    def verify_stats(self):
+        """
+        Check the maintained aggregates against a full recompute over every flight.
+
+        Returns:
+            dict: "consistent" and, per differing field (or group entry), the
+                maintained and recomputed values
+        """
+        with self._cache_lock:
+            self._refresh(strict=True)
+            maintained = self._current_stats().to_dict()
+            recomputed = self._recompute_stats().to_dict()
+        differences = {}
+        for name, expected in recomputed.items():
+            actual = maintained[name]
+            if isinstance(expected, dict):
+                for code in set(expected) | set(actual):
+                    if expected.get(code) != actual.get(code):
+                        differences[f"{name}.{code}"] = {"maintained": actual.get(code), "recomputed": expected.get(code)}
+            elif expected != actual:
+                differences[name] = {"maintained": actual, "recomputed": expected}
+        return {"consistent": not differences, "revision": self._revision, "differences": differences}
+
     def generate_mock_data(self, count=50):
         """
         Generate and store realistic mock flight data.
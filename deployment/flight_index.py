@@ -0,0 +1,129 @@
+"""
+Flight Index Module
+-------------------
+In-memory lookup structures over stored flight records, so single-flight queries
+don't have to scan the whole dataset.
+"""
+
+import time
+import logging
+from datetime import datetime
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Statuses after which a flight's delay/cancellation no longer changes
+FINAL_STATUSES = ("LANDED", "CANCELLED", "DIVERTED")
+
+
+def flight_number_of(record):
+    """Flight number of a stored record ('flight' is either "LH123" or {"iata": "LH123"})."""
+    flight_field = record.get('flight')
+    if isinstance(flight_field, dict):
+        flight_field = flight_field.get('iata')
+    return (flight_field or '').strip().upper()
+
+
+def departure_time_of(record):
+    """Scheduled departure of a stored record as an ISO string (may be empty)."""
+    dep = record.get('departure') or {}
+    return dep.get('scheduledTime') or dep.get('scheduled') or ''
+
+
+def record_key(record):
+    """
+    Storage identity of a record: flight number + scheduled departure date, so the
+    same flight number on different days is kept as separate flights.
+    """
+    return f"{flight_number_of(record)}|{departure_time_of(record)[:10]}"
+
+
+def stored_timestamp_of(record):
+    """
+    When the record was last written, as epoch seconds.
+
+    Returns:
+        float or None: None if the record carries no write timestamp
+    """
+    value = record.get('stored_at') or record.get('added_at')
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(str(value).replace('Z', '+00:00')).timestamp()
+    except ValueError:
+        return None
+
+
+def is_final(record):
+    """True if the flight has reached a status whose delay/cancellation is final."""
+    status = str(record.get('status') or '').upper()
+    return any(final in status for final in FINAL_STATUSES)
+
+
+class FlightNumberIndex:
+    """
+    Flight number + departure date index over a list of stored flight records.
+
+    Mock records are never indexed, so generated test data can't answer a real
+    passenger's eligibility check.
+    """
+    def __init__(self, flights):
+        """
+        Args:
+            flights: List of stored flight dictionaries
+        """
+        self._by_number_date = {}
+        self._by_number = {}
+        for record in flights:
+            if not isinstance(record, dict) or record.get('source') == 'mock':
+                continue
+            number = flight_number_of(record)
+            if not number:
+                continue
+            scheduled = departure_time_of(record)
+            key = (number, scheduled[:10])
+            current = self._by_number_date.get(key)
+            if current is None or self._newer(record, current):
+                self._by_number_date[key] = record
+            latest = self._by_number.get(number)
+            if latest is None or scheduled > departure_time_of(latest):
+                self._by_number[number] = record
+
+    @staticmethod
+    def _newer(record, other):
+        return (stored_timestamp_of(record) or 0) >= (stored_timestamp_of(other) or 0)
+
+    def __len__(self):
+        return len(self._by_number_date)
+
+    def lookup(self, flight_number, date=''):
+        """
+        Find a stored flight.
+
+        Args:
+            flight_number: IATA flight number, case-insensitive
+            date: Optional YYYY-MM-DD departure date; without it the latest departure is returned
+
+        Returns:
+            dict or None: The stored record
+        """
+        number = (flight_number or '').strip().upper()
+        if date:
+            return self._by_number_date.get((number, date[:10]))
+        return self._by_number.get(number)
+
+
+def is_fresh(record, max_age_seconds, fallback_timestamp=None, now=None):
+    """
+    Decide whether a stored record can answer a query without asking upstream.
+
+    A flight in a final status is always fresh; otherwise the record must have been
+    written within `max_age_seconds` (using `fallback_timestamp`, e.g. the data file's
+    mtime, when the record has no write timestamp of its own).
+    """
+    if is_final(record):
+        return True
+    written = stored_timestamp_of(record) or fallback_timestamp
+    if written is None:
+        return False
+    return ((now or time.time()) - written) <= max_age_seconds
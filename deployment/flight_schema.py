@@ -0,0 +1,190 @@
+"""
+Flight Schema Module
+--------------------
+Canonical shape of stored flight records, applied once when a record is written
+so request handlers can read fields directly instead of sniffing every variant.
+
+Schema version 2 (files without `metadata.schema_version` are version 1, i.e.
+whatever shape the writer of the day produced):
+
+    {
+      "flight": "LH123",                      # uppercase IATA flight number, '' if unknown
+      "airline": {"iata": "LH", "name": "Lufthansa"},
+      "departure": {"airport": {"iata": "WAW", "name": "..."},
+                    "scheduledTime": "2024-03-15T10:00:00+00:00",
+                    "actualTime": "..."},       # only when known
+      "arrival": {... same as departure ...},
+      "status": "LANDED",                      # as reported (case kept), null if missing
+      "delay": 200,                            # minutes, >= 0
+      "eligible_for_compensation": false,
+      "source": "AviationStack",
+      "distance_km": 1200,                     # only when known
+      "compensation_amount_eur": 400           # only when known
+    }
+
+Variants folded in: `flight` as {"iata": ...} or `flight_iata`/`flight_number`;
+`delayMinutes`/`delay_minutes` or AviationStack per-endpoint delays or actual
+minus scheduled times; `scheduled`/`actual` or `*_scheduled_time`; airports as
+nested dicts, bare codes or AviationStack's `iata` + airport name; `flight_status`.
+Other fields (stored_at, id, ...) are kept as they are. normalize_flight() is
+idempotent.
+
+The status is served to API clients as stored, so its spelling is not changed;
+compare statuses through status_of().
+"""
+
+import math
+import logging
+from datetime import datetime
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+SCHEMA_VERSION = 2
+
+# Spellings replaced by the canonical fields
+_ALIASES = frozenset((
+    "flight_iata", "flight_number", "flight_status", "delayMinutes", "delay_minutes",
+    "airline_iata", "airline_name", "departure_scheduled_time", "arrival_scheduled_time",
+    "departure_airport", "arrival_airport", "departure_airport_iata", "arrival_airport_iata",
+    "distance",
+))
+_ENDPOINT_ALIASES = frozenset(("iata", "scheduled", "actual"))
+
+
+def schema_version_of(metadata):
+    """Schema version a file's metadata declares (1 when absent)."""
+    try:
+        return int((metadata or {}).get("schema_version", 1))
+    except (TypeError, ValueError):
+        return 1
+
+
+def _text(value):
+    return value.strip() if isinstance(value, str) else ''
+
+
+def _number(value):
+    """int of a JSON number or numeric string, or None (booleans, NaN and infinities are not)."""
+    if isinstance(value, str):
+        try:
+            value = float(value)
+        except ValueError:
+            return None
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+        return None
+    return int(value)
+
+
+def _is_code(value):
+    return 2 <= len(value) <= 4 and value.isalnum() and value.upper() == value
+
+
+def _minutes_between(later, earlier):
+    try:
+        late = datetime.fromisoformat(later.replace('Z', '+00:00'))
+        early = datetime.fromisoformat(earlier.replace('Z', '+00:00'))
+        return max(0, int((late - early).total_seconds() // 60))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+def _endpoint(record, side):
+    node = record.get(side)
+    node = node if isinstance(node, dict) else {}
+    airport = node.get('airport')
+    iata = _text(node.get('iata'))
+    name = ''
+    if isinstance(airport, dict):
+        iata = iata or _text(airport.get('iata'))
+        name = _text(airport.get('name'))
+    elif isinstance(airport, str):
+        if not iata and _is_code(airport.strip()):
+            iata = airport.strip()
+        else:
+            name = airport.strip()
+    if not iata:
+        flat = record.get(f'{side}_airport_iata') or record.get(f'{side}_airport')
+        iata = _text(flat) if isinstance(flat, str) else ''
+
+    endpoint = {key: value for key, value in node.items() if key not in _ENDPOINT_ALIASES}
+    endpoint['airport'] = {'iata': iata.upper(), 'name': name}
+    endpoint['scheduledTime'] = _text(node.get('scheduledTime') or node.get('scheduled')
+                                      or record.get(f'{side}_scheduled_time'))
+    actual = _text(node.get('actualTime') or node.get('actual'))
+    if actual:
+        endpoint['actualTime'] = actual
+    else:
+        endpoint.pop('actualTime', None)
+    return endpoint
+
+
+def _delay_minutes(record, departure, arrival):
+    for name in ('delay', 'delayMinutes', 'delay_minutes'):
+        minutes = _number(record.get(name))
+        if minutes is not None:
+            return max(0, minutes)
+    # AviationStack reports delays per endpoint; EU261 counts the arrival delay
+    reported = [_number(node.get('delay')) for node in (arrival, departure)]
+    reported = [minutes for minutes in reported if minutes is not None]
+    if reported:
+        return max(0, max(reported))
+    for node in (arrival, departure):
+        if node.get('actualTime') and node.get('scheduledTime'):
+            minutes = _minutes_between(node['actualTime'], node['scheduledTime'])
+            if minutes is not None:
+                return minutes
+    return 0
+
+
+def status_of(record):
+    """Uppercase status of a record for comparisons ('' if unknown)."""
+    return _text(record.get('status')).upper()
+
+
+def normalize_flight(record):
+    """
+    A stored flight record in the canonical schema (see module docstring).
+
+    Args:
+        record: Flight dictionary in any of the historical shapes
+
+    Returns:
+        dict: New canonical record (the input is not modified)
+    """
+    flight = record.get('flight')
+    if isinstance(flight, dict):
+        flight = flight.get('iata')
+    number = _text(flight) or _text(record.get('flight_iata')) or _text(record.get('flight_number'))
+
+    airline = record.get('airline')
+    if isinstance(airline, dict):
+        airline_iata, airline_name = _text(airline.get('iata')), _text(airline.get('name'))
+    else:
+        airline = _text(airline)
+        airline_iata, airline_name = (airline, '') if _is_code(airline) else ('', airline)
+    airline_iata = airline_iata or _text(record.get('airline_iata'))
+    airline_name = airline_name or _text(record.get('airline_name'))
+
+    departure = _endpoint(record, 'departure')
+    arrival = _endpoint(record, 'arrival')
+
+    canonical = {key: value for key, value in record.items() if key not in _ALIASES}
+    canonical.update({
+        'flight': number.upper(),
+        'airline': {'iata': airline_iata.upper(), 'name': airline_name},
+        'departure': departure,
+        'arrival': arrival,
+        'status': _text(record.get('status')) or _text(record.get('flight_status')) or None,
+        'delay': _delay_minutes(record, departure, arrival),
+        'eligible_for_compensation': record.get('eligible_for_compensation') is True,
+        'source': _text(record.get('source')),
+    })
+    for name, value in (('distance_km', record.get('distance_km', record.get('distance'))),
+                        ('compensation_amount_eur', record.get('compensation_amount_eur'))):
+        value = _number(value)
+        if value is None:
+            canonical.pop(name, None)
+        else:
+            canonical[name] = value
+    return canonical
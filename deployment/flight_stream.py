@@ -0,0 +1,282 @@
+"""
+Flight Stream Module
+--------------------
+Incremental reader for flight documents too large to load at once.
+
+iter_flights() parses `{"metadata": {...}, "flights": [...]}` (or a bare array of
+flights) from a file in fixed-size chunks and yields one flight record at a time,
+so memory stays bounded by the largest single record rather than the file size.
+Gzip files (the retention archives) are decompressed on the fly.
+
+iter_stored_flights() walks a whole FlightDataStorage directory the same way: the
+main file, each day partition and the write-ahead log, optionally preceded by the
+gzip archives. Only the log is held in memory, and it is bounded by compaction.
+Records from files of an older schema version are normalized on the way out, as the
+storage itself does.
+"""
+
+import io
+import os
+import re
+import gzip
+import json
+import logging
+
+import json_codec
+from flight_index import record_key
+from flight_schema import SCHEMA_VERSION, normalize_flight, schema_version_of
+from flight_data_storage import partition_of, storage_paths
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+_DECODER = json.JSONDecoder()
+# Characters that can follow a complete value
+_DELIMITERS = set(' \t\n\r,:]}')
+
+
+class _ChunkReader:
+    """Text buffer over a file that is refilled from the file on demand."""
+    def __init__(self, f, chunk_size):
+        self._file = f
+        self._chunk_size = chunk_size
+        self._buffer = ''
+        self._pos = 0
+        self._consumed = 0  # characters dropped from the front of the buffer
+        self._eof = False
+
+    def _fill(self, size=None):
+        if self._eof:
+            return False
+        chunk = self._file.read(size or self._chunk_size)
+        if not chunk:
+            self._eof = True
+            return False
+        self._consumed += self._pos
+        self._buffer = self._buffer[self._pos:] + chunk
+        self._pos = 0
+        return True
+
+    def error(self, message):
+        return ValueError(f"{message} at character {self._consumed + self._pos}")
+
+    def peek(self):
+        """Next non-whitespace character ('' at end of input), without consuming it."""
+        while True:
+            self._pos = _WHITESPACE.match(self._buffer, self._pos).end()
+            if self._pos < len(self._buffer) or not self._fill():
+                return self._buffer[self._pos:self._pos + 1]
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise self.error(f"Expected {char!r}")
+        self._pos += 1
+
+    def separator(self, close):
+        """Consume ',' (returns True) or the closing bracket (returns False)."""
+        char = self.peek()
+        if char not in (',', close):
+            raise self.error(f"Expected ',' or {close!r}")
+        self._pos += 1
+        return char == ','
+
+    def value(self):
+        """Decode the next JSON value, reading more input until it is complete."""
+        self.peek()
+        while True:
+            try:
+                value, end = _DECODER.raw_decode(self._buffer, self._pos)
+            except json.JSONDecodeError as e:
+                if self._eof:
+                    raise self.error(f"Invalid JSON ({e.msg})") from None
+                value, end = None, None
+            # A number cut by the end of the buffer ("4.5e|3") decodes as a shorter one,
+            # so only accept a value once a delimiter follows it
+            if end is not None and (self._eof or self._buffer[end:end + 1] in _DELIMITERS):
+                self._pos = end
+                return value
+            # Read at least as much again as is buffered, so a huge value costs O(n) retries
+            self._fill(max(self._chunk_size, len(self._buffer) - self._pos))
+
+
+def _open_text(source):
+    """(text file, whether we opened it) for a path or an open text/binary file."""
+    if not isinstance(source, (str, bytes, os.PathLike)):
+        if isinstance(source.read(0), bytes):
+            return io.TextIOWrapper(source, encoding='utf-8'), False
+        return source, False
+    path = os.fspath(source)
+    opener = gzip.open if str(path).endswith('.gz') else open
+    return opener(path, 'rt', encoding='utf-8'), True
+
+
+def iter_flights(source, key="flights", metadata=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Yield the flight records of a JSON document one at a time.
+
+    Args:
+        source: Path (".gz" files are decompressed) or an open text or binary file
+        key: Top-level key holding the array of records
+        metadata: Optional dict that receives every other top-level value as it is
+            passed (so "metadata" is available before the first flight when it comes first)
+        chunk_size: Characters read per refill
+
+    Yields:
+        dict: One flight record
+
+    Raises:
+        ValueError: The document is not valid JSON of the expected shape
+    """
+    f, owned = _open_text(source)
+    try:
+        reader = _ChunkReader(f, chunk_size)
+        char = reader.peek()
+        if char == '[':
+            yield from _iter_array(reader)
+            return
+        reader.expect('{')
+        if reader.peek() == '}':
+            return
+        while True:
+            name = reader.value()
+            if not isinstance(name, str):
+                raise reader.error("Expected an object key")
+            reader.expect(':')
+            if name == key and reader.peek() == '[':
+                yield from _iter_array(reader)
+            else:
+                value = reader.value()
+                if metadata is not None:
+                    metadata[name] = value
+            if not reader.separator('}'):
+                return
+    finally:
+        if owned:
+            f.close()
+
+
+def _iter_array(reader):
+    reader.expect('[')
+    if reader.peek() == ']':
+        reader.expect(']')
+        return
+    while True:
+        yield reader.value()
+        if not reader.separator(']'):
+            return
+
+
+def _revision_of(metadata):
+    return int((metadata.get("metadata") or {}).get("revision", 0))
+
+
+def _read_log(wal_path):
+    """{key: (revision, record)} of the latest put per record in a write-ahead log."""
+    overlay = {}
+    try:
+        with open(wal_path, 'rb') as f:
+            for line in f:
+                # A line without its newline is still being appended (or was torn by a crash)
+                if not line.endswith(b'\n') or not line.strip():
+                    continue
+                try:
+                    entry = json_codec.loads(line)
+                    if entry.get("op") == "put":
+                        flight = entry["flight"]
+                        if entry.get("v", 1) < SCHEMA_VERSION:
+                            flight = normalize_flight(flight)
+                        overlay[(partition_of(flight), record_key(flight))] = (entry.get("rev", 0), flight)
+                except (ValueError, KeyError, TypeError) as e:
+                    logger.error(f"Skipping unreadable log entry in {wal_path}: {e}")
+    except FileNotFoundError:
+        pass
+    return overlay
+
+
+def _day_files(directory, suffix):
+    """{day: path} of the day files in a partition or archive directory."""
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return {}
+    return {name[:-len(suffix)]: os.path.join(directory, name)
+            for name in names if name.endswith(suffix) and not name.startswith(".")}
+
+
+def _iter_current(path, metadata, chunk_size):
+    """iter_flights() of a storage file, normalizing records if the file predates the schema."""
+    for record in iter_flights(path, metadata=metadata, chunk_size=chunk_size):
+        # The writers put "metadata" first, so it is known by the first record
+        if schema_version_of(metadata.get("metadata")) < SCHEMA_VERSION:
+            record = normalize_flight(record)
+        yield record
+
+
+def is_storage_file(path):
+    """Whether `path` is the main file of a FlightDataStorage dataset with partitions or a log."""
+    paths = storage_paths(path)
+    return os.path.isdir(paths["partition_dir"]) or os.path.exists(paths["wal"])
+
+
+def iter_stored_flights(path, include_archive=False, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Yield every flight of a FlightDataStorage dataset one at a time, as the storage
+    would return it: log entries replace the snapshot copies of their records.
+
+    Args:
+        path: The storage's main data file (flight_compensation_data.json)
+        include_archive: Also yield the gzip-archived days, first
+        chunk_size: Characters read per refill
+
+    Yields:
+        dict: One flight record
+    """
+    paths = storage_paths(path)
+    overlay = _read_log(paths["wal"])
+    partitions = _day_files(paths["partition_dir"], ".json")
+
+    def newer(record, revision):
+        entry = overlay.pop((partition_of(record), record_key(record)), None)
+        return entry[1] if entry is not None and entry[0] > revision else record
+
+    if include_archive:
+        for day, archive_path in sorted(_day_files(paths["archive_dir"], ".json.gz").items()):
+            # Records updated after archiving live in a new partition for the day
+            live = set()
+            if day in partitions:
+                live = {record_key(r) for r in _iter_current(partitions[day], {}, chunk_size)}
+            live.update(key for (d, key) in overlay if d == day)
+            for record in _iter_current(archive_path, {}, chunk_size):
+                if record_key(record) not in live:
+                    yield record
+
+    metadata = {}
+    for record in _iter_current(path, metadata, chunk_size):
+        yield newer(record, _revision_of(metadata))
+    # Log entries up to the main file's revision were folded in before it was written
+    main_revision = _revision_of(metadata)
+
+    for day, partition_path in sorted(partitions.items()):
+        metadata = {}
+        for record in _iter_current(partition_path, metadata, chunk_size):
+            yield newer(record, max(_revision_of(metadata), main_revision))
+
+    # Records only in the log
+    for revision, record in overlay.values():
+        if revision > main_revision:
+            yield record
+
+
+def iter_dataset(path, include_archive=False, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Flights of `path`, whatever it is: a storage directory, a storage main file, or a
+    standalone (optionally gzipped) JSON document such as a backup or an archive day.
+    """
+    if os.path.isdir(path):
+        path = os.path.join(path, "flight_compensation_data.json")
+    if include_archive or is_storage_file(path):
+        return iter_stored_flights(path, include_archive=include_archive, chunk_size=chunk_size)
+    return iter_flights(path, chunk_size=chunk_size)
@@ -0,0 +1,39 @@
+"""
+Gunicorn Configuration
+----------------------
+Pre-fork deployment of fixed_wsgi_app with warm loading (see prefork): the master
+imports the app and reads the whole dataset once, then forks workers that share
+the parsed records copy-on-write instead of each parsing its own copy.
+
+  cd /home/PiotrS/deployment && gunicorn -c gunicorn.conf.py fixed_wsgi_app:application
+
+Environment variables:
+- GUNICORN_BIND: Address to listen on (default 127.0.0.1:8000)
+- GUNICORN_WORKERS: Worker processes (default 4)
+- GUNICORN_THREADS: Threads per worker (default 1)
+- PREFORK_WARM: Set to 0 to skip the warm load (workers then load on first use)
+
+uWSGI loads the app in its master the same way unless lazy-apps is on; there,
+export PREFORK_WARM=1 to get the same warm load.
+"""
+
+import gc
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '127.0.0.1:8000')
+workers = int(os.environ.get('GUNICORN_WORKERS', '4'))
+threads = int(os.environ.get('GUNICORN_THREADS', '1'))
+timeout = 60
+
+# Import the app (and warm-load the data) in the master, before forking
+preload_app = True
+os.environ.setdefault('PREFORK_WARM', '1')
+
+# No collections while the master loads: objects freed in between would leave holes
+# in pages the workers share. prefork.warm() collects once and freezes the rest.
+gc.disable()
+
+
+def post_fork(server, worker):
+    # Workers collect as usual; the frozen objects of the master are never scanned
+    gc.enable()
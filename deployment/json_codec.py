@@ -0,0 +1,87 @@
+"""
+JSON Codec Module
+-----------------
+Single JSON encoder/decoder for storage files and HTTP responses. The fastest
+library available at import time is used: orjson, then ujson, then the standard
+library json module. Set FLIGHT_JSON_CODEC=orjson|ujson|stdlib to force one.
+
+dumps() returns UTF-8 bytes directly and every backend is configured to emit the
+same bytes: compact separators, non-ASCII characters unescaped, "/" unescaped,
+non-string dict keys converted to strings, tuples as arrays and datetimes as ISO
+8601 strings. The one known difference is the spelling of floats that need an
+exponent (orjson writes 1e16, the others 1e+16); they parse to the same value.
+"""
+
+import os
+import json
+import logging
+from datetime import date, datetime, time
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Every backend raises a subclass of this from loads() on invalid input
+JSONDecodeError = ValueError
+
+
+def _default(obj):
+    """Encode the non-JSON types the backends would otherwise disagree on."""
+    if isinstance(obj, (datetime, date, time)):
+        return obj.isoformat()
+    if isinstance(obj, tuple):
+        # orjson refuses tuple subclasses such as namedtuples
+        return list(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def _orjson_codec():
+    import orjson
+    options = orjson.OPT_NON_STR_KEYS
+
+    def dumps(obj):
+        return orjson.dumps(obj, default=_default, option=options)
+    return dumps, orjson.loads
+
+
+def _ujson_codec():
+    import ujson
+
+    def dumps(obj):
+        return ujson.dumps(obj, ensure_ascii=False, escape_forward_slashes=False,
+                           default=_default).encode('utf-8')
+    return dumps, ujson.loads
+
+
+def _stdlib_codec():
+    encoder = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'), default=_default)
+
+    def dumps(obj):
+        return encoder.encode(obj).encode('utf-8')
+    return dumps, json.loads
+
+
+# Preference order
+_FACTORIES = (("orjson", _orjson_codec), ("ujson", _ujson_codec), ("stdlib", _stdlib_codec))
+
+
+def _available_backends():
+    backends = {}
+    for name, factory in _FACTORIES:
+        try:
+            backends[name] = factory()
+        except ImportError:
+            continue
+    return backends
+
+
+# name -> (dumps, loads) for every backend importable here
+BACKENDS = _available_backends()
+
+BACKEND = os.environ.get('FLIGHT_JSON_CODEC', '').strip().lower()
+if BACKEND not in BACKENDS:
+    if BACKEND:
+        logger.warning(f"JSON codec '{BACKEND}' is not available, choosing automatically")
+    BACKEND = next(iter(BACKENDS))
+
+# dumps(obj) -> bytes and loads(bytes or str) -> object of the selected backend
+dumps, loads = BACKENDS[BACKEND]
@@ -0,0 +1,190 @@
+"""
+Memory Diagnostics Module
+-------------------------
+Measures memory growth of a running worker.
+
+MemoryDiagnostics wraps tracemalloc: start() begins tracing allocations,
+snapshot(name) keeps a named snapshot, and diff(old, new) compares two of them
+grouped by file:line, so growth between e.g. "after-startup" and "after-peak" shows
+which lines hold the new memory. report() adds the process RSS, the sizes of the
+in-memory caches registered as `sources`, and optionally the most common object
+types counted by the garbage collector.
+
+Everything here is per process: tracing, snapshots and counts describe the worker
+that serves the request (its pid is part of every report).
+"""
+
+import gc
+import os
+import time
+import logging
+import threading
+import tracemalloc
+from collections import Counter, OrderedDict
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Allocations made by tracemalloc and the import machinery are noise in every diff
+_SNAPSHOT_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+
+
+def rss_bytes():
+    """Resident set size of this process, or None where /proc is not available."""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+def _stat_entry(stat):
+    frame = stat.traceback[0]
+    return {
+        "location": f"{frame.filename}:{frame.lineno}",
+        "size": stat.size,
+        "size_diff": stat.size_diff,
+        "count": stat.count,
+        "count_diff": stat.count_diff,
+    }
+
+
+class MemoryDiagnostics:
+    """tracemalloc snapshots and cache sizes of this process (see module docstring)."""
+    def __init__(self, sources=None, max_snapshots=8):
+        """
+        Args:
+            sources: {name: callable} returning the size of an in-memory cache
+                (a number or a dict of numbers)
+            max_snapshots: Named snapshots kept (oldest dropped first)
+        """
+        self.sources = dict(sources or {})
+        self.max_snapshots = max_snapshots
+        self._lock = threading.Lock()
+        self._snapshots = OrderedDict()  # name -> (taken at, Snapshot)
+
+    def start(self, frames=1):
+        """Start tracing allocations (no-op if already tracing). Returns the status."""
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+            logger.info(f"Started tracemalloc with {frames} frame(s) in process {os.getpid()}")
+        return self.status()
+
+    def stop(self):
+        """Stop tracing and drop the snapshots (their traces are meaningless afterwards)."""
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+            logger.info(f"Stopped tracemalloc in process {os.getpid()}")
+        with self._lock:
+            self._snapshots.clear()
+        return self.status()
+
+    def status(self):
+        """Tracing state, traced memory and the names of the kept snapshots."""
+        tracing = tracemalloc.is_tracing()
+        current, peak = tracemalloc.get_traced_memory() if tracing else (0, 0)
+        with self._lock:
+            snapshots = [{"name": name, "at": at} for name, (at, _) in self._snapshots.items()]
+        return {
+            "pid": os.getpid(),
+            "tracing": tracing,
+            "frames": tracemalloc.get_traceback_limit() if tracing else 0,
+            "traced_bytes": current,
+            "traced_peak_bytes": peak,
+            "snapshots": snapshots,
+        }
+
+    def snapshot(self, name):
+        """
+        Take a snapshot of the traced allocations and keep it as `name`.
+
+        Raises:
+            RuntimeError: tracemalloc is not tracing (call start() first)
+        """
+        if not tracemalloc.is_tracing():
+            raise RuntimeError("tracemalloc is not tracing")
+        snapshot = tracemalloc.take_snapshot().filter_traces(_SNAPSHOT_FILTERS)
+        with self._lock:
+            self._snapshots.pop(name, None)
+            self._snapshots[name] = (time.time(), snapshot)
+            while len(self._snapshots) > self.max_snapshots:
+                self._snapshots.popitem(last=False)
+        logger.info(f"Took memory snapshot {name!r} in process {os.getpid()}")
+        return {"name": name, "traces": len(snapshot.traces)}
+
+    def diff(self, old, new=None, top=25):
+        """
+        Allocation growth between two named snapshots, grouped by file:line.
+
+        Args:
+            old: Name of the earlier snapshot
+            new: Name of the later snapshot, or None to compare against a fresh one
+            top: Number of lines returned, largest growth first
+
+        Returns:
+            dict: {"old", "new", "size_diff", "count_diff", "lines": [...]}
+
+        Raises:
+            KeyError: a snapshot name is unknown
+            RuntimeError: `new` is None and tracemalloc is not tracing
+        """
+        with self._lock:
+            if old not in self._snapshots or (new is not None and new not in self._snapshots):
+                raise KeyError(old if old not in self._snapshots else new)
+            before = self._snapshots[old][1]
+            after = self._snapshots[new][1] if new is not None else None
+        if after is None:
+            if not tracemalloc.is_tracing():
+                raise RuntimeError("tracemalloc is not tracing")
+            after = tracemalloc.take_snapshot().filter_traces(_SNAPSHOT_FILTERS)
+        stats = after.compare_to(before, 'lineno')
+        return {
+            "pid": os.getpid(),
+            "old": old,
+            "new": new or "now",
+            "size_diff": sum(stat.size_diff for stat in stats),
+            "count_diff": sum(stat.count_diff for stat in stats),
+            "lines": [_stat_entry(stat) for stat in stats[:top]],
+        }
+
+    def cache_sizes(self):
+        """Sizes reported by every source ({name: size or {"error": ...}})."""
+        sizes = {}
+        for name, source in self.sources.items():
+            try:
+                sizes[name] = source()
+            except Exception as e:
+                logger.error(f"Memory source {name} failed: {e}")
+                sizes[name] = {"error": str(e)}
+        return sizes
+
+    def report(self, object_types=0):
+        """
+        Memory overview of this process.
+
+        Args:
+            object_types: Also count live objects by type and return this many of
+                the most common (walks every tracked object; 0 skips it)
+
+        Returns:
+            dict: status() plus rss_bytes, gc counts, caches and optionally objects
+        """
+        report = self.status()
+        report["rss_bytes"] = rss_bytes()
+        report["gc_counts"] = list(gc.get_count())
+        report["caches"] = self.cache_sizes()
+        if object_types > 0:
+            counts = Counter(type(obj).__name__ for obj in gc.get_objects())
+            report["objects"] = {
+                "tracked": sum(counts.values()),
+                "types": [{"type": name, "count": count} for name, count in counts.most_common(object_types)],
+            }
+        return report
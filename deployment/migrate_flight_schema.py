@@ -0,0 +1,46 @@
+"""
+Migrate Flight Schema Script
+----------------------------
+One-time migration of a flight store to the canonical record schema of
+flight_schema: rewrites the main file and every day partition with normalized
+records. Safe to re-run; a store that is already current is left untouched.
+
+The storage also migrates on its first write after a deploy; run this right after
+deploying to do it up front instead:
+  python /home/PiotrS/deployment/migrate_flight_schema.py
+"""
+
+import sys
+import argparse
+import logging
+
+from flight_data_storage import FlightDataStorage
+from flight_schema import SCHEMA_VERSION
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger("migrate_flight_schema")
+
+def main():
+    parser = argparse.ArgumentParser(description="Rewrite stored flights in the canonical record schema")
+    parser.add_argument('--data-dir', help="Storage directory (default FLIGHT_DATA_DIR)")
+    args = parser.parse_args()
+
+    storage = FlightDataStorage(data_dir=args.data_dir)
+    try:
+        migrated = storage.migrate_schema()
+    except Exception as e:
+        logger.error(f"Migration failed: {e}")
+        return 1
+
+    if migrated:
+        logger.info(f"Rewrote {storage.filepath} and its partitions in schema version {SCHEMA_VERSION}")
+    else:
+        logger.info(f"{storage.filepath} is already at schema version {SCHEMA_VERSION}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
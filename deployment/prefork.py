@@ -0,0 +1,96 @@
+"""
+Prefork Module
+--------------
+Warm loading for pre-forking servers (gunicorn with preload_app, uWSGI without
+lazy-apps), which import the app once in a master process and fork the workers
+from it.
+
+warm() reads and normalizes the whole dataset in the master (FlightDataStorage.warm
+plus derived structures such as the flight number index), then collects garbage and
+gc.freeze()s everything left. The workers start with the records parsed - no
+cold-start parse - and share their pages copy-on-write with the master and each
+other; freezing keeps the collector of each worker from writing to those objects
+and so un-sharing the pages. The columnar snapshot is a read-only file mapping, so
+it is shared through the page cache either way.
+
+The storage generation at warm-up is recorded. When the data changes, each worker's
+storage refreshes as usual and its generation moves on: it swaps to the new records
+for its own use, while the untouched inherited pages stay shared. status() reports
+both generations, so /admin/memory shows whether a worker still serves the snapshot
+it was forked with.
+
+Process-local state that must not be inherited (connection pools, per-worker
+metrics) is reset in each child by callbacks registered with at_fork_in_child().
+"""
+
+import gc
+import os
+import time
+import logging
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+_warm = None  # {"pid", "generation", "records", "seconds", "at"} of the last warm()
+
+
+def warm(storage, builders=()):
+    """
+    Load everything the workers will read, then freeze it for copy-on-write sharing.
+
+    Args:
+        storage: FlightDataStorage of the app
+        builders: Callables building derived caches from the loaded data
+
+    Returns:
+        dict: pid, generation, records, frozen objects and seconds taken
+    """
+    global _warm
+    started = time.perf_counter()
+    records = storage.warm()
+    for build in builders:
+        build()
+    # Free what loading left behind before freezing, so the frozen heap has no holes
+    gc.collect()
+    gc.freeze()
+    _warm = {
+        "pid": os.getpid(),
+        "generation": storage.generation,
+        "records": records,
+        "seconds": round(time.perf_counter() - started, 3),
+        "at": time.time(),
+    }
+    logger.info(f"Warm-loaded {records} records (generation {_warm['generation']}) in {_warm['seconds']}s; "
+                f"{gc.get_freeze_count()} objects frozen for the workers")
+    return dict(_warm, frozen=gc.get_freeze_count())
+
+
+def at_fork_in_child(callback):
+    """Run `callback()` in every child forked from this process (errors are logged)."""
+    def run():
+        try:
+            callback()
+        except Exception as e:
+            logger.error(f"After-fork reset {getattr(callback, '__name__', callback)} failed: {e}")
+    os.register_at_fork(after_in_child=run)
+
+
+def status(storage):
+    """
+    Warm-up state of this process for diagnostics.
+
+    Returns:
+        dict: Whether the data was warm-loaded (here or in the parent this worker was
+            forked from), the generation then and now, and the frozen object count
+    """
+    if _warm is None:
+        return {"warmed": False, "generation": storage.generation}
+    return {
+        "warmed": True,
+        "inherited": _warm["pid"] != os.getpid(),
+        "warm_pid": _warm["pid"],
+        "warm_generation": _warm["generation"],
+        "generation": storage.generation,
+        "records": _warm["records"],
+        "frozen_objects": gc.get_freeze_count(),
+    }
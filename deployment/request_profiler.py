@@ -0,0 +1,187 @@
+"""
+Request Profiler Module
+-----------------------
+On-demand cProfile of individual production requests.
+
+RequestProfiler is a middleware that, when enabled, profiles a request if it
+carries the profiling token (`X-Profile-Token` header) or falls in the random
+sample (`sample_rate`). The top functions by cumulative time are kept in a ring
+buffer per route, and the response gets an `X-Profile-Id` header naming the entry.
+At most one request per process is profiled at a time, so a burst of sampled
+requests can't multiply the overhead.
+
+With a directory, each worker mirrors its buffer to `<directory>/profiles-<pid>.json`
+and profiles() returns the entries of every worker, so the admin endpoint finds a
+profile whichever worker served the request.
+"""
+
+import os
+import io
+import time
+import random
+import pstats
+import cProfile
+import hmac
+import logging
+import threading
+from collections import deque
+
+import json_codec
+from wsgi_routing import route_name
+from flight_data_storage import write_bytes_atomic
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+
+class RequestProfiler:
+    """Profiling middleware (see module docstring)."""
+    def __init__(self, enabled=False, token='', sample_rate=0.0, top=25, per_route=20, directory=None,
+                 stale_seconds=7 * 86400):
+        """
+        Args:
+            enabled: Master switch; when False the middleware only passes requests on
+            token: Secret that X-Profile-Token must match ('' disables the header trigger)
+            sample_rate: Fraction of requests profiled at random (0 disables sampling)
+            top: Functions kept per profile, by cumulative time
+            per_route: Profiles kept per route (oldest dropped first)
+            directory: Shared directory for per-worker buffers (None: this process only)
+            stale_seconds: Buffers of other workers not written for this long are deleted
+        """
+        self.enabled = enabled
+        self.token = token
+        self.sample_rate = sample_rate
+        self.top = top
+        self.per_route = per_route
+        self.directory = directory
+        self.stale_seconds = stale_seconds
+        self._busy = threading.Lock()
+        self._lock = threading.Lock()
+        self._buffers = {}  # route -> deque of profile entries
+        self._sequence = 0
+        if enabled and directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def reset(self):
+        """Drop this process's profiles (in a forked worker: those of its parent)."""
+        with self._lock:
+            self._buffers = {}
+            self._sequence = 0
+
+    def _wanted(self, request):
+        supplied = request.header('X-Profile-Token')
+        if supplied and self.token:
+            return 'token' if hmac.compare_digest(supplied, self.token) else None
+        if self.sample_rate > 0 and random.random() < self.sample_rate:
+            return 'sample'
+        return None
+
+    def __call__(self, request, handler):
+        if not self.enabled:
+            return handler(request)
+        trigger = self._wanted(request)
+        # Never profile two requests of this process at once
+        if trigger is None or not self._busy.acquire(blocking=False):
+            return handler(request)
+        try:
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError as e:
+                # Another profiler is active in this thread
+                logger.warning(f"Not profiling {request.path}: {e}")
+                return handler(request)
+            started = time.perf_counter()
+            try:
+                response = handler(request)
+            finally:
+                profiler.disable()
+        finally:
+            self._busy.release()
+        elapsed = time.perf_counter() - started
+        entry = self._entry(request, response, profiler, elapsed, trigger)
+        self._store(entry)
+        response.headers.append(('X-Profile-Id', entry["id"]))
+        return response
+
+    def _entry(self, request, response, profiler, elapsed, trigger):
+        stats = pstats.Stats(profiler, stream=io.StringIO())
+        stats.sort_stats('cumulative')
+        functions = []
+        for func in stats.fcn_list[:self.top]:
+            primitive, calls, own, cumulative, _ = stats.stats[func]
+            functions.append({
+                "function": pstats.func_std_string(func),
+                "calls": calls,
+                "primitive_calls": primitive,
+                "tottime": round(own, 6),
+                "cumtime": round(cumulative, 6),
+            })
+        with self._lock:
+            self._sequence += 1
+            sequence = self._sequence
+        return {
+            "id": f"{os.getpid()}-{sequence}",
+            "route": route_name(request),
+            "path": request.path,
+            "query": request.query_string,
+            "status": response.status,
+            "trigger": trigger,
+            "at": time.time(),
+            "seconds": round(elapsed, 6),
+            "total_calls": stats.total_calls,
+            "functions": functions,
+        }
+
+    def _store(self, entry):
+        with self._lock:
+            buffer = self._buffers.get(entry["route"])
+            if buffer is None:
+                buffer = self._buffers[entry["route"]] = deque(maxlen=self.per_route)
+            buffer.append(entry)
+            entries = [e for b in self._buffers.values() for e in b]
+        logger.info(f"Profiled {entry['path']} ({entry['trigger']}) in {entry['seconds']:.3f}s as {entry['id']}")
+        if self.directory:
+            try:
+                write_bytes_atomic(os.path.join(self.directory, f"profiles-{os.getpid()}.json"),
+                                   json_codec.dumps(entries))
+            except OSError as e:
+                logger.error(f"Could not write profile buffer: {e}")
+
+    def profiles(self, route=None, profile_id=None):
+        """
+        Stored profiles, newest first.
+
+        Args:
+            route: Only this route's profiles
+            profile_id: Only the profile with this X-Profile-Id
+
+        Returns:
+            list: Profile entries ({"id", "route", "seconds", "functions": [...], ...})
+        """
+        with self._lock:
+            entries = [e for b in self._buffers.values() for e in b]
+        if self.directory:
+            own = f"profiles-{os.getpid()}.json"
+            try:
+                names = os.listdir(self.directory)
+            except FileNotFoundError:
+                names = []
+            now = time.time()
+            for name in names:
+                if name == own or not (name.startswith("profiles-") and name.endswith(".json")):
+                    continue
+                path = os.path.join(self.directory, name)
+                try:
+                    if now - os.path.getmtime(path) > self.stale_seconds:
+                        os.unlink(path)
+                        continue
+                    with open(path, 'rb') as f:
+                        entries.extend(json_codec.loads(f.read()))
+                except (OSError, ValueError) as e:
+                    logger.error(f"Skipping unreadable profile buffer {name}: {e}")
+        if route is not None:
+            entries = [e for e in entries if e["route"] == route]
+        if profile_id is not None:
+            entries = [e for e in entries if e["id"] == profile_id]
+        return sorted(entries, key=lambda e: e["at"], reverse=True)
@@ -0,0 +1,243 @@
+"""
+WSGI Metrics Module
+-------------------
+Request metrics in Prometheus text format, aggregated across worker processes.
+
+RequestMetrics is the timing middleware of the app (a RequestTimer) that also keeps,
+per route:
+- latency histograms of the whole request and of each phase the handlers mark
+  with wsgi_routing.phase() (load, filter, eligibility, serialize), plus "write":
+  the time the server spends sending the body
+- requests by status code, response bytes, errors (5xx) and response cache
+  hits/misses (from the X-Cache header of ResponseCache)
+and any counters returned by extra collectors (e.g. upstream AviationStack calls).
+
+Each worker keeps its metrics in memory and, at most every `flush_seconds`, writes
+them to `<directory>/worker-<pid>.json`. render() merges the files of every worker,
+so whichever process answers /metrics reports the whole server. A worker also
+writes its file on a clean exit; one that is killed loses at most `flush_seconds`
+of counts. Files of workers that stopped updating for `stale_seconds` are removed.
+"""
+
+import os
+import time
+import atexit
+import logging
+import threading
+
+import json_codec
+from wsgi_routing import RequestTimer, route_name
+from flight_data_storage import write_bytes_atomic
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+PREFIX = "flight_api"
+# Histogram bucket upper bounds, seconds
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# name -> (type, help); label sets are free-form
+METRICS = {
+    "request_seconds": ("histogram", "Time to produce a response, by route"),
+    "phase_seconds": ("histogram", "Time spent in each request phase, by route"),
+    "requests_total": ("counter", "Requests handled, by route and status code"),
+    "response_bytes_total": ("counter", "Response body bytes sent, by route"),
+    "errors_total": ("counter", "Requests answered with a 5xx status, by route"),
+    "cache_total": ("counter", "Response cache lookups, by route and result"),
+    "upstream_calls_total": ("counter", "AviationStack calls, by result source and error"),
+}
+
+
+class RequestMetrics(RequestTimer):
+    """Timing middleware recording Prometheus metrics (see module docstring)."""
+    def __init__(self, directory=None, flush_seconds=5.0, stale_seconds=86400, collectors=(), slow_seconds=2.0):
+        """
+        Args:
+            directory: Shared directory for per-worker files (None: this process only)
+            flush_seconds: Minimum interval between writes of this worker's file
+            stale_seconds: Worker files not updated for this long are deleted
+            collectors: Callables returning {(metric, ((label, value), ...)): count}
+                of cumulative counters kept elsewhere in this process
+            slow_seconds: Requests slower than this are logged as warnings
+        """
+        super().__init__(slow_seconds=slow_seconds)
+        self.directory = directory
+        self.flush_seconds = flush_seconds
+        self.stale_seconds = stale_seconds
+        self.collectors = list(collectors)
+        self._counters = {}    # (metric, labels) -> value
+        self._histograms = {}  # (metric, labels) -> [bucket counts..., +Inf count, sum]
+        self._flushed_at = 0.0
+        self._flush_lock = threading.Lock()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            # Counts since the last periodic write would be lost when the worker exits
+            atexit.register(self.maybe_flush, True)
+
+    def _observe(self, metric, labels, seconds):
+        histogram = self._histograms.get((metric, labels))
+        if histogram is None:
+            histogram = self._histograms[(metric, labels)] = [0] * (len(BUCKETS) + 1) + [0.0]
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                histogram[i] += 1
+                break
+        else:
+            histogram[len(BUCKETS)] += 1
+        histogram[-1] += seconds
+
+    def reset(self):
+        """Forget this process's metrics (in a forked worker: those of its parent)."""
+        with self._lock:
+            self._stats = {}
+            self._counters = {}
+            self._histograms = {}
+        self._flushed_at = 0.0
+
+    def _count(self, metric, labels, value=1):
+        self._counters[(metric, labels)] = self._counters.get((metric, labels), 0) + value
+
+    def record(self, request, response, elapsed):
+        super().record(request, response, elapsed)
+        route = (("route", route_name(request)),)
+        status = response.status.split(' ', 1)[0]
+        cache = response.header('X-Cache')
+        with self._lock:
+            self._observe("request_seconds", route, elapsed)
+            for name, seconds in request.phases.items():
+                self._observe("phase_seconds", route + (("phase", name),), seconds)
+            self._count("requests_total", route + (("status", status),))
+            if status.startswith('5'):
+                self._count("errors_total", route)
+            if cache:
+                self._count("cache_total", route + (("result", cache.lower()),))
+        request.on_close(lambda sent, seconds: self._sent(route, sent, seconds))
+        self.maybe_flush()
+
+    def _sent(self, route, sent, seconds):
+        with self._lock:
+            self._observe("phase_seconds", route + (("phase", "write"),), seconds)
+            self._count("response_bytes_total", route, sent)
+
+    def _snapshot(self):
+        """This process's metrics as JSON-able lists."""
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {key: list(value) for key, value in self._histograms.items()}
+        for collect in self.collectors:
+            try:
+                counters.update(collect())
+            except Exception as e:
+                logger.error(f"Metrics collector failed: {e}")
+        return {
+            "pid": os.getpid(),
+            "updated": time.time(),
+            "counters": [[metric, [list(label) for label in labels], value]
+                         for (metric, labels), value in counters.items()],
+            "histograms": [[metric, [list(label) for label in labels], value]
+                           for (metric, labels), value in histograms.items()],
+        }
+
+    def _worker_path(self, pid):
+        return os.path.join(self.directory, f"worker-{pid}.json")
+
+    def maybe_flush(self, force=False):
+        """Write this worker's file if `flush_seconds` passed since the last write."""
+        if not self.directory:
+            return
+        now = time.monotonic()
+        if not force and now - self._flushed_at < self.flush_seconds:
+            return
+        # One writer per process; others skip rather than wait
+        if not self._flush_lock.acquire(blocking=force):
+            return
+        try:
+            self._flushed_at = now
+            write_bytes_atomic(self._worker_path(os.getpid()), json_codec.dumps(self._snapshot()))
+        except OSError as e:
+            logger.error(f"Could not write metrics file: {e}")
+        finally:
+            self._flush_lock.release()
+
+    def _worker_snapshots(self):
+        """Snapshots of every live worker (this one taken fresh)."""
+        own = self._snapshot()
+        if not self.directory:
+            return [own]
+        self.maybe_flush(force=True)
+        snapshots = [own]
+        now = time.time()
+        for name in os.listdir(self.directory):
+            if not (name.startswith("worker-") and name.endswith(".json")) or name == f"worker-{own['pid']}.json":
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                with open(path, 'rb') as f:
+                    snapshot = json_codec.loads(f.read())
+            except (OSError, ValueError) as e:
+                logger.error(f"Skipping unreadable metrics file {path}: {e}")
+                continue
+            if now - snapshot.get("updated", 0) > self.stale_seconds:
+                try:
+                    os.unlink(path)
+                except OSError:
+                    pass
+                continue
+            snapshots.append(snapshot)
+        return snapshots
+
+    def render(self):
+        """
+        Metrics of all workers in Prometheus text exposition format (version 0.0.4).
+
+        Returns:
+            bytes: The /metrics body
+        """
+        counters, histograms = {}, {}
+        for snapshot in self._worker_snapshots():
+            for metric, labels, value in snapshot.get("counters", []):
+                key = (metric, tuple(tuple(label) for label in labels))
+                counters[key] = counters.get(key, 0) + value
+            for metric, labels, value in snapshot.get("histograms", []):
+                key = (metric, tuple(tuple(label) for label in labels))
+                merged = histograms.get(key)
+                histograms[key] = value if merged is None else [a + b for a, b in zip(merged, value)]
+
+        lines = []
+        for metric, (kind, description) in METRICS.items():
+            name = f"{PREFIX}_{metric}"
+            series = histograms if kind == "histogram" else counters
+            keys = sorted(key for key in series if key[0] == metric)
+            if not keys:
+                continue
+            lines.append(f"# HELP {name} {description}")
+            lines.append(f"# TYPE {name} {kind}")
+            for key in keys:
+                labels = key[1]
+                if kind == "counter":
+                    lines.append(f"{name}{_labels(labels)} {_number(series[key])}")
+                    continue
+                buckets = series[key]
+                cumulative = 0
+                for bound, count in zip(BUCKETS, buckets):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_labels(labels + (('le', repr(bound)),))} {cumulative}")
+                cumulative += buckets[len(BUCKETS)]
+                lines.append(f"{name}_bucket{_labels(labels + (('le', '+Inf'),))} {cumulative}")
+                lines.append(f"{name}_sum{_labels(labels)} {_number(buckets[-1])}")
+                lines.append(f"{name}_count{_labels(labels)} {cumulative}")
+        return ("\n".join(lines) + "\n").encode('utf-8')
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels) + "}"
+
+
+def _number(value):
+    return repr(round(value, 6)) if isinstance(value, float) else str(value)
@@ -0,0 +1,453 @@
+"""
+WSGI Routing Module
+-------------------
+Table-driven dispatch and a middleware pipeline for the WSGI application.
+
+Handlers take a Request (query string parsed once, on first use) and return a
+Response. Routes live in a dict keyed by path, so an unknown path costs one lookup.
+Every request passes through the same middleware stack, outermost first:
+
+    app = router.wsgi([RequestTimer(), cors, error_mapper, ResponseCache(...), GzipMiddleware()])
+
+A middleware is a callable `(request, handler) -> Response` that calls `handler`
+for the rest of the stack; `request.route` is resolved before the stack runs, so
+middleware can read per-route options (name, cache).
+
+Handlers mark where their time goes with `with phase('load'):` blocks, which add
+up per request in `request.phases`; the time the server then spends sending the
+body is reported to `request.on_close()` callbacks.
+"""
+
+import gzip
+import time
+import logging
+import threading
+import urllib.parse
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import json_codec
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+JSON_TYPE = 'application/json'
+# Content types worth compressing
+_COMPRESSIBLE = ('application/json', 'application/x-ndjson', 'text/')
+
+# Request being handled by the current thread, for phase()
+_local = threading.local()
+
+
+# environ key under which a server layer in front of the app (asgi_app) passes
+# {phase: seconds} it spent on the request before calling it
+PHASES_ENVIRON_KEY = 'wsgi_routing.phases'
+
+
+@contextmanager
+def phase(name):
+    """Add the time spent in the block to phase `name` of the current request (if any)."""
+    request = getattr(_local, 'request', None)
+    if request is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        request.phases[name] = request.phases.get(name, 0.0) + time.perf_counter() - started
+
+
+class Request:
+    """One WSGI request. Query parameters are parsed on first access and kept."""
+    def __init__(self, environ):
+        self.environ = environ
+        self.method = environ.get('REQUEST_METHOD', 'GET').upper()
+        self.path = environ.get('PATH_INFO', '').rstrip('/') or '/'
+        self.query_string = environ.get('QUERY_STRING', '')
+        self.route = None
+        # phase name -> seconds, see phase(); a server layer in front may have timed some already
+        self.phases = dict(environ.get(PHASES_ENVIRON_KEY) or {})
+        self._params = None
+        self._on_close = []
+
+    @property
+    def params(self):
+        """{name: [values]} of the query string, as urllib.parse.parse_qs returns it."""
+        if self._params is None:
+            self._params = urllib.parse.parse_qs(self.query_string)
+        return self._params
+
+    def arg(self, name, default=''):
+        """First value of a query parameter, stripped, or `default`."""
+        values = self.params.get(name)
+        return (values[0] or '').strip() if values else default
+
+    def flag(self, *names):
+        """True if the first of `names` present in the query is 'true', '1' or 'yes'."""
+        for name in names:
+            if name in self.params:
+                return self.arg(name).lower() in ('true', '1', 'yes')
+        return False
+
+    def header(self, name, default=''):
+        """Request header by its HTTP name (e.g. 'Accept-Encoding')."""
+        return self.environ.get('HTTP_' + name.upper().replace('-', '_'), default)
+
+    def on_close(self, callback):
+        """
+        Call `callback(bytes_sent, seconds)` once the server has sent (or abandoned) the
+        body; `seconds` runs from the handler returning to the body being closed.
+        """
+        self._on_close.append(callback)
+
+
+class Response:
+    """
+    Status line, header list and body. The body is bytes, or an iterable of bytes
+    for streamed responses (which the caching and compression middleware pass through).
+    """
+    def __init__(self, body=b'', status='200 OK', headers=None):
+        self.status = status
+        self.headers = list(headers or [])
+        self.body = body
+
+    @classmethod
+    def json(cls, payload, status='200 OK', headers=None):
+        with phase('serialize'):
+            body = json_codec.dumps(payload)
+        return cls(body, status, [('Content-Type', JSON_TYPE)] + list(headers or []))
+
+    @classmethod
+    def html(cls, body, status='200 OK'):
+        return cls(body, status, [('Content-Type', 'text/html')])
+
+    def header(self, name):
+        name = name.lower()
+        for key, value in self.headers:
+            if key.lower() == name:
+                return value
+        return None
+
+    def set_header(self, name, value):
+        self.headers = [(k, v) for k, v in self.headers if k.lower() != name.lower()]
+        self.headers.append((name, value))
+
+    def copy(self):
+        return Response(self.body, self.status, self.headers)
+
+
+class HTTPError(Exception):
+    """Raised by a handler to answer with a JSON error payload (see error_mapper)."""
+    def __init__(self, status, payload, headers=None):
+        super().__init__(payload.get('message') or payload.get('error') or status)
+        self.status = status
+        self.payload = payload
+        self.headers = headers or []
+
+
+class Route:
+    __slots__ = ('name', 'paths', 'handler', 'methods', 'cache')
+
+    def __init__(self, name, paths, handler, methods, cache):
+        self.name = name
+        self.paths = paths
+        self.handler = handler
+        self.methods = methods
+        self.cache = cache
+
+
+class Router:
+    """Exact-path dispatch table."""
+    def __init__(self, not_found=None):
+        """
+        Args:
+            not_found: Handler for paths without a route (default: JSON 404)
+        """
+        self._routes = {}
+        self._not_found = not_found or (lambda request: Response.json(
+            {"error": "not_found", "path": request.path}, '404 Not Found'))
+
+    def add(self, paths, handler, name=None, methods=None, cache=False):
+        """
+        Register `handler` for one or more paths.
+
+        Args:
+            paths: Path or list of paths (without trailing slash; '/' for the root)
+            handler: Callable taking a Request and returning a Response
+            name: Route name used by timing and caching (default: the first path)
+            methods: Allowed methods, or None for any (the handler checks)
+            cache: True to let ResponseCache serve GET responses, or a predicate on
+                the Request deciding per request
+
+        Returns:
+            Route: The registered route
+        """
+        paths = [paths] if isinstance(paths, str) else list(paths)
+        route = Route(name or paths[0], tuple(paths), handler,
+                      frozenset(m.upper() for m in methods) if methods else None, cache)
+        for path in paths:
+            if path in self._routes:
+                raise ValueError(f"Route for {path} already registered")
+            self._routes[path] = route
+        return route
+
+    def route(self, paths, **options):
+        """Decorator form of add()."""
+        def register(handler):
+            self.add(paths, handler, **options)
+            return handler
+        return register
+
+    @property
+    def routes(self):
+        """Registered routes, each once."""
+        return list(OrderedDict((id(r), r) for r in self._routes.values()).values())
+
+    def resolve(self, path):
+        return self._routes.get(path)
+
+    def dispatch(self, request):
+        route = request.route
+        if route is None:
+            return self._not_found(request)
+        if route.methods is not None and request.method not in route.methods:
+            allowed = ', '.join(sorted(route.methods))
+            return Response.json({"error": "method_not_allowed", "allowed": allowed},
+                                 '405 Method Not Allowed', [('Allow', allowed)])
+        return route.handler(request)
+
+    def wsgi(self, middleware=()):
+        """
+        WSGI callable running every request through `middleware` (outermost first)
+        and then the route's handler.
+        """
+        handler = self.dispatch
+        for layer in reversed(list(middleware)):
+            handler = _bind(layer, handler)
+
+        def application(environ, start_response):
+            request = Request(environ)
+            request.route = self.resolve(request.path)
+            _local.request = request
+            try:
+                response = handler(request)
+            finally:
+                _local.request = None
+            headers = response.headers
+            body = response.body
+            if isinstance(body, bytes):
+                if response.header('Content-Length') is None:
+                    headers = headers + [('Content-Length', str(len(body)))]
+                body = [body]
+            start_response(response.status, headers)
+            if request.method == 'HEAD':
+                body = [b'']
+            if request._on_close:
+                return _ClosingBody(body, request._on_close)
+            return body
+
+        return application
+
+
+class _ClosingBody:
+    """Response iterable that reports bytes sent and send time to close callbacks."""
+    def __init__(self, body, callbacks):
+        self._body = body
+        self._callbacks = callbacks
+        self._started = time.perf_counter()
+        self._sent = 0
+
+    def __iter__(self):
+        for chunk in self._body:
+            self._sent += len(chunk)
+            yield chunk
+
+    def close(self):
+        try:
+            if hasattr(self._body, 'close'):
+                self._body.close()
+        finally:
+            elapsed = time.perf_counter() - self._started
+            for callback in self._callbacks:
+                try:
+                    callback(self._sent, elapsed)
+                except Exception as e:
+                    logger.error(f"Response close callback failed: {e}")
+
+
+def _bind(layer, handler):
+    def call(request):
+        return layer(request, handler)
+    return call
+
+
+def route_name(request):
+    """Name of the request's route ('not_found' without one), for metrics and logs."""
+    return request.route.name if request.route is not None else 'not_found'
+
+
+class RequestTimer:
+    """
+    Middleware timing every request per route: adds a Server-Timing header (total and
+    phases) and keeps count / total / max seconds per route, readable with snapshot().
+    Streamed bodies are timed until the handler returns, not until the last chunk is
+    sent. Subclasses extend record() to keep more.
+    """
+    def __init__(self, slow_seconds=2.0):
+        """
+        Args:
+            slow_seconds: Requests slower than this are logged as warnings
+        """
+        self.slow_seconds = slow_seconds
+        self._lock = threading.Lock()
+        self._stats = {}  # route name -> [count, total seconds, max seconds, 5xx count]
+
+    def __call__(self, request, handler):
+        started = time.perf_counter()
+        response = handler(request)
+        elapsed = time.perf_counter() - started
+        timings = [f'app;dur={elapsed * 1000:.1f}']
+        timings.extend(f'{name};dur={seconds * 1000:.1f}' for name, seconds in request.phases.items())
+        response.headers.append(('Server-Timing', ', '.join(timings)))
+        self.record(request, response, elapsed)
+        if elapsed > self.slow_seconds:
+            logger.warning(f"Slow request {request.path}?{request.query_string}: {elapsed:.2f}s")
+        return response
+
+    def record(self, request, response, elapsed):
+        """Account one handled request (called with the response before it is sent)."""
+        name = route_name(request)
+        with self._lock:
+            stats = self._stats.setdefault(name, [0, 0.0, 0.0, 0])
+            stats[0] += 1
+            stats[1] += elapsed
+            stats[2] = max(stats[2], elapsed)
+            if response.status.startswith('5'):
+                stats[3] += 1
+
+    def snapshot(self):
+        """{route: {"count", "total_seconds", "max_seconds", "errors"}} since start."""
+        with self._lock:
+            return {name: {"count": count, "total_seconds": round(total, 6),
+                           "max_seconds": round(peak, 6), "errors": errors}
+                    for name, (count, total, peak, errors) in self._stats.items()}
+
+
+def error_mapper(request, handler):
+    """Middleware turning HTTPError into its JSON response and anything else into a JSON 500."""
+    try:
+        return handler(request)
+    except HTTPError as e:
+        return Response.json(e.payload, e.status, e.headers)
+    except Exception as e:
+        logger.exception(f"Unhandled error serving {request.path}: {e}")
+        return Response.json({"error": str(e), "message": "Internal server error"}, '500 Internal Server Error')
+
+
+def cors(request, handler):
+    """Middleware adding `Access-Control-Allow-Origin: *` to every response."""
+    response = handler(request)
+    if response.header('Access-Control-Allow-Origin') is None:
+        response.headers.append(('Access-Control-Allow-Origin', '*'))
+    return response
+
+
+def accepts_gzip(request):
+    for coding in request.header('Accept-Encoding').split(','):
+        name, _, params = coding.strip().partition(';')
+        if name.strip().lower() in ('gzip', '*'):
+            return params.replace(' ', '') not in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000')
+    return False
+
+
+class ResponseCache:
+    """
+    Middleware serving repeated GET requests of cacheable routes from memory.
+
+    Entries are keyed by route, query string and gzip acceptance, and are dropped
+    when `version()` changes (e.g. the storage generation) or after `ttl` seconds,
+    so time-windowed answers don't go stale. Only complete 200 responses are kept.
+    A request with `Cache-Control: no-cache` is always handled (and refreshes the entry).
+    """
+    def __init__(self, ttl=30.0, version=None, max_entries=256):
+        """
+        Args:
+            ttl: Seconds an entry may be served
+            version: Callable returning the data version responses depend on
+            max_entries: Least recently used entries beyond this are evicted
+        """
+        self.ttl = ttl
+        self.version = version or (lambda: None)
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (version, expires, Response)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _cacheable(self, request):
+        route = request.route
+        if route is None or not route.cache or request.method not in ('GET', 'HEAD'):
+            return False
+        return route.cache(request) if callable(route.cache) else True
+
+    def __call__(self, request, handler):
+        if self.ttl <= 0 or not self._cacheable(request):
+            return handler(request)
+        key = (request.route.name, request.query_string, accepts_gzip(request))
+        version = self.version()
+        now = time.monotonic()
+        revalidate = 'no-cache' in request.header('Cache-Control').lower()
+        with self._lock:
+            entry = None if revalidate else self._entries.get(key)
+            if entry is not None and entry[0] == version and entry[1] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                response = entry[2].copy()
+                response.headers.append(('X-Cache', 'HIT'))
+                return response
+            self.misses += 1
+
+        response = handler(request)
+        if response.status.startswith('200') and isinstance(response.body, bytes):
+            with self._lock:
+                self._entries[key] = (version, now + self.ttl, response.copy())
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        response.headers.append(('X-Cache', 'MISS'))
+        return response
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class GzipMiddleware:
+    """Middleware gzip-compressing text and JSON bodies for clients that accept it."""
+    def __init__(self, min_size=1024, level=5):
+        """
+        Args:
+            min_size: Bodies smaller than this many bytes are sent as they are
+            level: gzip compression level
+        """
+        self.min_size = min_size
+        self.level = level
+
+    def __call__(self, request, handler):
+        response = handler(request)
+        body = response.body
+        if (not isinstance(body, bytes) or len(body) < self.min_size
+                or response.header('Content-Encoding') is not None
+                or not (response.header('Content-Type') or '').startswith(_COMPRESSIBLE)):
+            return response
+        vary = response.header('Vary')
+        response.set_header('Vary', f"{vary}, Accept-Encoding" if vary else 'Accept-Encoding')
+        if not accepts_gzip(request):
+            return response
+        response.body = gzip.compress(body, self.level)
+        response.set_header('Content-Encoding', 'gzip')
+        return response
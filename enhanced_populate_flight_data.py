@@ -28,9 +28,6 @@ else:
     # PythonAnywhere deployment path
     DATA_FILE = "/home/PiotrS/data/flight_compensation_data.json"
 
-# Create data directory if it doesn't exist
-os.makedirs(os.path.dirname(DATA_FILE), exist_ok=True)
-
 def generate_flight_id():
     """Generate a unique flight ID"""
     return str(uuid.uuid4())[:8]
@@ -481,7 +478,8 @@ def main():
         "eligible_count": sum(1 for f in flights if f.get("_debug_eligible", False))
     }
     
-    # Save flight data
+    # Save flight data (create the data directory if it doesn't exist)
+    os.makedirs(os.path.dirname(DATA_FILE), exist_ok=True)
     with open(DATA_FILE, "w") as f:
         json.dump(flight_data, f)
         
@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""
+Head-to-head benchmark of the WSGI app (deployment/fixed_wsgi_app.py) and its ASGI
+entry point (deployment/asgi_app.py) on /compensation-check calls that go upstream.
+- Starts the AviationStack stand-in (deployment/aviationstack_stub_server.py) in
+  process with --latency-ms of upstream latency, and points the client at it
+- Runs the app against an empty data directory, so every check misses the stored
+  data and calls the stand-in
+- For each concurrency level, keeps that many requests in flight (closed loop) and
+  reports throughput and p50/p95/p99 latency for both entry points:
+    wsgi: `application(environ, start_response)` on a pool of --threads threads,
+          as a threaded WSGI server worker would run it
+    asgi: `asgi_app.application(scope, receive, send)` with ASGI_WORKER_THREADS=--threads
+- Both use the same process, thread budget and upstream limits; only the way the
+  upstream wait is spent differs. --output saves the results as JSON.
+
+Usage:
+  python scripts/bench_asgi_vs_wsgi.py
+  python scripts/bench_asgi_vs_wsgi.py --concurrency 8,64,256,512 --latency-ms 500 --threads 16
+  python scripts/bench_asgi_vs_wsgi.py --routes health --output asgi-vs-wsgi.json
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT, 'deployment'))
+
+
+def _percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+def _wsgi_call(application, path, query):
+    """One WSGI request, body consumed; returns the status code."""
+    environ = {
+        'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': query,
+        'SERVER_NAME': 'bench', 'SERVER_PORT': '80', 'SERVER_PROTOCOL': 'HTTP/1.1',
+        'wsgi.version': (1, 0), 'wsgi.url_scheme': 'http', 'wsgi.input': io.BytesIO(b''),
+        'wsgi.errors': sys.stderr, 'wsgi.multithread': True, 'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    status = []
+    body = application(environ, lambda s, h, exc_info=None: status.append(s))
+    try:
+        for _ in body:
+            pass
+    finally:
+        if hasattr(body, 'close'):
+            body.close()
+    return int(status[0].split(' ', 1)[0])
+
+
+async def _asgi_call(application, path, query):
+    """One ASGI request, body consumed; returns the status code."""
+    scope = {'type': 'http', 'method': 'GET', 'path': path, 'query_string': query.encode(),
+             'headers': [], 'http_version': '1.1', 'scheme': 'http', 'server': ('bench', 80)}
+    status = []
+    sent_request = False
+
+    async def receive():
+        nonlocal sent_request
+        if not sent_request:
+            sent_request = True
+            return {'type': 'http.request', 'body': b''}
+        await asyncio.Event().wait()  # Never disconnects
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            status.append(message['status'])
+
+    await application(scope, receive, send)
+    return status[0]
+
+
+async def _run_level(call, requests, concurrency):
+    """Closed loop: `concurrency` clients issue `requests` calls in total."""
+    targets = iter(range(requests))
+    latencies, errors = [], {}
+
+    async def client():
+        for i in targets:
+            started = time.perf_counter()
+            try:
+                code = await call(i)
+            except Exception as e:
+                code = type(e).__name__
+            latencies.append(time.perf_counter() - started)
+            if code != 200:
+                errors[str(code)] = errors.get(str(code), 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "concurrency": concurrency,
+        "requests": requests,
+        "seconds": round(elapsed, 3),
+        "rps": round(requests / elapsed, 1),
+        "p50_ms": round(_percentile(latencies, 0.50) * 1000, 2),
+        "p95_ms": round(_percentile(latencies, 0.95) * 1000, 2),
+        "p99_ms": round(_percentile(latencies, 0.99) * 1000, 2),
+        "errors": errors,
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="WSGI vs ASGI benchmark on upstream-bound /compensation-check calls")
+    parser.add_argument('--concurrency', default='8,64,256', help="Comma-separated in-flight request counts")
+    parser.add_argument('--requests', type=int, default=0,
+                        help="Requests per level (default: 4x the concurrency, at least 200)")
+    parser.add_argument('--threads', type=int, default=8, help="WSGI threads, and ASGI_WORKER_THREADS")
+    parser.add_argument('--latency-ms', type=float, default=200, help="Upstream latency of the stand-in")
+    parser.add_argument('--jitter-ms', type=float, default=20)
+    parser.add_argument('--flights', type=int, default=2000, help="Flights served by the stand-in")
+    parser.add_argument('--routes', choices=('check', 'health'), default='check',
+                        help="check: upstream-bound /compensation-check; health: /health, no upstream")
+    parser.add_argument('--modes', default='wsgi,asgi')
+    parser.add_argument('--output', help="Write the results as JSON to this file")
+    parser.add_argument('--log', action='store_true', help="Keep the app's logging on")
+    args = parser.parse_args()
+    levels = [int(level) for level in args.concurrency.split(',')]
+
+    import logging
+    if not args.log:
+        logging.disable(logging.WARNING)
+    from aviationstack_stub_server import make_server, StubConfig, generate_flights
+
+    flights = generate_flights(args.flights, seed=0)
+    numbers = [flight['flight']['iata'] for flight in flights]
+    stub_config = StubConfig(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, seed=0)
+    stub = make_server('127.0.0.1', 0, flights, stub_config)
+    threading.Thread(target=stub.serve_forever, daemon=True).start()
+
+    # Upstream limits high enough that the entry point, not the quota, is measured
+    most = str(max(levels))
+    os.environ.update({
+        'AVIATION_STACK_API_KEY': 'bench',
+        'AVIATION_STACK_BASE_URL': f'http://127.0.0.1:{stub.server_address[1]}/v1',
+        'AVIATION_STACK_MODE': 'live',
+        'AVIATION_STACK_MAX_CONCURRENCY': most,
+        'AVIATION_STACK_POOL_SIZE': most,
+        'AVIATION_STACK_RATE_PER_SECOND': '1000000',
+        'AVIATION_STACK_RATE_BURST': '1000000',
+        'ASGI_WORKER_THREADS': str(args.threads),
+        'RESPONSE_CACHE_SECONDS': '0',
+    })
+    os.environ.pop('PREFORK_WARM', None)
+    # Empty data directory: every check misses the stored data and goes upstream
+    os.chdir(tempfile.mkdtemp(prefix='bench-asgi-'))
+    import fixed_wsgi_app
+    import asgi_app
+
+    if args.routes == 'check':
+        path, queries = '/compensation-check', [f'flight_number={number}' for number in numbers]
+    else:
+        path, queries = '/health', ['']
+
+    wsgi_pool = ThreadPoolExecutor(max_workers=args.threads, thread_name_prefix='wsgi-worker')
+
+    async def wsgi(i):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            wsgi_pool, _wsgi_call, fixed_wsgi_app.application, path, queries[i % len(queries)])
+
+    async def asgi(i):
+        return await _asgi_call(asgi_app.application, path, queries[i % len(queries)])
+
+    calls = {"wsgi": wsgi, "asgi": asgi}
+    modes = args.modes.split(',')
+
+    async def run():
+        results = {mode: [] for mode in modes}
+        print(f"{path}: upstream {args.latency_ms:.0f}±{args.jitter_ms:.0f} ms, {args.threads} threads", file=sys.stderr)
+        for concurrency in levels:
+            requests = args.requests or max(200, 4 * concurrency)
+            for mode in modes:
+                await _run_level(calls[mode], min(requests, 2 * args.threads), args.threads)  # Warm-up
+                measured = await _run_level(calls[mode], requests, concurrency)
+                results[mode].append(measured)
+                print(f"  {mode} c={concurrency:<5} {measured['rps']:>8.1f} req/s  p50 {measured['p50_ms']:>8.1f} ms  "
+                      f"p95 {measured['p95_ms']:>8.1f} ms  p99 {measured['p99_ms']:>8.1f} ms  "
+                      f"errors {measured['errors'] or 0}", file=sys.stderr)
+        from aviationstack_client import aclose_client
+        await aclose_client()
+        return results
+
+    results = asyncio.run(run())
+    wsgi_pool.shutdown()
+    stub.shutdown()
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                "python": platform.python_version(),
+                "route": path,
+                "threads": args.threads,
+                "latency_ms": args.latency_ms,
+                "jitter_ms": args.jitter_ms,
+                "upstream_requests": stub_config.requests_served,
+                "results": results,
+            }, f, indent=2)
+        print(f"Results written to {args.output}", file=sys.stderr)
+    return 1 if any(level['errors'] for levels_ in results.values() for level in levels_) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
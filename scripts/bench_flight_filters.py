@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the airline/airport/status/delay filters of /flights and /eligible_flights.
+- Builds a columnar snapshot (deployment/flight_columns.py) of synthetic flights
+- Times ColumnarSnapshot.select_rows (posting-list intersection) against a
+  linear scan of the same flights with flight_columns.matches()
+- Times RecordIndex, which holds the log entries newer than the snapshot
+- Exits with non-zero code if the indexed and scanned results differ
+
+Usage:
+  python scripts/bench_flight_filters.py
+  python scripts/bench_flight_filters.py --flights 100000 --repeat 3
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'deployment'))
+
+import flight_columns  # noqa: E402
+from flight_index import record_key  # noqa: E402
+
+AIRLINES = ['LH', 'BA', 'LO', 'AF', 'KL', 'FR', 'W6', 'U2', 'EW', 'VY', 'TP', 'SK', 'AY', 'IB', 'OS', 'LX']
+AIRPORTS = ['WAW', 'KRK', 'FRA', 'CDG', 'AMS', 'MAD', 'FCO', 'LHR', 'MUC', 'BCN', 'LIS', 'VIE', 'DUB', 'CPH',
+            'ARN', 'HEL', 'ATH', 'BRU', 'PRG', 'BUD', 'OTP', 'SOF', 'ZRH', 'OSL', 'GDN', 'WRO', 'JFK', 'DXB']
+STATUSES = ['landed'] * 12 + ['scheduled'] * 4 + ['active'] * 2 + ['cancelled', 'diverted']
+
+QUERIES = [
+    {"airline": "LH"},
+    {"dep": "WAW"},
+    {"status": "cancelled"},
+    {"min_delay": 180},
+    {"airline": "FR", "dep": "KRK"},
+    {"dep": "WAW", "arr": "LHR"},
+    {"airline": "LO", "status": "cancelled"},
+    {"arr": "CDG", "min_delay": 180},
+    {"airline": "W6", "dep": "GDN", "arr": "BCN", "min_delay": 60},
+]
+
+
+def generate(count, seed=1):
+    """Stored flight records in the app's internal format over the last 90 days."""
+    rnd = random.Random(seed)
+    now = time.time()
+    flights = []
+    for i in range(count):
+        airline = rnd.choice(AIRLINES)
+        dep, arr = rnd.sample(AIRPORTS, 2)
+        departure = now - rnd.uniform(-2, 90) * 86400
+        status = rnd.choice(STATUSES)
+        delay = rnd.choice([0] * 6 + [15, 30, 60, 120, 200, 400])
+        flights.append({
+            'flight': f"{airline}{i}",
+            'airline': {'iata': airline},
+            'departure': {'airport': {'iata': dep},
+                          'scheduledTime': time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(departure))},
+            'arrival': {'airport': {'iata': arr},
+                        'scheduledTime': time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(departure + 7200))},
+            'status': status,
+            'delay': delay,
+            'eligible_for_compensation': delay >= 180 or status == 'cancelled',
+            'source': 'AviationStack',
+        })
+    return flights
+
+
+def best_of(repeat, fn, *args):
+    best, result = None, None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn(*args)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark indexed flight filters against a full scan")
+    parser.add_argument('--flights', type=int, default=1_000_000, help="Synthetic flights in the snapshot")
+    parser.add_argument('--log', type=int, default=10_000, help="Flights held in the log index")
+    parser.add_argument('--repeat', type=int, default=3, help="Runs per measurement (best is reported)")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    flights = generate(args.flights)
+    print(f"Generated {len(flights)} flights in {time.perf_counter() - started:.1f}s")
+
+    started = time.perf_counter()
+    payload = flight_columns.encode_snapshot(flights, revision=1)
+    print(f"Encoded snapshot with posting lists in {time.perf_counter() - started:.1f}s ({len(payload) / 1e6:.1f} MB)")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.columns")
+        with open(path, 'wb') as f:
+            f.write(payload)
+        started = time.perf_counter()
+        snapshot = flight_columns.ColumnarSnapshot(path)
+        print(f"Mapped snapshot in {(time.perf_counter() - started) * 1000:.2f} ms")
+
+        # Row order of the snapshot, so both sides report the same ids
+        rows = sorted((flight_columns.row_values(f) for f in flights), key=lambda values: values[0])
+        del flights
+        log = flight_columns.RecordIndex()
+        for record in generate(args.log, seed=2):
+            log.put(record_key(record), record)
+
+        ok = True
+        print(f"\n{'filters':<48} {'rows':>8} {'index ms':>10} {'scan ms':>10} {'log ms':>8}")
+        for filters in QUERIES:
+            index_s, selected = best_of(args.repeat, snapshot.select_rows, flight_columns.NO_TIME, 0, 0, filters)
+            scan_s, scanned = best_of(args.repeat, lambda: [row for row, values in enumerate(rows)
+                                                             if flight_columns.matches(values, flight_columns.NO_TIME,
+                                                                                       filters=filters)])
+            log_s, _ = best_of(args.repeat, log.select, flight_columns.NO_TIME, 0, 0, filters)
+            if selected != scanned:
+                print(f"{filters}: indexed rows differ from the scan")
+                ok = False
+            label = ', '.join(f"{k}={v}" for k, v in filters.items())
+            print(f"{label:<48} {len(selected):>8} {index_s * 1000:>10.1f} {scan_s * 1000:>10.1f} {log_s * 1000:>8.2f}")
+        snapshot.close()
+
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
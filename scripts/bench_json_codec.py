@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark for deployment/json_codec.py.
+- Encodes and decodes generated flight datasets with every JSON backend installed
+  here (orjson, ujson, stdlib) and with the previous json.dumps(...).encode() call
+- Checks that all backends produce identical bytes and round-trip the data
+- Exits with non-zero code if the backends disagree
+
+Usage:
+  python scripts/bench_json_codec.py
+  python scripts/bench_json_codec.py --sizes 1000,100000 --repeat 3
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'deployment'))
+
+import json_codec  # noqa: E402
+from aviationstack_stub_server import generate_flights  # noqa: E402
+
+
+def _legacy_codec():
+    def dumps(obj):
+        return json.dumps(obj).encode('utf-8')
+    return dumps, json.loads
+
+
+def best_of(repeat, fn, *args):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn(*args)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the JSON codec backends on flight data")
+    parser.add_argument('--sizes', default='1000,10000,100000', help="Comma-separated flight counts")
+    parser.add_argument('--repeat', type=int, default=5, help="Runs per measurement (best is reported)")
+    args = parser.parse_args()
+
+    codecs = dict(json_codec.BACKENDS)
+    codecs['legacy json.dumps'] = _legacy_codec()
+    print(f"Selected backend: {json_codec.BACKEND}; available: {', '.join(json_codec.BACKENDS)}")
+
+    ok = True
+    for size in (int(s) for s in args.sizes.split(',')):
+        document = {"metadata": {"revision": 1, "note": "Kraków → Zürich"},
+                    "flights": generate_flights(size, seed=size)}
+        outputs = {}
+        print(f"\n{size} flights")
+        print(f"{'backend':>18} {'dumps ms':>10} {'loads ms':>10} {'bytes':>12}")
+        for name, (dumps, loads) in codecs.items():
+            encoded = dumps(document)
+            outputs[name] = encoded
+            if loads(encoded) != document:
+                print(f"{name}: round trip changed the data")
+                ok = False
+            dumps_ms = best_of(args.repeat, dumps, document) * 1000
+            loads_ms = best_of(args.repeat, loads, encoded) * 1000
+            print(f"{name:>18} {dumps_ms:>10.1f} {loads_ms:>10.1f} {len(encoded):>12}")
+
+        reference = outputs[json_codec.BACKEND]
+        for name in json_codec.BACKENDS:
+            if outputs[name] != reference:
+                print(f"{name} output differs from {json_codec.BACKEND}")
+                ok = False
+
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,326 @@
+#!/usr/bin/env python3
+"""
+End-to-end benchmark of the WSGI app (deployment/fixed_wsgi_app.py), in process.
+- Generates datasets of 1k/10k/100k/1M flights with enhanced_populate_flight_data
+  and stores each in a fresh FlightDataStorage
+- Calls `application(environ, start_response)` directly for every route and common
+  parameter mixes, consuming the whole body of each response
+- Reports p50/p95/p99 latency, throughput and the peak memory each request
+  allocates (tracemalloc), plus the worker's peak RSS per dataset
+- Saves the results as JSON; --compare prints the change against an earlier run and
+  --max-regression exits with non-zero code when a p95 got worse by more than that
+
+Each dataset runs in its own process, so its memory numbers don't include the
+previous one. Responses are not cached (RESPONSE_CACHE_SECONDS=0) unless --cache is
+given, so the numbers are the handlers' own cost. AVIATION_STACK_API_KEY is unset:
+nothing goes upstream, and routes that would are measured on their error path.
+
+Usage:
+  python scripts/bench_wsgi.py
+  python scripts/bench_wsgi.py --tiers 1k,10k,100k,1m --output bench-new.json
+  python scripts/bench_wsgi.py --compare bench-old.json --max-regression 20
+  python scripts/bench_wsgi.py --tiers 100k --cases eligible --requests 500
+"""
+import argparse
+import contextlib
+import importlib.util
+import io
+import json
+import math
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from wsgiref.util import setup_testing_defaults
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT, 'deployment'))
+
+TIERS = {"1k": 1_000, "10k": 10_000, "100k": 100_000, "1m": 1_000_000}
+
+
+def _cases(sample):
+    """(name, method, path, query, headers, body) of every benchmarked request."""
+    number, day = sample['flight'], sample['departure']['scheduledTime'][:10]
+    batch = json.dumps([{"flight_number": number, "date": day}] * 20).encode()
+    gzip = {'HTTP_ACCEPT_ENCODING': 'gzip'}
+    return [
+        ("home", 'GET', '/', '', {}, b''),
+        ("home_hours", 'GET', '/', 'hours=72', {}, b''),
+        ("flights", 'GET', '/flights', '', {}, b''),
+        ("flights_airline", 'GET', '/flights', 'airline=LH', {}, b''),
+        ("flights_dep_status", 'GET', '/flights', 'dep=WAW&status=CANCELLED', {}, b''),
+        ("flights_min_delay", 'GET', '/flights', 'min_delay=180', {}, b''),
+        ("stats", 'GET', '/stats', '', {}, b''),
+        ("eligible_24h", 'GET', '/eligible_flights', 'hours=24', {}, b''),
+        ("eligible_72h", 'GET', '/eligible_flights', 'hours=72', {}, b''),
+        ("eligible_72h_gzip", 'GET', '/eligible_flights', 'hours=72', gzip, b''),
+        ("eligible_airline", 'GET', '/eligible_flights', 'hours=72&airline=FR', {}, b''),
+        ("eligible_dep_arr", 'GET', '/eu-compensation-eligible', 'hours=72&dep=FRA&arr=LHR', {}, b''),
+        ("compensation_check", 'GET', '/compensation-check', f'flight_number={number}&date={day}', {}, b''),
+        ("compensation_check_missing", 'GET', '/compensation-check', 'flight_number=ZZ0000', {}, b''),
+        ("compensation_batch", 'POST', '/compensation-check/batch', '',
+         {'CONTENT_TYPE': 'application/json'}, batch),
+        ("health", 'GET', '/health', '', {}, b''),
+        ("metrics", 'GET', '/metrics', '', {}, b''),
+        ("not_found", 'GET', '/no-such-page', '', {}, b''),
+    ]
+
+
+def _environ(method, path, query, headers, body):
+    environ = {
+        'REQUEST_METHOD': method,
+        'PATH_INFO': path,
+        'QUERY_STRING': query,
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.input': io.BytesIO(body),
+    }
+    environ.update(headers)
+    setup_testing_defaults(environ)
+    return environ
+
+
+def _request(application, case):
+    """Status code and body bytes of one request, read to the end like a server would."""
+    status = []
+    iterable = application(_environ(*case[1:]), lambda s, h, exc_info=None: status.append(s))
+    size = 0
+    try:
+        for chunk in iterable:
+            size += len(chunk)
+    finally:
+        if hasattr(iterable, 'close'):
+            iterable.close()
+    return status[0].split(' ', 1)[0], size
+
+
+def _percentile(sorted_values, fraction):
+    # Nearest rank
+    return sorted_values[max(0, math.ceil(fraction * len(sorted_values)) - 1)]
+
+
+def _measure(application, case, requests, warmup, seconds):
+    for _ in range(warmup):
+        _request(application, case)
+    latencies, statuses, size = [], {}, 0
+    started = time.perf_counter()
+    while len(latencies) < requests:
+        begin = time.perf_counter()
+        status, size = _request(application, case)
+        latencies.append(time.perf_counter() - begin)
+        statuses[status] = statuses.get(status, 0) + 1
+        # Heavy cases on big datasets: stop at the time budget (but keep a few samples)
+        if len(latencies) >= 5 and time.perf_counter() - started > seconds:
+            break
+    elapsed = time.perf_counter() - started
+
+    # One more request under tracemalloc for the memory it allocates at peak
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    _request(application, case)
+    peak = tracemalloc.get_traced_memory()[1] - baseline
+    tracemalloc.stop()
+
+    latencies.sort()
+    return {
+        "name": case[0],
+        "method": case[1],
+        "path": case[2],
+        "query": case[3],
+        "requests": len(latencies),
+        "status": statuses,
+        "response_bytes": size,
+        "p50_ms": round(_percentile(latencies, 0.50) * 1000, 3),
+        "p95_ms": round(_percentile(latencies, 0.95) * 1000, 3),
+        "p99_ms": round(_percentile(latencies, 0.99) * 1000, 3),
+        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 3),
+        "max_ms": round(latencies[-1] * 1000, 3),
+        "rps": round(len(latencies) / elapsed, 1),
+        "peak_alloc_bytes": peak,
+    }
+
+
+def _generate(count, seed):
+    """Flights from the enhanced generator, with unique flight numbers."""
+    # Loaded by path: the repository root has its own (older) copies of the app modules
+    spec = importlib.util.spec_from_file_location(
+        "enhanced_populate_flight_data", os.path.join(ROOT, 'enhanced_populate_flight_data.py'))
+    generator = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(generator)
+    random.seed(seed)
+    with contextlib.redirect_stdout(io.StringIO()):
+        flights = generator.generate_realistic_flights(num_flights=count)
+    # The generator draws numbers from 1000-9999 per airline; at 100k+ flights the
+    # same number and date would collapse into one stored record
+    for i, flight in enumerate(flights):
+        flight['flight'] = f"{flight['airline']['iata']}{i}"
+    return flights
+
+
+def run_tier(args):
+    """Worker process: build (or reuse) one dataset, benchmark it, write the JSON result."""
+    import logging
+    from flight_data_storage import FlightDataStorage
+    from memory_diagnostics import rss_bytes
+
+    if not args.log:
+        # Per-request INFO lines, and the error every upstream-bound request logs
+        # without an API key, would dominate the timings
+        logging.disable(logging.ERROR)
+    data_dir = args.worker_dir
+    result = {"flights": args.worker_flights}
+    storage = FlightDataStorage(data_dir=os.path.join(data_dir, 'data'))
+    if not storage.load().get('flights'):
+        started = time.perf_counter()
+        flights = _generate(args.worker_flights, args.seed)
+        result["generate_s"] = round(time.perf_counter() - started, 3)
+        started = time.perf_counter()
+        document = storage.load(strict=True)
+        document['flights'] = flights
+        storage.save(document)
+        storage.compact()
+        result["store_s"] = round(time.perf_counter() - started, 3)
+        del flights, document
+    del storage
+
+    # The app keeps its data in ./data and its metrics and profiles next to it
+    os.chdir(data_dir)
+    os.environ.pop('AVIATION_STACK_API_KEY', None)
+    os.environ.pop('ADMIN_TOKEN', None)
+    if not args.cache:
+        os.environ['RESPONSE_CACHE_SECONDS'] = '0'
+    started = time.perf_counter()
+    import fixed_wsgi_app
+    application = fixed_wsgi_app.application
+    sample = fixed_wsgi_app.load_flight_data()['flights'][0]
+    result["stored"] = len(fixed_wsgi_app.load_flight_data()['flights'])
+    result["startup_s"] = round(time.perf_counter() - started, 3)
+    result["rss_after_load_bytes"] = rss_bytes()
+
+    cases = [case for case in _cases(sample)
+             if not args.cases or any(name in case[0] for name in args.cases.split(','))]
+    result["cases"] = []
+    for case in cases:
+        measured = _measure(application, case, args.requests, args.warmup, args.seconds)
+        print(f"  {case[0]:<28} p50 {measured['p50_ms']:>9.2f} ms  p95 {measured['p95_ms']:>9.2f} ms  "
+              f"{measured['rps']:>8.1f} req/s  {measured['status']}", file=sys.stderr)
+        result["cases"].append(measured)
+    result["rss_peak_bytes"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+    with open(args.worker_output, 'w') as f:
+        json.dump(result, f)
+    return 0
+
+
+def _commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def _compare(results, previous_path, max_regression):
+    """Print p95 changes against an earlier results file; return the regressions over the limit."""
+    with open(previous_path) as f:
+        previous = json.load(f)
+    before = {(tier["flights"], case["name"]): case
+              for tier in previous.get("tiers", []) for case in tier.get("cases", [])}
+    print(f"\nCompared with {previous_path} ({previous.get('meta', {}).get('commit')})")
+    print(f"{'flights':>8} {'case':<28} {'p95 before':>11} {'p95 now':>10} {'change':>8}")
+    regressions = []
+    for tier in results["tiers"]:
+        for case in tier["cases"]:
+            old = before.get((tier["flights"], case["name"]))
+            if old is None or not old["p95_ms"]:
+                continue
+            change = (case["p95_ms"] - old["p95_ms"]) / old["p95_ms"] * 100
+            flag = ''
+            if max_regression is not None and change > max_regression:
+                regressions.append((tier["flights"], case["name"], change))
+                flag = '  REGRESSION'
+            print(f"{tier['flights']:>8} {case['name']:<28} {old['p95_ms']:>9.2f}ms {case['p95_ms']:>8.2f}ms "
+                  f"{change:>+7.1f}%{flag}")
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the WSGI app in process on generated datasets")
+    parser.add_argument('--tiers', default='1k,10k,100k', help=f"Dataset sizes to run ({', '.join(TIERS)})")
+    parser.add_argument('--cases', default='', help="Comma-separated substrings of case names to run (default all)")
+    parser.add_argument('--requests', type=int, default=200, help="Timed requests per case")
+    parser.add_argument('--warmup', type=int, default=3, help="Untimed requests per case first")
+    parser.add_argument('--seconds', type=float, default=10.0, help="Time budget per case (at least 5 requests)")
+    parser.add_argument('--seed', type=int, default=1, help="Random seed of the generated datasets")
+    parser.add_argument('--cache', action='store_true', help="Keep the response cache on")
+    parser.add_argument('--log', action='store_true', help="Keep the app's logging on")
+    parser.add_argument('--data-dir', help="Keep generated datasets here and reuse them (default: a temp dir)")
+    parser.add_argument('--output', default='bench_wsgi_results.json', help="Results file")
+    parser.add_argument('--compare', help="Earlier results file to compare p95 latencies with")
+    parser.add_argument('--max-regression', type=float, help="Fail if a p95 grew by more than this many percent")
+    parser.add_argument('--worker-flights', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--worker-dir', help=argparse.SUPPRESS)
+    parser.add_argument('--worker-output', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker_flights:
+        return run_tier(args)
+
+    tiers = [name.strip().lower() for name in args.tiers.split(',') if name.strip()]
+    unknown = [name for name in tiers if name not in TIERS]
+    if unknown:
+        parser.error(f"unknown tiers: {', '.join(unknown)}")
+
+    results = {
+        "meta": {
+            "commit": _commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "started": time.strftime('%Y-%m-%dT%H:%M:%S'),
+            "requests": args.requests,
+            "cache": args.cache,
+            "seed": args.seed,
+        },
+        "tiers": [],
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        for name in tiers:
+            count = TIERS[name]
+            data_dir = os.path.join(args.data_dir or tmp, f"flights-{name}-seed{args.seed}")
+            os.makedirs(data_dir, exist_ok=True)
+            output = os.path.join(tmp, f"result-{name}.json")
+            print(f"{count} flights ({data_dir})", file=sys.stderr)
+            command = [sys.executable, os.path.abspath(__file__), '--worker-flights', str(count),
+                       '--worker-dir', data_dir, '--worker-output', output,
+                       '--requests', str(args.requests), '--warmup', str(args.warmup),
+                       '--seconds', str(args.seconds), '--seed', str(args.seed), '--cases', args.cases]
+            command += ['--cache'] if args.cache else []
+            command += ['--log'] if args.log else []
+            if subprocess.run(command).returncode != 0:
+                print(f"Benchmark of {count} flights failed", file=sys.stderr)
+                return 2
+            with open(output) as f:
+                tier = json.load(f)
+            results["tiers"].append(tier)
+            print(f"  stored {tier['stored']} flights, startup {tier['startup_s']:.2f}s, "
+                  f"peak RSS {tier['rss_peak_bytes'] / 1e6:.0f} MB", file=sys.stderr)
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.compare:
+        regressions = _compare(results, args.compare, args.max_regression)
+        if regressions:
+            print(f"{len(regressions)} case(s) regressed by more than {args.max_regression}% at p95")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Check that every worker answers changes_since() the same way.
+- Opens several FlightDataStorage instances on one data directory, as separate
+  workers would: the writer, one that reads after every write, one that reads
+  only now and then, and a fresh one started at each checkpoint
+- Writes rounds of updates (with repeated records, so the change log compacts and
+  truncates) and compacts the write-ahead log between some of them
+- At each checkpoint asks every instance for the changes after every revision
+  from 0 to one past the current one
+- Exits with non-zero code if two instances disagree on a delta or on which
+  revisions are no longer available (HTTP 410 on /eligible_flights/changes)
+
+Usage:
+  python scripts/check_change_log_workers.py
+  python scripts/check_change_log_workers.py --rounds 20 --log-size 40
+"""
+import argparse
+import logging
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'deployment'))
+
+
+def _flight(number, delay):
+    return {
+        'flight': number,
+        'airline': {'iata': number[:2], 'name': 'Test'},
+        'departure': {'airport': {'iata': 'FRA', 'name': ''}, 'scheduledTime': '2025-06-01T10:00:00'},
+        'arrival': {'airport': {'iata': 'LHR', 'name': ''}, 'scheduledTime': '2025-06-01T12:00:00'},
+        'status': 'LANDED',
+        'delay': delay,
+        'distance_km': 650,
+    }
+
+
+def _answers(storage, last):
+    """changes_since() for every revision up to `last`: change tuples, or 'truncated'."""
+    from flight_changes import ChangesTruncated
+    answers = {}
+    for since in range(last + 2):
+        try:
+            changes, _ = storage.changes_since(since)
+            answers[since] = [tuple(change) for change, _ in changes]
+        except ChangesTruncated:
+            answers[since] = 'truncated'
+    return answers
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Check that all workers agree on the change log")
+    parser.add_argument('--rounds', type=int, default=12, help="Rounds of writes")
+    parser.add_argument('--writes', type=int, default=6, help="Writes per round")
+    parser.add_argument('--log-size', type=int, default=20, help="FLIGHT_CHANGE_LOG_SIZE of every instance")
+    parser.add_argument('--compact-every', type=int, default=3, help="Compact after every Nth round")
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+    os.environ['FLIGHT_CHANGE_LOG_SIZE'] = str(args.log_size)
+    from flight_data_storage import FlightDataStorage
+    data_dir = tempfile.mkdtemp(prefix='check-change-log-')
+
+    writer = FlightDataStorage(data_dir=data_dir)
+    follower = FlightDataStorage(data_dir=data_dir)
+    occasional = FlightDataStorage(data_dir=data_dir)
+    failures = []
+    checkpoints = 0
+    for round_number in range(1, args.rounds + 1):
+        for n in range(args.writes):
+            # Few distinct records, so the log compacts as well as truncates
+            writer.put_flights([_flight(f"LH{(round_number + n) % 5}", round_number * 10 + n)])
+            follower.changes_since(follower.revision)
+        if round_number % args.compact_every == 0:
+            writer.compact()
+        if round_number % 2:
+            continue
+
+        checkpoints += 1
+        fresh = FlightDataStorage(data_dir=data_dir)
+        last = writer.revision
+        workers = {"writer": writer, "follower": follower, "occasional": occasional, "fresh": fresh}
+        answers = {name: _answers(storage, last) for name, storage in workers.items()}
+        expected = answers["fresh"]
+        for name, answer in answers.items():
+            for since in range(last + 2):
+                if answer[since] != expected[since]:
+                    failures.append(f"round {round_number}, since={since}: {name} answered "
+                                    f"{answer[since]!r}, a fresh worker {expected[since]!r}")
+        truncated = sum(1 for since in expected if expected[since] == 'truncated')
+        print(f"  round {round_number:<3} revision {last:<4} {truncated} of {last + 2} "
+              f"revisions truncated", file=sys.stderr)
+
+    for failure in failures[:20]:
+        print(f"FAIL: {failure}", file=sys.stderr)
+    if not failures:
+        print(f"OK: {len(workers)} workers agreed at {checkpoints} checkpoints", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
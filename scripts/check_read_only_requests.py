@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Check that read requests never modify the stored flights.
+- Stores flights in a fresh FlightDataStorage, some in the log and some compacted
+  into the snapshot, including delayed and cancelled ones not flagged eligible
+- Calls the WSGI app (deployment/fixed_wsgi_app.py) in process for every read
+  route that hands stored records to the handlers, several times each
+- Compares storage.get_all_flights() before and after and runs verify_stats()
+- Exits with non-zero code if a stored record changed or the statistics disagree
+
+Usage:
+  python scripts/check_read_only_requests.py
+  python scripts/check_read_only_requests.py --requests 20
+"""
+import argparse
+import io
+import json
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'deployment'))
+
+READ_REQUESTS = [
+    ('/eligible_flights', 'hours=100000'),
+    ('/eu-compensation-eligible', 'hours=100000'),
+    ('/', 'hours=100000'),
+    ('/flights', ''),
+    ('/stats', ''),
+    ('/compensation-check', 'flight_number=LH2'),
+    ('/compensation-check/batch', ''),
+]
+
+
+def _flight(number, delay, status='LANDED', day='2025-06-01'):
+    return {
+        'flight': number,
+        'airline': {'iata': number[:2], 'name': 'Test'},
+        'departure': {'airport': {'iata': 'FRA', 'name': ''}, 'scheduledTime': f'{day}T10:00:00'},
+        'arrival': {'airport': {'iata': 'LHR', 'name': ''}, 'scheduledTime': f'{day}T12:00:00'},
+        'status': status,
+        'delay': delay,
+        'distance_km': 650,
+        'eligible_for_compensation': False,
+    }
+
+
+def _call(application, path, query):
+    environ = {
+        'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': query,
+        'SERVER_NAME': 'check', 'SERVER_PORT': '80', 'wsgi.url_scheme': 'http',
+        'wsgi.input': io.BytesIO(b''), 'wsgi.errors': sys.stderr,
+    }
+    if path.endswith('/batch'):
+        body = json.dumps([{"flight_number": "LH2"}, {"flight_number": "AF7"}]).encode()
+        environ.update({'REQUEST_METHOD': 'POST', 'CONTENT_TYPE': 'application/json',
+                        'CONTENT_LENGTH': str(len(body)), 'wsgi.input': io.BytesIO(body)})
+    status = []
+    body = application(environ, lambda s, h, exc_info=None: status.append(s))
+    try:
+        for _ in body:
+            pass
+    finally:
+        if hasattr(body, 'close'):
+            body.close()
+    return status[0]
+
+
+def _stored(storage):
+    """The stored records, serialized now (the storage hands out live dicts)."""
+    return {flight['flight']: json.dumps(flight, sort_keys=True) for flight in storage.get_all_flights()}
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Check that read requests leave the stored flights unchanged")
+    parser.add_argument('--requests', type=int, default=3, help="Calls per route")
+    args = parser.parse_args()
+
+    import logging
+    logging.disable(logging.ERROR)
+    # The app keeps its data in ./data; nothing may go upstream
+    os.chdir(tempfile.mkdtemp(prefix='check-read-only-'))
+    os.environ.pop('AVIATION_STACK_API_KEY', None)
+
+    from flight_data_storage import FlightDataStorage
+    writer = FlightDataStorage(data_dir=os.path.abspath('data'))
+    writer.put_flights([_flight('LH1', 10), _flight('LH2', 200), _flight('AF3', 0, 'CANCELLED')])
+    writer.compact()
+    compacted_revision = writer.verify_stats()['revision']
+    writer.put_flights([_flight('AF7', 240), _flight('LH8', 300, day='2025-06-02'), _flight('LH9', 5)])
+
+    import fixed_wsgi_app
+    storage = fixed_wsgi_app._storage
+    before = _stored(storage)
+
+    requests = READ_REQUESTS + [('/eligible_flights/changes', f'since={compacted_revision}')]
+    for path, query in requests:
+        statuses = {_call(fixed_wsgi_app.application, path, query) for _ in range(args.requests)}
+        print(f"  {path + '?' + query:<48} {', '.join(sorted(statuses))}", file=sys.stderr)
+
+    failures = []
+    after = _stored(storage)
+    for number in sorted(set(before) | set(after)):
+        if before.get(number) != after.get(number):
+            failures.append(f"stored {number} changed: {before.get(number)} -> {after.get(number)}")
+    stats = storage.verify_stats()
+    if not stats['consistent']:
+        failures.append(f"statistics disagree with a recompute: {stats['differences']}")
+
+    for failure in failures:
+        print(f"FAIL: {failure}", file=sys.stderr)
+    if not failures:
+        print(f"OK: {len(after)} stored records and the statistics unchanged", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
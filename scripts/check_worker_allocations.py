@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Check that serving requests allocates nothing that lives as long as the worker.
+- Calls the WSGI app (deployment/fixed_wsgi_app.py) in process --requests times
+  (10,000 by default) over /health, /flights and /compensation-check, the last
+  going through the AviationStack client
+- Runs the client in replay mode against an empty fixture directory, so no API key
+  or network is needed, and the app against an empty data directory
+- Asserts that len(sys.path) and id(get_client()) are the same after every
+  --every requests and at the end as after the first one
+- Exits with non-zero code on the first change
+
+Usage:
+  python scripts/check_worker_allocations.py
+  python scripts/check_worker_allocations.py --requests 50000 --every 500
+"""
+import argparse
+import io
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'deployment'))
+
+ROUTES = [
+    ('/health', ''),
+    ('/flights', ''),
+    ('/compensation-check', 'flight_number=LH{}'),
+]
+
+
+def _call(application, path, query):
+    environ = {
+        'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': query,
+        'SERVER_NAME': 'check', 'SERVER_PORT': '80', 'wsgi.url_scheme': 'http',
+        'wsgi.input': io.BytesIO(b''), 'wsgi.errors': sys.stderr,
+    }
+    status = []
+    body = application(environ, lambda s, h, exc_info=None: status.append(s))
+    try:
+        for _ in body:
+            pass
+    finally:
+        if hasattr(body, 'close'):
+            body.close()
+    return status[0]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Check that sys.path and the AviationStack client stay constant")
+    parser.add_argument('--requests', type=int, default=10000)
+    parser.add_argument('--every', type=int, default=100, help="Check after this many requests")
+    args = parser.parse_args()
+
+    import logging
+    logging.disable(logging.ERROR)
+    work_dir = tempfile.mkdtemp(prefix='check-worker-')
+    os.environ.update({
+        'AVIATION_STACK_MODE': 'replay',
+        'AVIATION_STACK_FIXTURE_DIR': os.path.join(work_dir, 'fixtures'),
+        'RESPONSE_CACHE_SECONDS': '0',
+    })
+    os.environ.pop('AVIATION_STACK_API_KEY', None)
+    os.chdir(work_dir)
+
+    import fixed_wsgi_app
+    from aviationstack_client import get_client
+
+    statuses = {}
+    baseline = None
+    for i in range(args.requests):
+        path, query = ROUTES[i % len(ROUTES)]
+        status = _call(fixed_wsgi_app.application, path, query.format(i % 1000))
+        statuses[f'{path} {status}'] = statuses.get(f'{path} {status}', 0) + 1
+        if baseline is None:
+            baseline = len(sys.path), id(get_client())
+        elif (i + 1) % args.every == 0 or i + 1 == args.requests:
+            current = len(sys.path), id(get_client())
+            if current != baseline:
+                print(f"FAIL after {i + 1} requests: len(sys.path) {baseline[0]} -> {current[0]}, "
+                      f"client {'rebuilt' if current[1] != baseline[1] else 'unchanged'}", file=sys.stderr)
+                return 1
+
+    for route, count in sorted(statuses.items()):
+        print(f"  {route:<40} {count}", file=sys.stderr)
+    print(f"OK: {args.requests} requests, len(sys.path) stayed {baseline[0]}, one client", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,76 +1,529 @@
 #!/usr/bin/env python3
 """
-Simple backend health ping for PythonAnywhere scheduled task or manual runs.
+Backend health ping and load generator.
+
+Without load options this is the health ping for PythonAnywhere scheduled tasks or
+manual runs:
 - Pings /health and /eligible_flights?hours=24&include_delayed=true
-- Exits with non‑zero code on failure
+- Exits with non-zero code on failure
+
+With --load (or any of --concurrency/--duration/--requests/--rate) it drives a
+request mix at the backend and reports per-endpoint latency distributions:
+- Closed loop (default): `--concurrency` clients each send their next request as
+  soon as the previous one completes
+- Open loop (--rate R): requests are scheduled at R per second (evenly, or as a
+  Poisson process with --poisson) whatever the response times, and latency is
+  measured from the scheduled time, so a stalled server can't hide its queueing
+  delay (coordinated omission); `--concurrency` caps the requests in flight
+- Latencies go into log-linear histograms (HDR-style, ~1% relative error) per
+  endpoint; failures are classified as timeout, connect, http_4xx, http_5xx or
+  invalid_body (the body doesn't have the expected shape)
+- --slo asserts limits such as `p95<300` or `eligible:error_rate<0.01`;
+  --baseline/--max-regression compare p95 with an earlier --output file
+- Exits with non-zero code if an SLO is missed or a p95 regressed
+
+Works against any server: the deployed app, gunicorn
+(`cd deployment && gunicorn -w 4 -b 127.0.0.1:8000 fixed_wsgi_app:application`),
+or --serve-local, which starts fixed_wsgi_app in a threaded wsgiref server.
+
+Usage:
+  python scripts/ping_backend.py
+  python scripts/ping_backend.py --url http://127.0.0.1:8000 --concurrency 8 --duration 30
+  python scripts/ping_backend.py --serve-local --rate 200 --duration 20 --mix 5:eligible,1:stats,1:health
+  python scripts/ping_backend.py --url http://127.0.0.1:8000 --load --slo p95<250 --slo error_rate<0.001
+  python scripts/ping_backend.py --load --output run.json --baseline previous.json --max-regression 15
 
 Environment variables:
 - FC_BACKEND_URL: Base URL (default: https://piotrs.pythonanywhere.com)
 """
+import argparse
+import http.client
 import json
+import math
 import os
+import queue
+import random
+import re
+import socket
 import sys
-import urllib.request
-import urllib.error
+import threading
+import time
+import urllib.parse
 
 BASE_URL = os.getenv('FC_BACKEND_URL', 'https://piotrs.pythonanywhere.com').rstrip('/')
+HEADERS = {
+    'User-Agent': 'FlightCompensationHealth/1.0',
+    'Accept': 'application/json, text/plain, */*',
+}
 
 
-def fetch(url: str):
-    req = urllib.request.Request(
-        url,
-        headers={
-            'User-Agent': 'FlightCompensationHealth/1.0',
-            'Accept': 'application/json, text/plain, */*',
-        },
-        method='GET',
-    )
-    with urllib.request.urlopen(req, timeout=20) as resp:
-        status = resp.getcode()
-        body = resp.read().decode('utf-8', errors='replace')
-        return status, body
+def _is_health(data):
+    return isinstance(data, dict) and data.get('status') == 'ok'
 
 
-def main() -> int:
-    ok = True
+def _has_flights(data):
+    return isinstance(data, dict) and isinstance(data.get('flights'), list)
 
-    # 1) /health
-    health_url = f"{BASE_URL}/health"
-    try:
-        status, body = fetch(health_url)
-        print(f"[health] {status} {health_url}")
-        if status != 200:
-            print(body[:500])
-            ok = False
-    except Exception as e:
-        print(f"[health] error: {e}")
-        ok = False
 
-    # 2) /eligible_flights
-    elig_url = f"{BASE_URL}/eligible_flights?hours=24&include_delayed=true"
-    try:
-        status, body = fetch(elig_url)
-        print(f"[eligible_flights] {status} {elig_url}")
-        if status != 200:
-            print(body[:500])
-            ok = False
+def _is_stats(data):
+    return isinstance(data, dict) and 'error' not in data
+
+
+# name -> (path, check of the decoded JSON body or None)
+ENDPOINTS = {
+    "health": ("/health", _is_health),
+    "eligible": ("/eligible_flights?hours=24&include_delayed=true", _has_flights),
+    "eligible_72h": ("/eligible_flights?hours=72", _has_flights),
+    "eligible_filtered": ("/eligible_flights?hours=72&airline=LH", _has_flights),
+    "flights": ("/flights", _has_flights),
+    "flights_filtered": ("/flights?dep=WAW", _has_flights),
+    "stats": ("/stats", _is_stats),
+    "compensation_check": ("/compensation-check?flight_number=LO282", None),
+}
+DEFAULT_MIX = "5:eligible,2:eligible_72h,1:eligible_filtered,1:stats,1:health"
+
+PERCENTILES = (("p50", 50.0), ("p90", 90.0), ("p95", 95.0), ("p99", 99.0), ("p999", 99.9))
+
+
+class LatencyHistogram:
+    """
+    Log-linear latency histogram in the style of HdrHistogram.
+
+    Values (microseconds) are counted in buckets whose width is 1/`sub_buckets`
+    of their power of two, so any recorded value is reported within that relative
+    error however large it is, in memory that grows only with the value range.
+    """
+    def __init__(self, sub_buckets=128):
+        self.sub_buckets = sub_buckets
+        self._shift = sub_buckets.bit_length() - 1
+        self.counts = {}
+        self.total = 0
+        self.sum = 0
+        self.min = None
+        self.max = 0
+
+    def _index(self, value):
+        if value < self.sub_buckets:
+            return value
+        exponent = value.bit_length() - 1 - self._shift
+        return (exponent + 1) * self.sub_buckets + ((value >> exponent) - self.sub_buckets)
+
+    def _upper_value(self, index):
+        """Highest value counted in bucket `index`."""
+        if index < self.sub_buckets:
+            return index
+        exponent = index // self.sub_buckets - 1
+        return ((index % self.sub_buckets + self.sub_buckets + 1) << exponent) - 1
+
+    def record(self, seconds):
+        value = max(0, int(seconds * 1_000_000))
+        index = self._index(value)
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.total += 1
+        self.sum += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = max(self.max, value)
+
+    def merge(self, other):
+        for index, count in other.counts.items():
+            self.counts[index] = self.counts.get(index, 0) + count
+        self.total += other.total
+        self.sum += other.sum
+        if other.min is not None:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def percentile(self, percent):
+        """Latency in ms at or below which `percent` of the recorded values fall."""
+        if not self.total:
+            return 0.0
+        rank = max(1, math.ceil(percent / 100.0 * self.total))
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= rank:
+                return min(self._upper_value(index), self.max) / 1000.0
+        return self.max / 1000.0
+
+    def summary(self):
+        result = {"count": self.total}
+        if self.total:
+            result.update({name: round(self.percentile(percent), 3) for name, percent in PERCENTILES})
+            result.update(min=round(self.min / 1000.0, 3), mean=round(self.sum / self.total / 1000.0, 3),
+                          max=round(self.max / 1000.0, 3))
+        return result
+
+
+class EndpointStats:
+    """Latencies, status codes and failures of one endpoint (one per client thread, merged at the end)."""
+    def __init__(self):
+        self.histogram = LatencyHistogram()
+        self.statuses = {}
+        self.errors = {}
+
+    def merge(self, other):
+        self.histogram.merge(other.histogram)
+        for status, count in other.statuses.items():
+            self.statuses[status] = self.statuses.get(status, 0) + count
+        for kind, count in other.errors.items():
+            self.errors[kind] = self.errors.get(kind, 0) + count
+
+    def summary(self):
+        result = self.histogram.summary()
+        failed = sum(self.errors.values())
+        result.update(statuses=self.statuses, errors=self.errors, failed=failed,
+                      error_rate=round(failed / self.histogram.total, 6) if self.histogram.total else 0.0)
+        return result
+
+
+class Client:
+    """One keep-alive HTTP connection, reopened after any failure."""
+    def __init__(self, base_url, timeout):
+        parts = urllib.parse.urlsplit(base_url)
+        self.connection_class = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+        self.netloc = parts.netloc
+        self.prefix = parts.path.rstrip('/')
+        self.timeout = timeout
+        self.connection = None
+
+    def get(self, path):
+        """Status code and body of GET `path`; raises on network errors."""
+        if self.connection is None:
+            self.connection = self.connection_class(self.netloc, timeout=self.timeout)
+        try:
+            self.connection.request('GET', self.prefix + path, headers=HEADERS)
+            response = self.connection.getresponse()
+            body = response.read()
+            if response.will_close:
+                self.close()
+            return response.status, body
+        except BaseException:
+            self.close()
+            raise
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+
+def classify(status, body, check):
+    """Error class of a completed response, or None if it is a success."""
+    if 400 <= status < 500:
+        return 'http_4xx'
+    if status >= 500:
+        return 'http_5xx'
+    if check is not None:
+        try:
+            if not check(json.loads(body)):
+                return 'invalid_body'
+        except ValueError:
+            return 'invalid_body'
+    return None
+
+
+def classify_exception(error):
+    if isinstance(error, (socket.timeout, TimeoutError)):
+        return 'timeout'
+    if isinstance(error, (ConnectionError, socket.gaierror, http.client.RemoteDisconnected)):
+        return 'connect'
+    if isinstance(error, OSError):
+        return 'connect'
+    return 'other'
+
+
+def parse_mix(spec):
+    """[(name, path, check)] repeated by weight, from e.g. "5:eligible,1:/stats?x=1"."""
+    targets = []
+    for item in spec.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        weight, _, target = item.partition(':') if item.split(':', 1)[0].isdigit() else ('1', '', item)
+        if target.startswith('/'):
+            name, path, check = target, target, None
+        elif target in ENDPOINTS:
+            name, (path, check) = target, ENDPOINTS[target]
+        else:
+            raise ValueError(f"unknown endpoint {target!r} (use a path or one of {', '.join(ENDPOINTS)})")
+        targets.append((int(weight), (name, path, check)))
+    if not targets:
+        raise ValueError("empty request mix")
+    return targets
+
+
+SLO_PATTERN = re.compile(r'^(?:(?P<target>[^:]+):)?(?P<metric>p50|p90|p95|p99|p999|max|mean|error_rate)'
+                         r'\s*<\s*(?P<limit>[0-9.]+)$')
+
+
+def parse_slo(spec):
+    match = SLO_PATTERN.match(spec.strip())
+    if not match:
+        raise ValueError(f"invalid SLO {spec!r} (expected e.g. p95<300 or eligible:error_rate<0.01)")
+    return match.group('target') or 'all', match.group('metric'), float(match.group('limit'))
+
+
+class LoadRun:
+    """Drives the request mix from client threads and collects per-thread stats."""
+    def __init__(self, args, mix):
+        self.args = args
+        self.names = [target for _, target in mix]
+        self.weights = [weight for weight, _ in mix]
+        self.stop_at = time.monotonic() + args.duration if args.duration else None
+        self.remaining = args.requests
+        self._lock = threading.Lock()
+        self._stats = []
+        self.dropped = 0
+
+    def _take(self):
+        """Reserve one request of the --requests budget; False once it is used up."""
+        with self._lock:
+            if self.remaining is None:
+                return True
+            if self.remaining <= 0:
+                return False
+            self.remaining -= 1
+            return True
+
+    def _running(self):
+        return self.stop_at is None or time.monotonic() < self.stop_at
+
+    def _send(self, client, stats, target, scheduled):
+        name, path, check = target
+        endpoint = stats.get(name)
+        if endpoint is None:
+            endpoint = stats[name] = EndpointStats()
+        try:
+            status, body = client.get(path)
+            kind = classify(status, body, check)
+            endpoint.statuses[str(status)] = endpoint.statuses.get(str(status), 0) + 1
+        except Exception as e:
+            kind = classify_exception(e)
+        endpoint.histogram.record(time.monotonic() - scheduled)
+        if kind is not None:
+            endpoint.errors[kind] = endpoint.errors.get(kind, 0) + 1
+
+    def _closed_loop_client(self, rnd):
+        client, stats = Client(self.args.url, self.args.timeout), {}
+        while self._running() and self._take():
+            target = rnd.choices(self.names, self.weights)[0]
+            self._send(client, stats, target, time.monotonic())
+            if self.args.think:
+                time.sleep(self.args.think)
+        client.close()
+        with self._lock:
+            self._stats.append(stats)
+
+    def _open_loop_client(self, work):
+        client, stats = Client(self.args.url, self.args.timeout), {}
+        while True:
+            item = work.get()
+            if item is None:
+                break
+            self._send(client, stats, item[1], item[0])
+        client.close()
+        with self._lock:
+            self._stats.append(stats)
+
+    def _schedule(self, work, rnd):
+        interval = 1.0 / self.args.rate
+        next_at = time.monotonic()
+        while self._running() and self._take():
+            now = time.monotonic()
+            if next_at > now:
+                time.sleep(next_at - now)
+            # Don't let an unresponsive server grow the backlog without bound
+            if work.qsize() >= self.args.max_backlog:
+                with self._lock:
+                    self.dropped += 1
+            else:
+                work.put((next_at, rnd.choices(self.names, self.weights)[0]))
+            next_at += rnd.expovariate(self.args.rate) if self.args.poisson else interval
+
+    def run(self):
+        rnd = random.Random(self.args.seed)
+        started = time.monotonic()
+        if self.args.rate:
+            work = queue.Queue()
+            threads = [threading.Thread(target=self._open_loop_client, args=(work,), daemon=True)
+                       for _ in range(self.args.concurrency)]
+            for thread in threads:
+                thread.start()
+            self._schedule(work, rnd)
+            for _ in threads:
+                work.put(None)
         else:
-            try:
-                data = json.loads(body)
-                if not isinstance(data, list):
-                    print("[eligible_flights] response is not a list")
-                    ok = False
-                else:
-                    print(f"[eligible_flights] flights: {len(data)}")
-            except Exception as pe:
-                print(f"[eligible_flights] parse error: {pe}")
-                ok = False
-    except Exception as e:
-        print(f"[eligible_flights] error: {e}")
-        ok = False
+            threads = [threading.Thread(target=self._closed_loop_client,
+                                        args=(random.Random(rnd.random()),), daemon=True)
+                       for _ in range(self.args.concurrency)]
+            for thread in threads:
+                thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.monotonic() - started
+
+        endpoints, overall = {}, EndpointStats()
+        for stats in self._stats:
+            for name, endpoint in stats.items():
+                endpoints.setdefault(name, EndpointStats()).merge(endpoint)
+                overall.merge(endpoint)
+        return {
+            "url": self.args.url,
+            "mode": "open" if self.args.rate else "closed",
+            "rate": self.args.rate,
+            "concurrency": self.args.concurrency,
+            "seconds": round(elapsed, 3),
+            "throughput": round(overall.histogram.total / elapsed, 2) if elapsed else 0.0,
+            "dropped": self.dropped,
+            "all": overall.summary(),
+            "endpoints": {name: endpoint.summary() for name, endpoint in sorted(endpoints.items())},
+        }
+
+
+def print_report(report):
+    print(f"{report['mode']}-loop load against {report['url']}: {report['all']['count']} requests in "
+          f"{report['seconds']:.1f}s ({report['throughput']:.1f} req/s)"
+          + (f", {report['dropped']} not sent (backlog full)" if report['dropped'] else ""))
+    print(f"{'endpoint':<28} {'count':>7} {'p50':>9} {'p90':>9} {'p95':>9} {'p99':>9} {'p99.9':>9} {'max':>9}  errors")
+    rows = list(report['endpoints'].items()) + [("all", report['all'])]
+    for name, summary in rows:
+        if not summary['count']:
+            continue
+        errors = ', '.join(f"{kind}={count}" for kind, count in sorted(summary['errors'].items())) or '-'
+        print(f"{name[:28]:<28} {summary['count']:>7} " + ' '.join(
+            f"{summary[key]:>7.1f}ms" for key in ('p50', 'p90', 'p95', 'p99', 'p999', 'max')) + f"  {errors}")
+
+
+def check_slos(report, slos):
+    """Missed SLOs as messages."""
+    missed = []
+    for target, metric, limit in slos:
+        summary = report['all'] if target == 'all' else report['endpoints'].get(target)
+        if summary is None or not summary['count']:
+            missed.append(f"{target}:{metric}<{limit}: no requests to {target}")
+            continue
+        value = summary[metric]
+        if not value < limit:
+            missed.append(f"{target}:{metric}<{limit}: measured {value}")
+    return missed
+
+
+def check_baseline(report, path, max_regression):
+    """p95 regressions of more than `max_regression` percent against an earlier report."""
+    with open(path) as f:
+        baseline = json.load(f)
+    regressions = []
+    previous = dict(baseline.get('endpoints', {}), all=baseline.get('all', {}))
+    current = dict(report['endpoints'], all=report['all'])
+    for name, summary in current.items():
+        before = previous.get(name, {}).get('p95')
+        if not before or not summary['count']:
+            continue
+        change = (summary['p95'] - before) / before * 100
+        print(f"[baseline] {name}: p95 {before:.1f}ms -> {summary['p95']:.1f}ms ({change:+.1f}%)")
+        if change > max_regression:
+            regressions.append(f"{name}: p95 regressed {change:+.1f}% (limit {max_regression}%)")
+    return regressions
 
+
+def serve_local():
+    """Serve deployment/fixed_wsgi_app from a threaded wsgiref server on a free port; returns its URL."""
+    import socketserver
+    from wsgiref.simple_server import WSGIServer, WSGIRequestHandler, make_server
+
+    class ThreadingWSGIServer(socketserver.ThreadingMixIn, WSGIServer):
+        daemon_threads = True
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'deployment'))
+    from fixed_wsgi_app import application
+
+    server = make_server('127.0.0.1', 0, application, server_class=ThreadingWSGIServer, handler_class=QuietHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}"
+
+
+def ping(base_url, timeout) -> int:
+    """The scheduled-task health check: /health and /eligible_flights must answer correctly."""
+    ok = True
+    client = Client(base_url, timeout)
+    for label, name in (("health", "health"), ("eligible_flights", "eligible")):
+        path, check = ENDPOINTS[name]
+        url = f"{base_url}{path}"
+        try:
+            status, body = client.get(path)
+        except Exception as e:
+            print(f"[{label}] error: {e}")
+            ok = False
+            continue
+        print(f"[{label}] {status} {url}")
+        problem = classify(status, body, check)
+        if problem is not None:
+            print(f"[{label}] {problem}: {body[:500].decode('utf-8', errors='replace')}")
+            ok = False
+        elif name == "eligible":
+            print(f"[{label}] flights: {len(json.loads(body)['flights'])}")
+    client.close()
     return 0 if ok else 1
 
 
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Backend health ping and load generator")
+    parser.add_argument('--url', default=BASE_URL, help="Base URL (default FC_BACKEND_URL)")
+    parser.add_argument('--serve-local', action='store_true', help="Start fixed_wsgi_app locally and target it")
+    parser.add_argument('--timeout', type=float, default=20.0, help="Per-request timeout in seconds")
+    parser.add_argument('--load', action='store_true', help="Run a load test instead of the health ping")
+    parser.add_argument('--concurrency', type=int, help="Clients (closed loop) or max requests in flight (open loop)")
+    parser.add_argument('--duration', type=float, help="Seconds to run (default 10 unless --requests)")
+    parser.add_argument('--requests', type=int, help="Total requests to send")
+    parser.add_argument('--rate', type=float, help="Open loop: requests per second")
+    parser.add_argument('--poisson', action='store_true', help="Open loop: exponential inter-arrival times")
+    parser.add_argument('--max-backlog', type=int, default=10000, help="Open loop: scheduled but unsent limit")
+    parser.add_argument('--think', type=float, default=0.0, help="Closed loop: seconds between a client's requests")
+    parser.add_argument('--mix', default=DEFAULT_MIX,
+                        help=f"weight:endpoint list; endpoints are paths or {', '.join(ENDPOINTS)}")
+    parser.add_argument('--seed', type=int, help="Random seed of the request mix")
+    parser.add_argument('--slo', action='append', default=[], help="[endpoint:]metric<limit, e.g. p95<300 (ms)")
+    parser.add_argument('--output', help="Write the report as JSON")
+    parser.add_argument('--baseline', help="Earlier --output report to compare p95 with")
+    parser.add_argument('--max-regression', type=float, default=10.0, help="Allowed p95 growth over --baseline, %%")
+    args = parser.parse_args()
+
+    if args.serve_local:
+        args.url = serve_local()
+        print(f"Serving fixed_wsgi_app at {args.url}")
+    args.url = args.url.rstrip('/')
+
+    load = args.load or any(value is not None for value in (args.concurrency, args.duration, args.requests, args.rate))
+    if not load:
+        return ping(args.url, args.timeout)
+
+    try:
+        mix = parse_mix(args.mix)
+        slos = [parse_slo(spec) for spec in args.slo]
+    except ValueError as e:
+        parser.error(str(e))
+    if args.concurrency is None:
+        args.concurrency = 16 if args.rate else 4
+    if args.duration is None and args.requests is None:
+        args.duration = 10.0
+
+    report = LoadRun(args, mix).run()
+    print_report(report)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    failures = check_slos(report, slos)
+    if args.baseline:
+        failures += check_baseline(report, args.baseline, args.max_regression)
+    for failure in failures:
+        print(f"[FAIL] {failure}")
+    return 1 if failures else 0
+
+
 if __name__ == "__main__":
     sys.exit(main())
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Multi-process stress test for the flight JSON store.
+- Starts N writer processes calling FlightDataStorage.store_flights and M reader
+  processes loading the dataset (snapshot + write-ahead log replay) as fast as they can
+- Reports reader decode errors, reads that saw the dataset wiped, how many of
+  the written flights survived (lost updates) and write throughput
+- Checks the maintained statistics aggregates against a full recompute
+- Exits with non-zero code if a reader ever saw a torn file or an emptied dataset,
+  if any acknowledged write was lost, or if the statistics disagree
+
+Usage:
+  python scripts/storage_stress.py --writers 4 --readers 4 --writes 50
+  python scripts/storage_stress.py --writer-counts 1,2,4,8 --readers 0 --writes 50   # throughput benchmark
+  python scripts/storage_stress.py --compact-bytes 65536   # force frequent log compaction
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'deployment'))
+
+from flight_data_storage import FlightDataStorage, StorageReadError  # noqa: E402
+
+SEED_FLIGHTS = 500
+
+
+def _flight(writer, seq):
+    return {
+        'flight': {'iata': f"W{writer}{seq:05d}"},
+        'airline': {'iata': 'LO', 'name': 'LOT Polish Airlines'},
+        'departure': {'airport': {'iata': 'WAW'}, 'scheduled': '2025-01-01T10:00:00'},
+        'arrival': {'airport': {'iata': 'FRA'}, 'scheduled': '2025-01-01T12:00:00'},
+        'status': 'DELAYED',
+        'delayMinutes': 200,
+        'eligible_for_compensation': True,
+    }
+
+
+def writer(data_dir, writer_id, writes, compact_bytes, result_queue):
+    import logging
+    logging.disable(logging.CRITICAL)
+    storage = FlightDataStorage(data_dir=data_dir, compact_bytes=compact_bytes)
+    ok = 0
+    started = time.perf_counter()
+    for seq in range(writes):
+        if storage.store_flights([_flight(writer_id, seq)], source="stress"):
+            ok += 1
+    result_queue.put(('writer', writer_id, {'ok': ok, 'seconds': time.perf_counter() - started,
+                                            'compactions': storage.compactions}))
+
+
+def reader(data_dir, reader_id, stop_event, result_queue):
+    import logging
+    logging.disable(logging.CRITICAL)
+    storage = FlightDataStorage(data_dir=data_dir)
+    reads = decode_errors = wiped = 0
+    while not stop_event.is_set():
+        try:
+            data = storage.load(strict=True)
+            reads += 1
+            if len(data.get('flights', [])) < SEED_FLIGHTS:
+                wiped += 1
+        except StorageReadError:
+            decode_errors += 1
+    result_queue.put(('reader', reader_id, {'reads': reads, 'decode_errors': decode_errors, 'wiped': wiped}))
+
+
+def run(writers, readers, writes, data_dir=None, compact_bytes=None):
+    """Run one stress round and return its summary dictionary."""
+    data_dir = data_dir or tempfile.mkdtemp(prefix="flight_storage_stress_")
+    storage = FlightDataStorage(data_dir=data_dir, compact_bytes=compact_bytes)
+    storage.store_flights([_flight('seed', i) for i in range(SEED_FLIGHTS)], source="stress")
+
+    result_queue = multiprocessing.Queue()
+    stop_event = multiprocessing.Event()
+    reader_procs = [multiprocessing.Process(target=reader, args=(data_dir, i, stop_event, result_queue))
+                    for i in range(readers)]
+    writer_procs = [multiprocessing.Process(target=writer, args=(data_dir, i, writes, compact_bytes, result_queue))
+                    for i in range(writers)]
+
+    started = time.perf_counter()
+    for p in reader_procs + writer_procs:
+        p.start()
+    for p in writer_procs:
+        p.join()
+    elapsed = time.perf_counter() - started
+    stop_event.set()
+    for p in reader_procs:
+        p.join()
+
+    results = [result_queue.get() for _ in range(writers + readers)]
+    writes_ok = sum(r[2]['ok'] for r in results if r[0] == 'writer')
+
+    final_storage = FlightDataStorage(data_dir=data_dir)
+    final = final_storage.load(strict=True)
+    stats_check = final_storage.verify_stats()
+    written = {f"W{w}{s:05d}" for w in range(writers) for s in range(writes)}
+    stored = {f['flight'] for f in final.get('flights', [])}
+
+    return {
+        'data_dir': data_dir,
+        'writers': writers,
+        'readers': readers,
+        'seconds': round(elapsed, 3),
+        'writes_reported_ok': writes_ok,
+        'writes_per_second': round(writes_ok / elapsed, 1) if elapsed else None,
+        'flights_written': len(written),
+        'flights_surviving': len(written & stored),
+        'lost_updates': len(written - stored),
+        'final_revision': (final.get('metadata') or {}).get('revision'),
+        'compactions': sum(r[2]['compactions'] for r in results if r[0] == 'writer'),
+        'wal_bytes': os.path.getsize(storage.wal_path) if os.path.exists(storage.wal_path) else 0,
+        'reads': sum(r[2]['reads'] for r in results if r[0] == 'reader'),
+        'reader_decode_errors': sum(r[2]['decode_errors'] for r in results if r[0] == 'reader'),
+        'reads_seeing_wiped_dataset': sum(r[2]['wiped'] for r in results if r[0] == 'reader'),
+        'stats_consistent': stats_check['consistent'],
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Concurrent writer/reader stress test for FlightDataStorage")
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--writer-counts', help="Comma-separated writer counts to benchmark, e.g. 1,2,4,8")
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--writes', type=int, default=50, help="store_flights calls per writer")
+    parser.add_argument('--data-dir', help="Directory to use (default: a fresh temporary directory)")
+    parser.add_argument('--compact-bytes', type=int, help="Write-ahead log size that triggers compaction")
+    args = parser.parse_args()
+
+    import logging
+    logging.disable(logging.CRITICAL)
+
+    counts = [int(c) for c in args.writer_counts.split(',')] if args.writer_counts else [args.writers]
+    ok = True
+    summaries = []
+    for count in counts:
+        summary = run(count, args.readers, args.writes, None if len(counts) > 1 else args.data_dir,
+                      args.compact_bytes)
+        summaries.append(summary)
+        ok = ok and summary['reader_decode_errors'] == 0 and summary['reads_seeing_wiped_dataset'] == 0 \
+            and summary['lost_updates'] == 0 and summary['stats_consistent']
+
+    if len(summaries) == 1:
+        print(json.dumps(summaries[0], indent=2))
+    else:
+        print(f"{'writers':>8} {'writes/s':>10} {'seconds':>8} {'lost':>6}")
+        for summary in summaries:
+            print(f"{summary['writers']:>8} {summary['writes_per_second']:>10} {summary['seconds']:>8} {summary['lost_updates']:>6}")
+
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())